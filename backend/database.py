@@ -1,5 +1,11 @@
 import os
+from typing import Any, Dict, Optional
+from sqlalchemy import event, inspect, literal
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from fastapi import Request, Response
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,12 +16,242 @@ base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 database_path = os.path.join(base_dir, "database.db")
 database_url = os.getenv("DATABASE_URL", f"sqlite:///{database_path}")
 
-connect_args = {"check_same_thread": False} if "sqlite" in database_url else {}
-engine = create_engine(database_url, connect_args=connect_args)
+# SQLite tuning applied to every new connection
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_SECONDS = float(os.getenv("SQLITE_BUSY_TIMEOUT_SECONDS", "15"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE_MB = int(os.getenv("SQLITE_MMAP_SIZE_MB", "256"))
+
+# Connection pool for file SQLite and server databases such as PostgreSQL
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() in ("1", "true", "yes")
+
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    parsed = make_url(url)
+    return parsed.database in (None, "", ":memory:") or parsed.query.get("mode") == "memory"
+
+
+def engine_options(url: str) -> Dict[str, Any]:
+    """create_engine arguments for the database behind url"""
+    pool = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT_SECONDS,
+    }
+    if is_sqlite(url):
+        # timeout is how long sqlite3 waits on a locked database before raising
+        options = {"connect_args": {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_SECONDS}}
+        if not _is_memory_sqlite(url):
+            options.update(pool)
+        return options
+    return {**pool, "pool_recycle": DB_POOL_RECYCLE_SECONDS, "pool_pre_ping": True}
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL lets readers run alongside the writer; NORMAL sync is safe in WAL mode and skips most fsyncs"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_SECONDS * 1000)}")
+    # A negative cache_size is in KiB rather than pages
+    cursor.execute(f"PRAGMA cache_size={-SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE_MB * 1024 * 1024}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def create_configured_engine(url: str) -> Engine:
+    """Engine tuned for the database behind url: pragmas for SQLite, a checked pool for servers"""
+    configured = create_engine(url, echo=DB_ECHO, **engine_options(url))
+    if is_sqlite(url):
+        event.listen(configured, "connect", apply_sqlite_pragmas)
+    return configured
+
+
+engine = create_configured_engine(database_url)
+
+# Optional read replica for the read-heavy GET endpoints
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL") or None
+# After a write the client reads from the primary this long, so it sees its own changes
+REPLICA_READ_YOUR_WRITES_SECONDS = int(os.getenv("REPLICA_READ_YOUR_WRITES_SECONDS", "10"))
+READ_PRIMARY_COOKIE = "read_primary"
+READ_PRIMARY_HEADER = "X-Read-Primary"
+# Session.info flag: the session has written, or was asked to read from the primary
+READ_PRIMARY = "read_primary"
+
+replica_engine: Optional[Engine] = create_configured_engine(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else None
+
+
+class RoutingSession(Session):
+    """Reads from the replica; flushes, and every query after the first flush, go to the primary"""
+
+    def __init__(self, primary: Engine, replica: Engine, **kwargs):
+        super().__init__(**kwargs)
+        self.primary = primary
+        self.replica = replica
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or self.info.get(READ_PRIMARY):
+            return self.primary
+        return self.replica
+
+
+def use_primary(session: Session):
+    """Send the rest of this session's queries to the primary"""
+    session.info[READ_PRIMARY] = True
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    if session.info.get(READ_PRIMARY):
+        return
+    session.info[READ_PRIMARY] = True
+    response = session.info.get("response")
+    if response is not None:
+        # Keeps this client's reads on the primary until the replica has caught up
+        response.set_cookie(READ_PRIMARY_COOKIE, "1", max_age=REPLICA_READ_YOUR_WRITES_SECONDS, httponly=True, samesite="lax")
+
+
+def reads_primary(request: Request) -> bool:
+    """Whether a request asked for, or recently earned, reads from the primary"""
+    header = request.headers.get(READ_PRIMARY_HEADER, "").lower()
+    return header in ("1", "true", "yes") or READ_PRIMARY_COOKIE in request.cookies
+
+# Async drivers for the same databases; aiosqlite or asyncpg must be installed to use them
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def async_database_url(url: str) -> str:
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver configured for {parsed.get_backend_name()} databases")
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+def create_configured_async_engine(url: str) -> AsyncEngine:
+    """create_configured_engine on the async driver: same pool sizing and SQLite pragmas"""
+    configured = create_async_engine(async_database_url(url), echo=DB_ECHO, **engine_options(url))
+    if is_sqlite(url):
+        event.listen(configured.sync_engine, "connect", apply_sqlite_pragmas)
+    return configured
+
+
+_async_engine: Optional[AsyncEngine] = None
+
+
+def get_async_engine() -> AsyncEngine:
+    """The async engine, created on first use so the async driver stays optional"""
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_configured_async_engine(database_url)
+    return _async_engine
+
+
+_async_replica_engine: Optional[AsyncEngine] = None
+
+
+def get_async_replica_engine() -> AsyncEngine:
+    global _async_replica_engine
+    if _async_replica_engine is None:
+        _async_replica_engine = create_configured_async_engine(DATABASE_REPLICA_URL)
+    return _async_replica_engine
+
+
+async def dispose_async_engine():
+    global _async_engine, _async_replica_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+    if _async_replica_engine is not None:
+        await _async_replica_engine.dispose()
+        _async_replica_engine = None
+
+# Indexes replaced by a composite index that leads with the same column
+SUPERSEDED_INDEXES = {
+    "order": ["ix_order_user_id"],
+    "orderitem": ["ix_orderitem_product_id"],
+}
+
+def add_missing_columns():
+    """Add model columns and indexes missing from existing tables (additive schema changes only)"""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    indexes_changed = False
+    with engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column.type.compile(dialect=engine.dialect)}'
+                if column.default is not None and column.default.is_scalar:
+                    default = literal(column.default.arg, column.type)
+                    ddl += f" DEFAULT {default.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True})}"
+                connection.exec_driver_sql(ddl)
+                print(f"✓ Added column {table.name}.{column.name}")
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
+                    indexes_changed = True
+                    print(f"✓ Added index {index.name}")
+            for name in SUPERSEDED_INDEXES.get(table.name, []):
+                if name in existing_indexes:
+                    connection.exec_driver_sql(f'DROP INDEX "{name}"')
+                    indexes_changed = True
+                    print(f"✓ Dropped index {name}")
+        if indexes_changed:
+            # Fresh statistics let the planner choose between the new indexes and a scan
+            connection.exec_driver_sql("ANALYZE")
 
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    add_missing_columns()
 
-def get_session():
+def get_session(response: Response):
     with Session(engine) as session:
+        if replica_engine is not None:
+            # A flush marks the response so the client's next reads use the primary
+            session.info["response"] = response
+        yield session
+
+def get_read_session(request: Request):
+    """Session for read endpoints: the replica when one is configured"""
+    if replica_engine is None or reads_primary(request):
+        with Session(engine) as session:
+            yield session
+        return
+    with RoutingSession(primary=engine, replica=replica_engine) as session:
+        yield session
+
+async def get_async_session():
+    # Loaded attributes stay readable after commit; refreshing them would need an await
+    async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+        yield session
+
+async def get_async_read_session(request: Request):
+    """get_read_session on the async engines"""
+    if replica_engine is None or reads_primary(request):
+        async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+            yield session
+        return
+    async with AsyncSession(
+        get_async_engine(),
+        sync_session_class=RoutingSession,
+        primary=get_async_engine().sync_engine,
+        replica=get_async_replica_engine().sync_engine,
+        expire_on_commit=False,
+    ) as session:
         yield session
@@ -1,4 +1,4 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 import os
@@ -21,8 +21,14 @@ else:
     load_dotenv()
     print("⚠ No .env file found. Using environment variables only.")
 
-from backend.database import create_db_and_tables
-from backend.routers import users, segments, campaigns, flows, metrics, ai_assistant
+from backend.database import create_db_and_tables, dispose_async_engine, engine
+from backend.services.ai_client import ai_client_registry
+from backend.services.prompt_loader import prompt_registry
+from backend.services.ai_log_writer import ai_log_writer
+from backend.services.ai_metrics import CONTENT_TYPE, render_metrics
+from backend.services.user_search import user_search_index
+from backend.services import scheduler, segment_membership, metrics_refresh, daily_metrics, top_products, ai_cache, prompt_loader, replica_sync
+from backend.routers import users, segments, campaigns, flows, metrics, ai_assistant, diagnostics
 
 app = FastAPI(title="E-commerce CDP Assistant API", version="1.0.0")
 
@@ -42,10 +48,39 @@ app.include_router(campaigns.router, prefix="/api/campaigns", tags=["campaigns"]
 app.include_router(flows.router, prefix="/api/flows", tags=["flows"])
 app.include_router(metrics.router, prefix="/api/metrics", tags=["metrics"])
 app.include_router(ai_assistant.router, prefix="/api/ai", tags=["ai-assistant"])
+app.include_router(diagnostics.router, prefix="/api/diagnostics", tags=["diagnostics"])
 
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
+    # Built from the user table the first time, kept current by triggers afterwards
+    user_search_index.create(engine)
+    # Read AI provider settings once; the client is created on first use
+    ai_client_registry.config()
+    # Prompts are served from memory; the watcher reloads edited files
+    prompt_registry.reload()
+    scheduler.schedule("prompt-watch", prompt_loader.PROMPT_WATCH_INTERVAL_SECONDS, prompt_loader.run_watch)
+    ai_log_writer.start()
+    # First run builds memberships for segments that have none yet
+    scheduler.schedule("segment-membership-sweep", segment_membership.SWEEP_INTERVAL_SECONDS, segment_membership.run_sweep)
+    # First run builds the metrics tables, later runs fold in new orders
+    scheduler.schedule("metrics-refresh", metrics_refresh.REFRESH_INTERVAL_SECONDS, metrics_refresh.run_refresh)
+    scheduler.schedule("daily-metrics-refresh", daily_metrics.REFRESH_INTERVAL_SECONDS, daily_metrics.run_refresh)
+    scheduler.schedule("top-products-refresh", top_products.REFRESH_INTERVAL_SECONDS, top_products.run_refresh)
+    if ai_cache.AI_CACHE_PERSIST:
+        scheduler.schedule("ai-cache-prune", ai_cache.AI_CACHE_PRUNE_INTERVAL_SECONDS, ai_cache.run_prune)
+    # A local SQLite replica is refreshed from the primary; real replicas replicate themselves
+    if replica_sync.replica_files():
+        scheduler.schedule("replica-sync", replica_sync.REPLICA_SYNC_INTERVAL_SECONDS, replica_sync.run_sync)
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    scheduler.stop_all()
+    # Flush queued AI generation logs
+    ai_log_writer.stop()
+    # Release the AI provider connection pools, including clients replaced by a reload
+    await ai_client_registry.aclose()
+    await dispose_async_engine()
 
 @app.get("/")
 def read_root():
@@ -54,3 +89,8 @@ def read_root():
 @app.get("/health")
 def health_check():
     return {"status": "healthy"}
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus metrics for AI calls"""
+    return Response(render_metrics(), headers={"Content-Type": CONTENT_TYPE})
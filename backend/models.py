@@ -1,8 +1,8 @@
 from typing import Optional
-from datetime import datetime
+from datetime import date, datetime
 from sqlmodel import SQLModel, Field
 import uuid
-from sqlalchemy import Column, JSON
+from sqlalchemy import Column, Index, JSON
 
 # =====================
 # AUTHENTICATION
@@ -28,12 +28,13 @@ class User(SQLModel, table=True):
     last_name: str
 
     marketing_opt_in: bool = True
-    shipping_state: Optional[str] = None
+    # Indexed fields are the ones segment criteria filter on most
+    shipping_state: Optional[str] = Field(default=None, index=True)
     shipping_country: Optional[str] = None
 
-    total_order_value: float = 0.0
-    order_count: int = 0
-    last_order_date: Optional[datetime] = None
+    total_order_value: float = Field(default=0.0, index=True)
+    order_count: int = Field(default=0, index=True)
+    last_order_date: Optional[datetime] = Field(default=None, index=True)
 
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -48,23 +49,34 @@ class Product(SQLModel, table=True):
 
 
 class Order(SQLModel, table=True):
+    __table_args__ = (
+        # A customer's orders in date order, with the amount, read from the index alone
+        Index("ix_order_user_history", "user_id", "order_date", "total_amount"),
+    )
+
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
-    user_id: str = Field(foreign_key="user.id", index=True)
+    user_id: str = Field(foreign_key="user.id")
 
-    order_date: datetime
+    order_date: datetime = Field(index=True)
     order_status: str
     total_amount: float
     currency: str
     channel: str
     coupon_code: Optional[str] = None
 
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    # Metrics refreshes read orders past a created_at high-water mark
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
 
 
 class OrderItem(SQLModel, table=True):
+    __table_args__ = (
+        # Per-product aggregates join to orders and sum these columns without touching the table
+        Index("ix_orderitem_product_sales", "product_id", "order_id", "quantity", "unit_price"),
+    )
+
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
     order_id: str = Field(foreign_key="order.id", index=True)
-    product_id: str = Field(foreign_key="product.id", index=True)
+    product_id: str = Field(foreign_key="product.id")
 
     quantity: int
     unit_price: float
@@ -79,6 +91,7 @@ class CustomerMetrics(SQLModel, table=True):
 
     lifetime_value: float
     average_order_value: float
+    total_orders: int = 0
     days_since_last_order: Optional[int] = None
 
     updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -104,6 +117,24 @@ class CustomerProductAffinity(SQLModel, table=True):
     last_purchased_at: Optional[datetime] = None
 
 
+class DailyOrderMetrics(SQLModel, table=True):
+    day: date = Field(primary_key=True)
+
+    orders: int = 0
+    revenue: float = 0
+    first_orders: int = 0  # Customers whose first order fell on this day
+    second_orders: int = 0  # Customers who became returning (second order) on this day
+
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class MetricsRefreshState(SQLModel, table=True):
+    name: str = Field(primary_key=True)
+
+    high_water_mark: Optional[datetime] = None  # Latest Order.created_at folded in
+    refreshed_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 # =====================
 # SEGMENTATION & CAMPAIGNS
 # =====================
@@ -117,6 +148,30 @@ class Segment(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
+class SegmentMembership(SQLModel, table=True):
+    segment_id: str = Field(foreign_key="segment.id", primary_key=True)
+    user_id: str = Field(foreign_key="user.id", primary_key=True, index=True)
+
+    entered_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class SegmentMembershipEvent(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    segment_id: str = Field(index=True)
+    user_id: str = Field(index=True)
+
+    event_type: str  # enter | exit
+    occurred_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class SegmentMembershipState(SQLModel, table=True):
+    segment_id: str = Field(foreign_key="segment.id", primary_key=True)
+
+    definition_hash: str  # Definition the memberships were computed for
+    refreshed_at: datetime  # Last full rebuild
+    swept_at: datetime  # Last time-relative sweep
+
+
 class Campaign(SQLModel, table=True):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
     segment_id: str = Field(foreign_key="segment.id")
@@ -203,3 +258,18 @@ class AIGenerationLog(SQLModel, table=True):
     output: dict = Field(sa_column=Column(JSON), default={})
 
     generated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    kind: Optional[str] = None
+    model: Optional[str] = None
+    prompt_hash: Optional[str] = None
+
+    # Set on audit rows of provider calls
+    status: Optional[str] = None  # ok, error
+    latency_ms: Optional[float] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    total_tokens: Optional[int] = None
+
+    # Set on rows that back the AI response cache
+    cache_key: Optional[str] = Field(default=None, index=True)
+    expires_at: Optional[datetime] = None
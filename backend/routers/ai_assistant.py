@@ -2,20 +2,26 @@
 AI Assistant endpoints for segments, flows, and campaigns
 """
 from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select
-from backend.database import get_session
-from backend.services.ai_service import (
-    generate_segment_criteria,
-    generate_flow_content,
-    generate_flow_from_segment,
-    generate_campaign_details as generate_campaign_details_ai,
-    generate_suggestive_response
-)
+from fastapi.responses import StreamingResponse
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from backend.database import get_async_session
+from backend.services.ai_cache import ai_response_cache
+from backend.services.ai_client import ai_client_registry
+from backend.services.ai_log_writer import ai_log_writer
+from backend.services.ai_service import get_rate_limiter
+from backend.services.ai_service_async import AI_BATCH_CONCURRENCY, AI_BATCH_MAX_ITEMS, BATCH_KINDS, async_ai_service
+from backend.services.ai_streaming import iter_sse
+from backend.services.logging import logger
+from backend.services.prompt_loader import prompt_registry
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 
 router = APIRouter()
 
+# Keep proxies from buffering the event stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
 class SegmentBuildRequest(BaseModel):
     prompt: str  # Human language description
 
@@ -37,20 +43,25 @@ class ChatRequest(BaseModel):
     prompt: str
     context: Optional[str] = None
 
+class BatchGenerateRequest(BaseModel):
+    segment_ids: List[str]
+    kind: str = "flow"  # "flow" or "campaign"
+    concurrency: Optional[int] = None
+
 @router.post("/segments/build")
-def build_segment_from_prompt(request: SegmentBuildRequest):
+async def build_segment_from_prompt(request: SegmentBuildRequest):
     """Convert human language to segment criteria"""
     try:
-        result = generate_segment_criteria(request.prompt)
+        result = await async_ai_service.generate_segment_criteria(request.prompt)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating segment: {str(e)}")
 
 @router.post("/flows/generate-content")
-def generate_flow_step_content(request: FlowContentRequest):
+async def generate_flow_step_content(request: FlowContentRequest):
     """Generate flow step content based on segment"""
     try:
-        result = generate_flow_content(
+        result = await async_ai_service.generate_flow_content(
             request.segment_description,
             request.step_type,
             request.step_number
@@ -60,11 +71,11 @@ def generate_flow_step_content(request: FlowContentRequest):
         raise HTTPException(status_code=500, detail=f"Error generating flow content: {str(e)}")
 
 @router.post("/flows/generate-from-segment")
-def generate_flow_from_segment_endpoint(request: FlowGenerateRequest, session: Session = Depends(get_session)):
+async def generate_flow_from_segment_endpoint(request: FlowGenerateRequest, session: AsyncSession = Depends(get_async_session)):
     """Generate complete flow based on segment conditions"""
     from backend.models import Segment
     
-    segment = session.get(Segment, request.segment_id)
+    segment = await session.get(Segment, request.segment_id)
     if not segment:
         raise HTTPException(status_code=404, detail="Segment not found")
     
@@ -72,17 +83,16 @@ def generate_flow_from_segment_endpoint(request: FlowGenerateRequest, session: S
     segment_criteria = segment.definition or {}
     
     try:
-        result = generate_flow_from_segment(segment_description, segment_criteria)
+        result = await async_ai_service.generate_flow_from_segment(segment_description, segment_criteria)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating flow: {str(e)}")
 
-@router.post("/campaigns/generate")
-def generate_campaign_details_endpoint(request: CampaignGenerateRequest, session: Session = Depends(get_session)):
-    """Generate complete campaign setup based on segment and flow"""
+async def load_campaign_inputs(request: CampaignGenerateRequest, session: AsyncSession):
+    """Segment description, criteria and optional flow data for campaign generation"""
     from backend.models import Segment, Flow, FlowStep
     
-    segment = session.get(Segment, request.segment_id)
+    segment = await session.get(Segment, request.segment_id)
     if not segment:
         raise HTTPException(status_code=404, detail="Segment not found")
     
@@ -92,14 +102,14 @@ def generate_campaign_details_endpoint(request: CampaignGenerateRequest, session
     # Get flow data if flow_id is provided
     flow_data = None
     if request.flow_id:
-        flow = session.get(Flow, request.flow_id)
+        flow = await session.get(Flow, request.flow_id)
         if flow:
             # Get flow steps
-            steps = session.exec(
+            steps = (await session.exec(
                 select(FlowStep)
                 .where(FlowStep.flow_id == flow.id)
                 .order_by(FlowStep.step_order)
-            ).all()
+            )).all()
             
             # Safely serialize step configs
             steps_data = []
@@ -128,52 +138,137 @@ def generate_campaign_details_endpoint(request: CampaignGenerateRequest, session
                 "steps": steps_data
             }
     
+    return segment_description, segment_criteria, flow_data
+
+@router.post("/campaigns/generate")
+async def generate_campaign_details_endpoint(request: CampaignGenerateRequest, session: AsyncSession = Depends(get_async_session)):
+    """Generate complete campaign setup based on segment and flow"""
+    segment_description, segment_criteria, flow_data = await load_campaign_inputs(request, session)
+    
     try:
-        result = generate_campaign_details_ai(segment_description, segment_criteria, flow_data)
+        result = await async_ai_service.generate_campaign_details(segment_description, segment_criteria, flow_data)
         return result
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
         error_msg = str(e)
-        print("=" * 50)
-        print("ERROR GENERATING CAMPAIGN:")
-        print(f"Error: {error_msg}")
-        print(f"Segment ID: {request.segment_id}")
-        print(f"Flow ID: {request.flow_id}")
-        print(f"Segment Description: {segment_description[:100] if segment_description else 'N/A'}")
-        print("=" * 50)
-        print(f"Full Traceback:\n{error_details}")
-        print("=" * 50)
+        logger.exception(
+            f"Error generating campaign (segment {request.segment_id}, flow {request.flow_id}): {error_msg}"
+        )
         raise HTTPException(status_code=500, detail=f"Error generating campaign: {error_msg}")
 
+@router.post("/campaigns/generate/stream")
+async def stream_campaign_details_endpoint(request: CampaignGenerateRequest, session: AsyncSession = Depends(get_async_session)):
+    """Generate a campaign setup as server-sent events: delta, field, then a final result"""
+    segment_description, segment_criteria, flow_data = await load_campaign_inputs(request, session)
+    events = async_ai_service.stream_campaign_details(segment_description, segment_criteria, flow_data)
+    return StreamingResponse(iter_sse(events), media_type="text/event-stream", headers=SSE_HEADERS)
+
+async def batch_events(kind: str, items: List[Dict[str, Any]], missing: List[str], concurrency: int):
+    failed = len(missing)
+    for segment_id in missing:
+        yield "item", {
+            "segment_id": segment_id,
+            "status": "error",
+            "error": {"error": "not_found", "message": "Segment not found"},
+            "attempts": 0
+        }
+    async for outcome in async_ai_service.generate_batch(kind, items, concurrency):
+        failed += outcome["status"] == "error"
+        yield "item", outcome
+    total = len(items) + len(missing)
+    yield "done", {"total": total, "succeeded": total - failed, "failed": failed}
+
+@router.post("/batch/generate")
+async def batch_generate(request: BatchGenerateRequest, session: AsyncSession = Depends(get_async_session)):
+    """Generate flows or campaigns for many segments concurrently, streamed as server-sent events"""
+    from backend.models import Segment
+    
+    if request.kind not in BATCH_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of: {', '.join(BATCH_KINDS)}")
+    if not request.segment_ids or len(request.segment_ids) > AI_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"segment_ids must hold between 1 and {AI_BATCH_MAX_ITEMS} ids")
+    
+    segments = {
+        segment.id: segment
+        for segment in (await session.exec(select(Segment).where(Segment.id.in_(request.segment_ids)))).all()
+    }
+    items = []
+    missing = []
+    for segment_id in request.segment_ids:
+        segment = segments.get(segment_id)
+        if segment is None:
+            missing.append(segment_id)
+            continue
+        items.append({
+            "segment_id": segment_id,
+            "segment_description": segment.name or segment.description or "Selected segment",
+            "segment_criteria": segment.definition or {}
+        })
+    
+    concurrency = max(1, min(request.concurrency or AI_BATCH_CONCURRENCY, AI_BATCH_CONCURRENCY))
+    events = batch_events(request.kind, items, missing, concurrency)
+    return StreamingResponse(iter_sse(events), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @router.post("/chat")
-def chat_assistant(request: ChatRequest):
+async def chat_assistant(request: ChatRequest):
     """Suggestive chat assistant - provides segment description and campaign details"""
     try:
-        response = generate_suggestive_response(request.prompt, request.context)
+        response = await async_ai_service.generate_suggestive_response(request.prompt, request.context)
         return response
     except ValueError as e:
         # API key missing or configuration error
         error_msg = str(e)
-        print("=" * 50)
-        print("AI SERVICE CONFIGURATION ERROR:")
-        print(error_msg)
-        print("=" * 50)
+        logger.error(f"AI service configuration error: {error_msg}")
         raise HTTPException(
             status_code=500,
             detail=f"AI service configuration error: {error_msg}"
         )
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
         error_msg = str(e)
-        print("=" * 50)
-        print("ERROR IN AI CHAT:")
-        print(f"Error: {error_msg}")
-        print("=" * 50)
-        print(f"Full Traceback:\n{error_details}")
-        print("=" * 50)
+        logger.exception(f"Error in AI chat: {error_msg}")
         raise HTTPException(
             status_code=500,
             detail=f"Error generating response: {error_msg}"
         )
+
+@router.post("/chat/stream")
+async def stream_chat_assistant(request: ChatRequest):
+    """Suggestive chat assistant as server-sent events: delta, field, then a final result"""
+    events = async_ai_service.stream_suggestive_response(request.prompt, request.context)
+    return StreamingResponse(iter_sse(events), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.post("/admin/reload-client")
+def reload_ai_client():
+    """Re-read AI provider settings and replace the shared client"""
+    config = ai_client_registry.reload()
+    return {
+        "base_url": config.base_url,
+        "model": config.model,
+        "api_key_configured": bool(config.api_key)
+    }
+
+@router.post("/admin/reload-prompts")
+def reload_prompts():
+    """Re-read every prompt file from backend/prompts"""
+    prompt_registry.reload()
+    return prompt_registry.describe()
+
+@router.get("/rate-limit/stats")
+def get_ai_rate_limit_stats():
+    """Budget, adaptive slowdown and retry counters of the AI provider rate limiter"""
+    return get_rate_limiter().stats()
+
+@router.get("/logs/stats")
+def get_ai_log_writer_stats():
+    """Counters of the background AIGenerationLog writer (enqueued, written, dropped, failed)"""
+    return ai_log_writer.stats()
+
+@router.get("/cache/stats")
+def get_ai_cache_stats():
+    """Hit/miss counters and size of the AI response cache"""
+    return ai_response_cache.stats()
+
+@router.delete("/cache")
+def clear_ai_cache():
+    """Drop every cached AI response"""
+    ai_response_cache.clear()
+    return {"message": "AI response cache cleared"}
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from typing import List, Optional
 from backend.models import Campaign, CampaignStep, Segment
-from backend.database import get_session
+from backend.database import get_async_session, get_session
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -27,27 +28,27 @@ class CampaignUpdate(BaseModel):
     start_time_of_day: Optional[str] = None
 
 @router.get("/", response_model=List[Campaign])
-def get_campaigns(session: Session = Depends(get_session)):
-    campaigns = session.exec(select(Campaign)).all()
+async def get_campaigns(session: AsyncSession = Depends(get_async_session)):
+    campaigns = (await session.exec(select(Campaign))).all()
     return campaigns
 
 @router.get("/{campaign_id}", response_model=Campaign)
-def get_campaign(campaign_id: str, session: Session = Depends(get_session)):
-    campaign = session.get(Campaign, campaign_id)
+async def get_campaign(campaign_id: str, session: AsyncSession = Depends(get_async_session)):
+    campaign = await session.get(Campaign, campaign_id)
     if not campaign:
         raise HTTPException(status_code=404, detail="Campaign not found")
     return campaign
 
 @router.get("/{campaign_id}/flow")
-def get_campaign_flow(campaign_id: str, session: Session = Depends(get_session)):
+async def get_campaign_flow(campaign_id: str, session: AsyncSession = Depends(get_async_session)):
     """Get the flow associated with a campaign"""
     from backend.models import Flow
-    campaign = session.get(Campaign, campaign_id)
+    campaign = await session.get(Campaign, campaign_id)
     if not campaign:
         raise HTTPException(status_code=404, detail="Campaign not found")
     if not campaign.flow_id:
         raise HTTPException(status_code=404, detail="No flow associated with this campaign")
-    flow = session.get(Flow, campaign.flow_id)
+    flow = await session.get(Flow, campaign.flow_id)
     if not flow:
         raise HTTPException(status_code=404, detail="Flow not found")
     return flow
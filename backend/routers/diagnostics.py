@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlmodel import Session
+from backend.database import engine, get_session
+from backend.services.query_plans import check_query_plans
+from backend.services.user_search import user_search_index
+
+router = APIRouter()
+
+@router.get("/query-plans")
+def get_query_plans(session: Session = Depends(get_session)):
+    """EXPLAIN the hot segment, dashboard and product queries; "scanning" lists those that read a whole table"""
+    return check_query_plans(session)
+
+@router.get("/search-latency")
+def get_search_latency(session: Session = Depends(get_session)):
+    """Time customer search for the 1-3 character prefixes type-ahead sends first; "slow" lists those over budget"""
+    return user_search_index.check_latency(session)
+
+@router.post("/search-index/rebuild")
+def rebuild_search_index():
+    """Re-read every user into the search indexes, e.g. after a VACUUM renumbered rows"""
+    if not user_search_index.available:
+        raise HTTPException(status_code=409, detail="Search index is not available on this database")
+    user_search_index.rebuild(engine)
+    return {"message": "Search index rebuilt"}
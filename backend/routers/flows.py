@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from typing import List, Optional
 from backend.models import Flow, FlowStep, Segment
-from backend.database import get_session
+from backend.database import get_async_session, get_session
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -26,26 +27,26 @@ class FlowUpdate(BaseModel):
     name: Optional[str] = None
 
 @router.get("/", response_model=List[Flow])
-def get_flows(session: Session = Depends(get_session)):
+async def get_flows(session: AsyncSession = Depends(get_async_session)):
     """Get all flows"""
-    flows = session.exec(select(Flow)).all()
+    flows = (await session.exec(select(Flow))).all()
     return flows
 
 @router.get("/{flow_id}", response_model=Flow)
-def get_flow(flow_id: str, session: Session = Depends(get_session)):
-    flow = session.get(Flow, flow_id)
+async def get_flow(flow_id: str, session: AsyncSession = Depends(get_async_session)):
+    flow = await session.get(Flow, flow_id)
     if not flow:
         raise HTTPException(status_code=404, detail="Flow not found")
     return flow
 
 @router.get("/{flow_id}/steps", response_model=List[FlowStep])
-def get_flow_steps(flow_id: str, session: Session = Depends(get_session)):
+async def get_flow_steps(flow_id: str, session: AsyncSession = Depends(get_async_session)):
     """Get all steps for a flow, ordered by step_order"""
-    steps = session.exec(
+    steps = (await session.exec(
         select(FlowStep)
         .where(FlowStep.flow_id == flow_id)
         .order_by(FlowStep.step_order)
-    ).all()
+    )).all()
     return steps
 
 @router.post("/", response_model=Flow)
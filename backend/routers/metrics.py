@@ -1,44 +1,61 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from sqlmodel import Session, select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
 from backend.models import User, Order, Product, OrderItem, CustomerMetrics, ProductSalesMetrics
-from backend.database import get_session
-from datetime import datetime, timedelta
-from typing import Dict
+from backend.database import get_async_read_session, get_read_session
+from backend.services.metrics_refresh import get_refresh_state
+from backend.services.top_products import top_products_cache
+from backend.services import daily_metrics
+from sqlalchemy import distinct
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
 
 router = APIRouter()
 
+# Longest top-products list one request returns
+MAX_TOP_PRODUCTS = 1000
+# About 100 years; far larger windows overflow the date arithmetic
+MAX_WINDOW_DAYS = 36500
+
 @router.get("/dashboard")
-def get_dashboard_metrics(session: Session = Depends(get_session)):
+async def get_dashboard_metrics(session: AsyncSession = Depends(get_async_read_session)):
     """Get dashboard overview metrics"""
     
     # Total customers
-    total_customers = session.exec(select(func.count(User.id))).one()
-    
-    # Total revenue (30 days)
+    total_customers = (await session.exec(select(func.count(User.id)))).one()
     thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    revenue_30d = session.exec(
-        select(func.sum(Order.total_amount))
-        .where(Order.order_date >= thirty_days_ago)
-    ).one() or 0
-    
-    # Total orders
-    total_orders = session.exec(select(func.count(Order.id))).one()
-    
-    # Average order value
-    avg_order_value = session.exec(
-        select(func.avg(Order.total_amount))
-    ).one() or 0
-    
-    # Customer retention - count users with more than 1 order
-    from sqlalchemy import case
-    user_order_counts = session.exec(
-        select(
-            Order.user_id,
-            func.count(Order.id).label('order_count')
-        ).group_by(Order.user_id).having(func.count(Order.id) > 1)
-    ).all()
     
-    returning_customers = len(user_order_counts)
+    if await session.run_sync(daily_metrics.is_built):
+        # Sums over the daily rollup rows
+        totals = await session.run_sync(daily_metrics.summarize)
+        revenue_30d = await session.run_sync(daily_metrics.revenue_since, thirty_days_ago)
+        total_orders = totals["orders"]
+        avg_order_value = totals["revenue"] / total_orders if total_orders else 0
+        # A customer becomes returning on the day of their second order
+        returning_customers = totals["second_orders"]
+    else:
+        # Total revenue (30 days)
+        revenue_30d = (await session.exec(
+            select(func.sum(Order.total_amount))
+            .where(Order.order_date >= thirty_days_ago)
+        )).one() or 0
+        
+        # Total orders
+        total_orders = (await session.exec(select(func.count(Order.id)))).one()
+        
+        # Average order value
+        avg_order_value = (await session.exec(
+            select(func.avg(Order.total_amount))
+        )).one() or 0
+        
+        # Customer retention - count users with more than 1 order
+        repeat_buyers = (
+            select(Order.user_id)
+            .group_by(Order.user_id)
+            .having(func.count(Order.id) > 1)
+            .subquery()
+        )
+        returning_customers = (await session.exec(select(func.count()).select_from(repeat_buyers))).one()
     
     return {
         "total_customers": total_customers,
@@ -49,18 +66,47 @@ def get_dashboard_metrics(session: Session = Depends(get_session)):
         "new_customers": total_customers - returning_customers
     }
 
+@router.get("/daily")
+async def get_daily_metrics(start: Optional[date] = None, end: Optional[date] = None, session: AsyncSession = Depends(get_async_read_session)):
+    """Get per-day order metrics and totals for a date range (inclusive)"""
+    days = await session.run_sync(daily_metrics.daily_rows, start, end)
+    
+    total_orders = sum(day["orders"] for day in days)
+    total_revenue = sum(day["revenue"] for day in days)
+    
+    return {
+        "start": start,
+        "end": end,
+        "days": days,
+        "totals": {
+            "orders": total_orders,
+            "revenue": total_revenue,
+            "average_order_value": total_revenue / total_orders if total_orders else 0,
+            "new_customers": sum(day["first_orders"] for day in days),
+            "returning_customers": sum(day["second_orders"] for day in days)
+        }
+    }
+
 @router.get("/customers/{user_id}/metrics")
-def get_customer_metrics(user_id: str, session: Session = Depends(get_session)):
+async def get_customer_metrics(user_id: str, session: AsyncSession = Depends(get_async_read_session)):
     """Get metrics for a specific customer"""
-    user = session.get(User, user_id)
+    user = await session.get(User, user_id)
     if not user:
         return {"error": "User not found"}
     
-    # Calculate metrics
-    orders = session.exec(select(Order).where(Order.user_id == user_id)).all()
-    
-    lifetime_value = sum(order.total_amount for order in orders)
-    avg_order_value = lifetime_value / len(orders) if orders else 0
+    if await session.run_sync(get_refresh_state) is not None:
+        # Materialized by the metrics refresh job; no row means no orders
+        metrics = await session.get(CustomerMetrics, user_id)
+        lifetime_value = metrics.lifetime_value if metrics else 0
+        avg_order_value = metrics.average_order_value if metrics else 0
+        total_orders = metrics.total_orders if metrics else 0
+    else:
+        lifetime_value, avg_order_value, total_orders = (await session.exec(
+            select(func.sum(Order.total_amount), func.avg(Order.total_amount), func.count(Order.id))
+            .where(Order.user_id == user_id)
+        )).one()
+        lifetime_value = lifetime_value or 0
+        avg_order_value = avg_order_value or 0
     
     days_since_last_order = None
     if user.last_order_date:
@@ -71,34 +117,36 @@ def get_customer_metrics(user_id: str, session: Session = Depends(get_session)):
         "lifetime_value": lifetime_value,
         "average_order_value": avg_order_value,
         "days_since_last_order": days_since_last_order,
-        "total_orders": len(orders)
+        "total_orders": total_orders
     }
 
 @router.get("/products/{product_id}/metrics")
-def get_product_metrics(product_id: str, session: Session = Depends(get_session)):
+async def get_product_metrics(product_id: str, session: AsyncSession = Depends(get_async_read_session)):
     """Get metrics for a specific product"""
-    product = session.get(Product, product_id)
+    product = await session.get(Product, product_id)
     if not product:
         return {"error": "Product not found"}
     
-    # Get order items for this product
-    order_items = session.exec(
-        select(OrderItem).where(OrderItem.product_id == product_id)
-    ).all()
-    
-    total_units_sold = sum(item.quantity for item in order_items)
-    total_orders = len(set(item.order_id for item in order_items))
-    total_revenue = sum(item.quantity * item.unit_price for item in order_items)
-    
-    last_purchased_at = None
-    if order_items:
-        # Get the most recent order date
-        order_ids = [item.order_id for item in order_items]
-        orders = session.exec(
-            select(Order).where(Order.id.in_(order_ids))
-        ).all()
-        if orders:
-            last_purchased_at = max(order.order_date for order in orders)
+    if await session.run_sync(get_refresh_state) is not None:
+        # Materialized by the metrics refresh job; no row means never sold
+        metrics = await session.get(ProductSalesMetrics, product_id)
+        total_units_sold = metrics.total_units_sold if metrics else 0
+        total_orders = metrics.total_orders if metrics else 0
+        total_revenue = metrics.total_revenue if metrics else 0
+        last_purchased_at = metrics.last_purchased_at if metrics else None
+    else:
+        total_units_sold, total_orders, total_revenue, last_purchased_at = (await session.exec(
+            select(
+                func.sum(OrderItem.quantity),
+                func.count(distinct(OrderItem.order_id)),
+                func.sum(OrderItem.quantity * OrderItem.unit_price),
+                func.max(Order.order_date),
+            )
+            .join(Order, Order.id == OrderItem.order_id)
+            .where(OrderItem.product_id == product_id)
+        )).one()
+        total_units_sold = total_units_sold or 0
+        total_revenue = total_revenue or 0
     
     return {
         "product_id": product_id,
@@ -109,27 +157,10 @@ def get_product_metrics(product_id: str, session: Session = Depends(get_session)
     }
 
 @router.get("/top-products")
-def get_top_products(limit: int = 10, session: Session = Depends(get_session)):
-    """Get top selling products"""
-    # This is a simplified version - in production, use proper aggregation
-    products = session.exec(select(Product)).all()
-    product_metrics = []
-    
-    for product in products:
-        order_items = session.exec(
-            select(OrderItem).where(OrderItem.product_id == product.id)
-        ).all()
-        
-        total_sold = sum(item.quantity for item in order_items)
-        revenue = sum(item.quantity * item.unit_price for item in order_items)
-        
-        product_metrics.append({
-            "product_id": product.id,
-            "product_name": product.name,
-            "units_sold": total_sold,
-            "revenue": revenue
-        })
-    
-    # Sort by units sold
-    product_metrics.sort(key=lambda x: x["units_sold"], reverse=True)
-    return product_metrics[:limit]
+def get_top_products(
+    limit: int = Query(10, ge=1, le=MAX_TOP_PRODUCTS),
+    days: Optional[int] = Query(None, ge=1, le=MAX_WINDOW_DAYS),
+    session: Session = Depends(get_read_session),
+):
+    """Get top selling products, optionally over the last N days"""
+    return top_products_cache.get(session, limit, days)
@@ -1,13 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select
-from typing import List
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import List, Optional
 from datetime import datetime
 from backend.models import Segment, User
-from backend.database import get_session
+from backend.database import get_async_read_session, get_read_session, get_session
+from backend.services.segment_compiler import count_segment_users, query_segment_users, normalize_criteria
+from backend.services.segment_index import segment_index
+from backend.services.audience_export import EXPORT_FORMATS, stream_csv, stream_ndjson
+from backend.services.segment_membership import (
+    count_audience, count_audiences, is_audience_member, query_audience, rebuild_segment, remove_segment, list_events,
+)
 from pydantic import BaseModel
 
 router = APIRouter()
 
+# Largest page the keyset-paginated endpoints return
+MAX_PAGE_SIZE = 10000
+
 class SegmentCreate(BaseModel):
     name: str
     description: str = None
@@ -18,14 +29,28 @@ class SegmentUpdate(BaseModel):
     description: str = None
     definition: dict = None
 
+class SegmentPreview(BaseModel):
+    definition: dict = {}
+    limit: int = 10
+
 @router.get("/", response_model=List[Segment])
-def get_segments(session: Session = Depends(get_session)):
-    segments = session.exec(select(Segment)).all()
+async def get_segments(session: AsyncSession = Depends(get_async_read_session)):
+    segments = (await session.exec(select(Segment))).all()
     return segments
 
+@router.get("/counts")
+def get_segment_counts(ids: Optional[str] = None, session: Session = Depends(get_session)):
+    """Get member counts for many segments (comma-separated ids, default all) from their memberships"""
+    statement = select(Segment)
+    if ids:
+        statement = statement.where(Segment.id.in_([segment_id for segment_id in ids.split(",") if segment_id]))
+    segments = session.exec(statement).all()
+    
+    return {"counts": count_audiences(session, segments)}
+
 @router.get("/{segment_id}", response_model=Segment)
-def get_segment(segment_id: str, session: Session = Depends(get_session)):
-    segment = session.get(Segment, segment_id)
+async def get_segment(segment_id: str, session: AsyncSession = Depends(get_async_read_session)):
+    segment = await session.get(Segment, segment_id)
     if not segment:
         raise HTTPException(status_code=404, detail="Segment not found")
     return segment
@@ -35,9 +60,22 @@ def create_segment(segment: SegmentCreate, session: Session = Depends(get_sessio
     db_segment = Segment(**segment.dict())
     session.add(db_segment)
     session.commit()
+    
+    rebuild_segment(session, db_segment)
+    session.commit()
     session.refresh(db_segment)
     return db_segment
 
+@router.post("/preview")
+def preview_segment(preview: SegmentPreview, session: Session = Depends(get_session)):
+    """Count and sample users for an unsaved segment definition"""
+    segment = Segment(name="Preview", definition=preview.definition)
+    
+    count = count_segment_users(session, segment)
+    users = query_segment_users(session, segment, limit=preview.limit)
+    
+    return {"count": count, "users": users}
+
 @router.put("/{segment_id}", response_model=Segment)
 def update_segment(segment_id: str, segment_update: SegmentUpdate, session: Session = Depends(get_session)):
     segment = session.get(Segment, segment_id)
@@ -51,6 +89,11 @@ def update_segment(segment_id: str, segment_update: SegmentUpdate, session: Sess
     session.add(segment)
     session.commit()
     session.refresh(segment)
+    
+    if "definition" in update_data:
+        rebuild_segment(session, segment)
+        session.commit()
+        session.refresh(segment)
     return segment
 
 @router.delete("/{segment_id}")
@@ -59,6 +102,7 @@ def delete_segment(segment_id: str, session: Session = Depends(get_session)):
     if not segment:
         raise HTTPException(status_code=404, detail="Segment not found")
     
+    remove_segment(session, segment_id)
     session.delete(segment)
     session.commit()
     return {"message": "Segment deleted successfully"}
@@ -66,33 +110,53 @@ def delete_segment(segment_id: str, session: Session = Depends(get_session)):
 @router.get("/{segment_id}/count")
 def get_segment_count(segment_id: str, session: Session = Depends(get_session)):
     """Get count of users matching segment criteria"""
-    from backend.services.campaign_executor import evaluate_segment
+    segment = session.get(Segment, segment_id)
+    if not segment:
+        raise HTTPException(status_code=404, detail="Segment not found")
+    
+    count = count_audience(session, segment)
     
+    return {"segment_id": segment_id, "count": count}
+
+@router.get("/{segment_id}/members/{user_id}")
+def check_segment_membership(segment_id: str, user_id: str, session: Session = Depends(get_session)):
+    """Check whether a user is in a segment"""
     segment = session.get(Segment, segment_id)
     if not segment:
         raise HTTPException(status_code=404, detail="Segment not found")
     
-    users = session.exec(select(User)).all()
-    matching_users = evaluate_segment(segment, users)
+    user = session.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    is_member = is_audience_member(session, segment, user)
     
-    return {"segment_id": segment_id, "count": len(matching_users)}
+    return {"segment_id": segment_id, "user_id": user_id, "is_member": is_member}
 
-@router.get("/{segment_id}/users")
-def get_segment_users(segment_id: str, limit: int = 100, session: Session = Depends(get_session)):
-    """Get users matching segment criteria with relevant columns"""
-    from backend.services.campaign_executor import evaluate_segment
+@router.get("/{segment_id}/overlap/{other_segment_id}")
+def get_segment_overlap(segment_id: str, other_segment_id: str, session: Session = Depends(get_session)):
+    """Overlap, union and exclusion counts between two segments"""
+    segment = session.get(Segment, segment_id)
+    other_segment = session.get(Segment, other_segment_id)
+    if not segment or not other_segment:
+        raise HTTPException(status_code=404, detail="Segment not found")
+    
+    counts = segment_index.compare(session, segment, other_segment)
     
+    return {"segment_id": segment_id, "other_segment_id": other_segment_id, **counts}
+
+@router.get("/{segment_id}/users")
+def get_segment_users(segment_id: str, limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE), after: Optional[str] = None, session: Session = Depends(get_read_session)):
+    """Get a page of users matching segment criteria with relevant columns (keyset cursor on user id)"""
     segment = session.get(Segment, segment_id)
     if not segment:
         raise HTTPException(status_code=404, detail="Segment not found")
     
-    users = session.exec(select(User)).all()
-    matching_users = evaluate_segment(segment, users)
+    total_count = count_audience(session, segment)
+    matching_users = query_audience(session, segment, limit=limit, after=after)
     
     # Get the most relevant columns based on segment criteria
-    criteria_fields = []
-    if segment.definition and segment.definition.get("criteria"):
-        criteria_fields = [c.get("field") for c in segment.definition.get("criteria", [])]
+    criteria_fields = [c.get("field") for c in normalize_criteria(segment.definition)]
     
     # Always include name (combined first_name + last_name), email, and the most relevant field from criteria
     # We'll show: name, email, and one criteria field
@@ -112,7 +176,7 @@ def get_segment_users(segment_id: str, limit: int = 100, session: Session = Depe
     
     # Format user data
     user_data = []
-    for user in matching_users[:limit]:
+    for user in matching_users:
         user_dict: dict = {
             "id": user.id,
             "name": f"{user.first_name} {user.last_name}",
@@ -132,99 +196,53 @@ def get_segment_users(segment_id: str, limit: int = 100, session: Session = Depe
     
     return {
         "segment_id": segment_id,
-        "total_count": len(matching_users),
+        "total_count": total_count,
         "users": user_data,
-        "columns": display_columns
+        "columns": display_columns,
+        "next_cursor": matching_users[-1].id if matching_users and len(matching_users) == limit else None
     }
 
 @router.post("/{segment_id}/evaluate")
-def evaluate_segment(segment_id: str, session: Session = Depends(get_session)):
-    from datetime import datetime, timedelta
-    from backend.models import Order
+def evaluate_segment(segment_id: str, limit: int = Query(1000, ge=1, le=MAX_PAGE_SIZE), after: Optional[str] = None, session: Session = Depends(get_session)):
+    segment = session.get(Segment, segment_id)
+    if not segment:
+        raise HTTPException(status_code=404, detail="Segment not found")
+    
+    matching_users_count = count_audience(session, segment)
+    matching_users = query_audience(session, segment, limit=limit, after=after)
+    next_cursor = matching_users[-1].id if matching_users and len(matching_users) == limit else None
     
+    return {
+        "segment_id": segment_id,
+        "matching_users_count": matching_users_count,
+        "users": matching_users,
+        "next_cursor": next_cursor
+    }
+
+@router.get("/{segment_id}/export")
+def export_segment(segment_id: str, format: str = "ndjson", session: Session = Depends(get_session)):
+    """Stream every member of a segment as NDJSON or CSV"""
+    segment = session.get(Segment, segment_id)
+    if not segment:
+        raise HTTPException(status_code=404, detail="Segment not found")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {format}")
+    
+    rows = stream_csv(segment_id) if format == "csv" else stream_ndjson(segment_id)
+    return StreamingResponse(
+        rows,
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="segment-{segment_id}.{format}"'}
+    )
+
+@router.get("/{segment_id}/events")
+def get_segment_events(segment_id: str, after_id: int = 0, limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE), session: Session = Depends(get_read_session)):
+    """Membership entry/exit events after a cursor, for flows to consume"""
     segment = session.get(Segment, segment_id)
     if not segment:
         raise HTTPException(status_code=404, detail="Segment not found")
     
-    users = session.exec(select(User)).all()
-    matching_users = []
-    
-    # Get logical operator (default to AND)
-    logical_operator = segment.definition.get("logical_operator", "AND")
-    criteria_list = segment.definition.get("criteria", [])
-    
-    # If old format (flat dict), convert to new format
-    if not criteria_list and isinstance(segment.definition, dict):
-        criteria_list = []
-        for field, condition in segment.definition.items():
-            if field not in ["logical_operator", "criteria"]:
-                for op, op_value in condition.items():
-                    criteria_list.append({
-                        "field": field,
-                        "operator": op,
-                        "value": op_value
-                    })
-    
-    for user in users:
-        criteria_results = []
-        
-        for criterion in criteria_list:
-            field = criterion.get("field")
-            operator = criterion.get("operator")
-            value = criterion.get("value")
-            
-            if not hasattr(user, field):
-                criteria_results.append(False)
-                continue
-            
-            user_value = getattr(user, field)
-            
-            # Handle date fields with relative dates
-            if field == "last_order_date" or field == "days_since_last_order":
-                if field == "days_since_last_order":
-                    # Calculate days since last order
-                    if user.last_order_date:
-                        days_diff = (datetime.utcnow() - user.last_order_date).days
-                    else:
-                        days_diff = 999999  # No order = very old
-                    user_value = days_diff
-                else:
-                    # Handle relative date values
-                    if isinstance(value, str) and value.startswith("relative_"):
-                        # value format: "relative_30" means 30 days ago
-                        days_ago = int(value.split("_")[1])
-                        cutoff_date = datetime.utcnow() - timedelta(days=days_ago)
-                        user_value = user.last_order_date or datetime.min
-                        if operator == "lt":  # Less than X days ago = more recent
-                            criteria_results.append(user_value > cutoff_date)
-                        elif operator == "gt":  # More than X days ago = older
-                            criteria_results.append(user_value < cutoff_date)
-                        continue
-                    user_value = user_value or datetime.min
-            
-            # Evaluate criteria
-            if operator == "gt":
-                criteria_results.append(user_value > value)
-            elif operator == "lt":
-                criteria_results.append(user_value < value)
-            elif operator == "eq":
-                criteria_results.append(user_value == value)
-            elif operator == "contains":
-                criteria_results.append(str(value).lower() in str(user_value).lower())
-            elif operator == "gte":
-                criteria_results.append(user_value >= value)
-            elif operator == "lte":
-                criteria_results.append(user_value <= value)
-            else:
-                criteria_results.append(False)
-        
-        # Apply logical operator
-        if logical_operator == "OR":
-            matches = any(criteria_results) if criteria_results else False
-        else:  # AND (default)
-            matches = all(criteria_results) if criteria_results else False
-        
-        if matches:
-            matching_users.append(user)
+    events = list_events(session, segment_id, after_id=after_id, limit=limit)
+    next_cursor = events[-1].id if events else after_id
     
-    return {"segment_id": segment_id, "matching_users_count": len(matching_users), "users": matching_users}
+    return {"segment_id": segment_id, "events": events, "next_cursor": next_cursor}
@@ -1,12 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from typing import List, Optional
 from backend.models import User
-from backend.database import get_session
+from backend.database import get_async_read_session, get_session
+from backend.services.user_search import user_search_index
 from pydantic import BaseModel
 
 router = APIRouter()
 
+# Largest page of users one request returns
+MAX_PAGE_SIZE = 10000
+
 class UserCreate(BaseModel):
     email: str
     phone: Optional[str] = None
@@ -26,26 +31,23 @@ class UserUpdate(BaseModel):
     shipping_country: Optional[str] = None
 
 @router.get("/", response_model=List[User])
-def get_users(
-    skip: int = 0,
-    limit: int = 100,
+async def get_users(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
     search: Optional[str] = None,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_read_session)
 ):
     statement = select(User)
     if search:
-        statement = statement.where(
-            (User.first_name.contains(search)) |
-            (User.last_name.contains(search)) |
-            (User.email.contains(search))
-        )
-    statement = statement.offset(skip).limit(limit)
-    users = session.exec(statement).all()
+        statement = user_search_index.search(statement, search, skip, limit)
+    else:
+        statement = statement.offset(skip).limit(limit)
+    users = (await session.exec(statement)).all()
     return users
 
 @router.get("/{user_id}", response_model=User)
-def get_user(user_id: str, session: Session = Depends(get_session)):
-    user = session.get(User, user_id)
+async def get_user(user_id: str, session: AsyncSession = Depends(get_async_read_session)):
+    user = await session.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
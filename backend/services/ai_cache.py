@@ -0,0 +1,211 @@
+"""
+AI response cache following Single Responsibility Principle
+Remembers successful generations keyed on model, system prompt hash,
+normalized input and temperature: an in-memory LRU with TTL in front of an
+optional persistent tier stored in AIGenerationLog
+"""
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import delete, update
+from sqlmodel import Session, select
+
+from backend.models import AIGenerationLog
+from backend.services.ai_client import ai_client_registry
+from backend.services.logging import logger
+
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "1000"))
+AI_CACHE_TTL_SECONDS = float(os.getenv("AI_CACHE_TTL_SECONDS", "86400"))
+# Persistent tier: survives restarts and is shared by every worker on the database
+AI_CACHE_PERSIST = os.getenv("AI_CACHE_PERSIST", "false").lower() in ("1", "true", "yes")
+AI_CACHE_PERSIST_MAX_ROWS = int(os.getenv("AI_CACHE_PERSIST_MAX_ROWS", "10000"))
+AI_CACHE_PRUNE_INTERVAL_SECONDS = float(os.getenv("AI_CACHE_PRUNE_INTERVAL_SECONDS", "3600"))
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Case and whitespace variations of the same request share a cache entry"""
+    return " ".join((text or "").split()).casefold()
+
+
+def prompt_hash(request) -> str:
+    """Hash of the request's system prompt, precomputed by the prompt registry when available"""
+    if request.prompt_hash:
+        return request.prompt_hash
+    system_prompt = next((m["content"] for m in request.messages if m["role"] == "system"), "")
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+
+
+def _canonical_json(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+
+
+class AIResponseCache:
+    """LRU of generation results with TTL, backed by AIGenerationLog when persist is on"""
+
+    def __init__(self, max_entries: int = AI_CACHE_MAX_ENTRIES, ttl_seconds: float = AI_CACHE_TTL_SECONDS,
+                 persist: bool = AI_CACHE_PERSIST, persist_max_rows: int = AI_CACHE_PERSIST_MAX_ROWS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist = persist
+        self.persist_max_rows = persist_max_rows
+        self._lock = threading.Lock()
+        # key -> (expires_at monotonic, result)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._stats = {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def key(self, request, inputs: Dict[str, Any]) -> str:
+        """Cache key of a request; inputs are the caller's normalized arguments"""
+        return hashlib.sha256(_canonical_json({
+            "kind": request.kind,
+            "model": ai_client_registry.config().model,
+            "prompt_hash": prompt_hash(request),
+            "inputs": inputs,
+            "temperature": request.temperature,
+        }).encode("utf-8")).hexdigest()
+
+    def get_memory(self, key: str) -> Optional[Dict[str, Any]]:
+        """In-memory lookup; counts a miss only when the persistent tier is off"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                self._stats["expirations"] += 1
+                entry = None
+            if entry is None:
+                if not self.persist:
+                    self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["memory_hits"] += 1
+        return copy.deepcopy(entry[1])
+
+    def get_persistent(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look the key up in AIGenerationLog and promote a hit into memory"""
+        if not (self.enabled and self.persist):
+            return None
+        from backend.database import engine
+        now = datetime.utcnow()
+        try:
+            with Session(engine) as session:
+                row = session.exec(
+                    select(AIGenerationLog.output, AIGenerationLog.expires_at)
+                    .where(AIGenerationLog.cache_key == key, AIGenerationLog.expires_at > now)
+                    .order_by(AIGenerationLog.generated_at.desc())
+                    .limit(1)
+                ).first()
+        except Exception as e:
+            # The cache is an optimization; a database problem must not fail the generation
+            logger.warning(f"AI cache lookup failed: {e}")
+            row = None
+        with self._lock:
+            self._stats["persistent_hits" if row else "misses"] += 1
+        if row is None:
+            return None
+        output, expires_at = row
+        self._remember(key, output, (expires_at - now).total_seconds())
+        return copy.deepcopy(output)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        result = self.get_memory(key)
+        if result is None:
+            result = self.get_persistent(key)
+        return result
+
+    def _remember(self, key: str, result: Dict[str, Any], ttl_seconds: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl_seconds, copy.deepcopy(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def put_memory(self, key: str, result: Dict[str, Any]):
+        if self.enabled:
+            self._remember(key, result, self.ttl_seconds)
+
+    def put_persistent(self, key: str, request, result: Dict[str, Any]):
+        if not (self.enabled and self.persist):
+            return
+        from backend.database import engine
+        now = datetime.utcnow()
+        try:
+            with Session(engine) as session:
+                session.add(AIGenerationLog(
+                    prompt=request.messages[-1]["content"],
+                    output=result,
+                    generated_at=now,
+                    kind=request.kind,
+                    model=ai_client_registry.config().model,
+                    prompt_hash=prompt_hash(request),
+                    cache_key=key,
+                    expires_at=now + timedelta(seconds=self.ttl_seconds),
+                ))
+                session.commit()
+        except Exception as e:
+            logger.warning(f"AI cache write failed: {e}")
+
+    def put(self, key: str, request, result: Dict[str, Any]):
+        self.put_memory(key, result)
+        self.put_persistent(key, request, result)
+
+    def clear(self):
+        """Drop every entry; persistent rows stay as plain generation logs"""
+        with self._lock:
+            self._entries.clear()
+        if self.persist:
+            from backend.database import engine
+            with Session(engine) as session:
+                session.exec(update(AIGenerationLog).where(AIGenerationLog.cache_key.is_not(None)).values(cache_key=None))
+                session.commit()
+
+    def prune_persistent(self, session: Session, now: Optional[datetime] = None):
+        """Delete expired cache rows and keep at most persist_max_rows of the rest"""
+        now = now or datetime.utcnow()
+        session.exec(delete(AIGenerationLog).where(AIGenerationLog.cache_key.is_not(None), AIGenerationLog.expires_at <= now))
+        newest = (
+            select(AIGenerationLog.id)
+            .where(AIGenerationLog.cache_key.is_not(None))
+            .order_by(AIGenerationLog.generated_at.desc())
+            .limit(self.persist_max_rows)
+        )
+        session.exec(delete(AIGenerationLog).where(AIGenerationLog.cache_key.is_not(None), AIGenerationLog.id.not_in(newest)))
+        session.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            entries = len(self._entries)
+        hits = stats["memory_hits"] + stats["persistent_hits"]
+        lookups = hits + stats["misses"]
+        return {
+            **stats,
+            "hits": hits,
+            "hit_rate": hits / lookups if lookups else 0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "persistent": self.persist,
+        }
+
+
+ai_response_cache = AIResponseCache()
+
+
+def run_prune():
+    """Scheduled entry point: trim the persistent tier"""
+    from backend.database import engine
+    with Session(engine) as session:
+        ai_response_cache.prune_persistent(session)
@@ -2,11 +2,24 @@
 AI Client abstraction following Single Responsibility Principle
 Handles only OpenAI client initialization and configuration
 """
+import asyncio
 import os
-from typing import Optional
-from openai import OpenAI
+import threading
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
 from dotenv import load_dotenv
 
+# Connection pool shared by every request through the registry's client
+AI_MAX_CONNECTIONS = int(os.getenv("AI_MAX_CONNECTIONS", "20"))
+AI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("AI_MAX_KEEPALIVE_CONNECTIONS", "10"))
+AI_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("AI_KEEPALIVE_EXPIRY_SECONDS", "120"))
+AI_TIMEOUT_SECONDS = float(os.getenv("AI_TIMEOUT_SECONDS", "60"))
+
 
 class AIClientFactory:
     """Factory for creating AI clients (Dependency Inversion)"""
@@ -31,38 +44,33 @@ class AIClientFactory:
     @staticmethod
     def get_api_key() -> Optional[str]:
         """Get API key from environment variables"""
-        AIClientFactory.load_env_file()
-        return (
-            os.getenv("OPENAI_API_KEY") or 
-            os.getenv("AI_API_KEY") or 
-            os.getenv("GEMINI_API_KEY")
-        )
+        return AIClientConfig.from_env().api_key
     
     @staticmethod
     def get_base_url() -> str:
         """Get base URL from environment variables"""
-        AIClientFactory.load_env_file()
-        return (
-            os.getenv("OPENAI_BASE_URL") or 
-            os.getenv("AI_BASE_URL") or 
-            "https://generativelanguage.googleapis.com/v1beta/openai/"
-        )
+        return AIClientConfig.from_env().base_url
     
     @staticmethod
     def get_model() -> str:
         """Get model from environment variables"""
-        AIClientFactory.load_env_file()
-        return (
-            os.getenv("OPENAI_MODEL") or 
-            os.getenv("AI_MODEL") or 
-            "gemini-2.5-flash"
-        )
+        return AIClientConfig.from_env().model
     
     @staticmethod
-    def create_client() -> OpenAI:
+    def create_client(config: Optional["AIClientConfig"] = None, http_client: Optional[httpx.Client] = None) -> OpenAI:
         """Create and return OpenAI client instance"""
-        api_key = AIClientFactory.get_api_key()
-        base_url = AIClientFactory.get_base_url()
+        return AIClientFactory._create(OpenAI, config, http_client)
+    
+    @staticmethod
+    def create_async_client(config: Optional["AIClientConfig"] = None, http_client: Optional[httpx.AsyncClient] = None) -> AsyncOpenAI:
+        """Create and return AsyncOpenAI client instance"""
+        return AIClientFactory._create(AsyncOpenAI, config, http_client)
+    
+    @staticmethod
+    def _create(client_class, config: Optional["AIClientConfig"], http_client):
+        config = config or AIClientConfig.from_env()
+        api_key = config.api_key
+        base_url = config.base_url
         
         if not api_key:
             raise ValueError(
@@ -82,14 +90,216 @@ class AIClientFactory:
             os.environ["OPENAI_BASE_URL"] = base_url
         
         try:
-            client = OpenAI(api_key=api_key, base_url=base_url)
+            # Retries are left to the rate limiter so they respect the shared budget
+            client = client_class(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
         except TypeError as e:
             # Fallback for compatibility issues
             if "proxies" in str(e).lower() or "unexpected keyword" in str(e).lower():
-                client = OpenAI(api_key=api_key)
+                client = client_class(api_key=api_key, http_client=http_client, max_retries=0)
                 if hasattr(client, '_client') and hasattr(client._client, 'base_url'):
                     client._client.base_url = base_url
             else:
                 raise
         
         return client
+
+
+@dataclass(frozen=True)
+class AIClientConfig:
+    """AI provider settings, read from the environment in one pass"""
+    api_key: Optional[str]
+    base_url: str
+    model: str
+
+    @classmethod
+    def from_env(cls) -> "AIClientConfig":
+        AIClientFactory.load_env_file()
+        return cls(
+            api_key=os.getenv("OPENAI_API_KEY") or os.getenv("AI_API_KEY") or os.getenv("GEMINI_API_KEY"),
+            base_url=os.getenv("OPENAI_BASE_URL") or os.getenv("AI_BASE_URL") or "https://generativelanguage.googleapis.com/v1beta/openai/",
+            model=os.getenv("OPENAI_MODEL") or os.getenv("AI_MODEL") or "gemini-2.5-flash",
+        )
+
+
+def _pool_settings() -> dict:
+    return {
+        "limits": httpx.Limits(
+            max_connections=AI_MAX_CONNECTIONS,
+            max_keepalive_connections=AI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=AI_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        "timeout": httpx.Timeout(AI_TIMEOUT_SECONDS, connect=10.0),
+        "follow_redirects": True,
+    }
+
+
+def create_http_client() -> httpx.Client:
+    """HTTP client with a keep-alive pool so requests reuse provider connections"""
+    return httpx.Client(**_pool_settings())
+
+
+def create_async_http_client() -> httpx.AsyncClient:
+    """Async counterpart of create_http_client, for use on one event loop"""
+    return httpx.AsyncClient(**_pool_settings())
+
+
+class AIClientRegistry:
+    """
+    Process-wide AI client: config is read once and the client is reused until
+    reload(). Calls lease the client, so one replaced by reload() is closed once
+    its last in-flight call returns.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._config: Optional[AIClientConfig] = None
+        self._client: Optional[OpenAI] = None
+        # Async connections belong to the loop that opened them, so keep one client per loop
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+        # id(client) -> calls using it
+        self._leases: Dict[int, int] = {}
+        # id(client) -> (client, its loop or None) for clients replaced by reload() but still leased
+        self._retired: Dict[int, Tuple[Any, Optional[asyncio.AbstractEventLoop]]] = {}
+
+    def _current_config(self) -> AIClientConfig:
+        # Caller holds the lock
+        if self._config is None:
+            self._config = AIClientConfig.from_env()
+        return self._config
+
+    def config(self) -> AIClientConfig:
+        """Current provider settings, read on first use"""
+        config = self._config
+        if config is None:
+            with self._lock:
+                config = self._current_config()
+        return config
+
+    def client(self) -> OpenAI:
+        """Shared OpenAI client, created on first use; calls should lease() it instead"""
+        client = self._client
+        if client is None:
+            with self._lock:
+                client = self._current_client()
+        return client
+
+    def _current_client(self) -> OpenAI:
+        # Caller holds the lock
+        if self._client is None:
+            self._client = AIClientFactory.create_client(self._current_config(), create_http_client())
+        return self._client
+
+    def _current_async_client(self, loop: asyncio.AbstractEventLoop) -> AsyncOpenAI:
+        # Caller holds the lock
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = AIClientFactory.create_async_client(self._current_config(), create_async_http_client())
+            self._async_clients[loop] = client
+        return client
+
+    def _acquire(self, client):
+        # Caller holds the lock
+        self._leases[id(client)] = self._leases.get(id(client), 0) + 1
+
+    def _release(self, client) -> bool:
+        """Drop one lease; True when the client was replaced and this was its last call"""
+        with self._lock:
+            key = id(client)
+            remaining = self._leases.get(key, 0) - 1
+            if remaining > 0:
+                self._leases[key] = remaining
+                return False
+            self._leases.pop(key, None)
+            return self._retired.pop(key, None) is not None
+
+    def acquire(self) -> OpenAI:
+        """The shared client, kept open until release() even if reload() replaces it"""
+        with self._lock:
+            client = self._current_client()
+            self._acquire(client)
+        return client
+
+    def release(self, client: OpenAI):
+        if self._release(client):
+            client.close()
+
+    def acquire_async(self) -> AsyncOpenAI:
+        """Async counterpart of acquire() for the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._current_async_client(loop)
+            self._acquire(client)
+        return client
+
+    async def release_async(self, client: AsyncOpenAI):
+        if self._release(client):
+            await client.close()
+
+    @contextmanager
+    def lease(self) -> Iterator[OpenAI]:
+        """acquire() and release() around a block"""
+        client = self.acquire()
+        try:
+            yield client
+        finally:
+            self.release(client)
+
+    @asynccontextmanager
+    async def async_lease(self) -> AsyncIterator[AsyncOpenAI]:
+        """acquire_async() and release_async() around a block"""
+        client = self.acquire_async()
+        try:
+            yield client
+        finally:
+            await self.release_async(client)
+
+    @staticmethod
+    def _close(client, loop: Optional[asyncio.AbstractEventLoop]):
+        """Close a client from any thread; async ones are closed on their own loop"""
+        if loop is None:
+            client.close()
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(client.close(), loop)
+        except RuntimeError:
+            # The loop is closed, and its connections went with it
+            pass
+
+    def reload(self) -> AIClientConfig:
+        """Re-read the environment and replace the client (e.g. after rotating a key)"""
+        with self._lock:
+            self._config = AIClientConfig.from_env()
+            replaced = [(self._client, None)] if self._client is not None else []
+            replaced += [(client, loop) for loop, client in self._async_clients.items()]
+            self._client = None
+            self._async_clients.clear()
+            idle = []
+            for client, loop in replaced:
+                if self._leases.get(id(client)):
+                    # Closed by the release of its last in-flight call
+                    self._retired[id(client)] = (client, loop)
+                else:
+                    idle.append((client, loop))
+            config = self._config
+        for client, loop in idle:
+            self._close(client, loop)
+        return config
+
+    async def aclose(self):
+        """Close every client, current or replaced, at shutdown"""
+        running = asyncio.get_running_loop()
+        with self._lock:
+            clients = [(self._client, None)] if self._client is not None else []
+            clients += [(client, loop) for loop, client in self._async_clients.items()]
+            clients += list(self._retired.values())
+            self._client = None
+            self._async_clients.clear()
+            self._retired.clear()
+        for client, loop in clients:
+            if loop is running:
+                await client.close()
+            else:
+                self._close(client, loop)
+
+
+ai_client_registry = AIClientRegistry()
@@ -17,6 +17,36 @@ class AIErrorHandler:
         base_url = os.getenv("OPENAI_BASE_URL") or os.getenv("AI_BASE_URL") or ""
         return "openai.com" in base_url.lower()
     
+    @staticmethod
+    def is_rate_limit(e: Exception) -> bool:
+        """Whether the error is a rate limit or quota rejection"""
+        error_str = str(e).lower()
+        return isinstance(e, RateLimitError) or "429" in error_str or "rate limit" in error_str or "quota" in error_str
+    
+    @staticmethod
+    def is_quota_exhausted(e: Exception) -> bool:
+        """Whether the account is out of quota or credit, which no amount of waiting fixes"""
+        error_str = str(e).lower()
+        return getattr(e, "code", None) == "insufficient_quota" or "insufficient_quota" in error_str or "billing" in error_str
+    
+    @staticmethod
+    def retry_after(e: Exception) -> int:
+        """Seconds to wait before retrying a rate-limited request"""
+        response = getattr(e, "response", None)
+        header = response.headers.get("retry-after") if response is not None else None
+        if header:
+            try:
+                return max(1, int(float(header)))
+            except ValueError:
+                pass
+        
+        error_str = str(e).lower()
+        if "retry in" in error_str:
+            match = re.search(r'retry in ([\d.]+)s', error_str)
+            if match:
+                return int(float(match.group(1))) + 5
+        return 60  # Default 60 seconds
+    
     @staticmethod
     def handle_error(e: Exception) -> Dict[str, Any]:
         """Handle AI API errors and return user-friendly error information"""
@@ -24,12 +54,8 @@ class AIErrorHandler:
         is_openai = AIErrorHandler._is_openai_endpoint()
         
         # Check for rate limit errors
-        if isinstance(e, RateLimitError) or "429" in error_str or "rate limit" in error_str or "quota" in error_str:
-            retry_delay = 60  # Default 60 seconds
-            if "retry in" in error_str:
-                match = re.search(r'retry in ([\d.]+)s', error_str)
-                if match:
-                    retry_delay = int(float(match.group(1))) + 5
+        if AIErrorHandler.is_rate_limit(e):
+            retry_delay = AIErrorHandler.retry_after(e)
             
             return {
                 "error": "quota_exceeded",
@@ -0,0 +1,114 @@
+"""
+AI generation log writer following Single Responsibility Principle
+Queues one AIGenerationLog record per provider call and inserts them in
+batches from a background thread, so auditing adds no database round trip
+to AI requests
+"""
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from backend.models import AIGenerationLog
+from backend.services.logging import logger
+
+AI_LOG_ENABLED = os.getenv("AI_LOG_ENABLED", "true").lower() in ("1", "true", "yes")
+AI_LOG_QUEUE_SIZE = int(os.getenv("AI_LOG_QUEUE_SIZE", "10000"))
+AI_LOG_BATCH_SIZE = int(os.getenv("AI_LOG_BATCH_SIZE", "200"))
+AI_LOG_FLUSH_SECONDS = float(os.getenv("AI_LOG_FLUSH_SECONDS", "2"))
+
+
+class AIGenerationLogWriter:
+    """Bounded in-process queue drained into batched inserts by a daemon thread"""
+
+    def __init__(self, queue_size: int = AI_LOG_QUEUE_SIZE, batch_size: int = AI_LOG_BATCH_SIZE,
+                 flush_seconds: float = AI_LOG_FLUSH_SECONDS, enabled: bool = AI_LOG_ENABLED):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.enabled = enabled
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"enqueued": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0}
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def record(self, **fields):
+        """Queue one log row; never blocks, drops (and counts) the row when the queue is full"""
+        if not self.enabled:
+            return
+        self.start()
+        fields.setdefault("id", str(uuid.uuid4()))
+        fields.setdefault("generated_at", datetime.utcnow())
+        try:
+            self._queue.put_nowait(fields)
+        except queue.Full:
+            self._count("dropped")
+            return
+        self._count("enqueued")
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="ai-log-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Flush what is queued and stop the thread"""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        # The sentinel waits for room so nothing queued before it is lost
+        self._queue.put(None)
+        thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            row = self._queue.get()
+            if row is None:
+                return
+            # Collect until the batch is full or flush_seconds after its first row
+            batch: List[Dict[str, Any]] = [row]
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                try:
+                    row = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+            self._write(batch)
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        from backend.database import engine
+        try:
+            with engine.begin() as connection:
+                connection.execute(insert(AIGenerationLog), batch)
+        except Exception as e:
+            self._count("failed", len(batch))
+            logger.error(f"Writing {len(batch)} AI generation logs failed: {e}")
+            return
+        with self._lock:
+            self._stats["written"] += len(batch)
+            self._stats["batches"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        return {**stats, "queued": self._queue.qsize(), "enabled": self.enabled}
+
+
+ai_log_writer = AIGenerationLogWriter()
@@ -0,0 +1,110 @@
+"""
+AI metrics following Single Responsibility Principle
+Prometheus instruments for AI calls: latency per generation type and model,
+token usage, JSON repairs and fallback responses, plus the cache, rate
+limiter and log writer counters collected at scrape time
+"""
+import json
+from typing import Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from backend.services.ai_error_handler import AIErrorHandler
+from backend.services.ai_output import StructuredOutputError
+
+# LLM round trips take seconds, not milliseconds
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 3, 5, 8, 13, 21, 34, 60, 120)
+
+AI_REQUEST_DURATION = Histogram(
+    "ai_request_duration_seconds",
+    "Latency of AI provider calls, including rate-limit waits and retries",
+    ["kind", "model", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+AI_TOKENS = Counter(
+    "ai_tokens_total",
+    "Tokens reported in response.usage",
+    ["kind", "model", "type"],
+)
+AI_JSON_REPAIRS = Counter(
+    "ai_json_repairs_total",
+    "Model responses whose JSON needed repair: code fences, surrounding text, trailing commas or truncation",
+    ["reason"],
+)
+AI_FALLBACKS = Counter(
+    "ai_fallback_responses_total",
+    "Generations answered with a fallback payload instead of model output",
+    ["kind", "reason"],
+)
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+
+def observe_call(kind, model: str, status: str, seconds: float, usage=None):
+    kind = kind or "unknown"
+    AI_REQUEST_DURATION.labels(kind, model, status).observe(seconds)
+    for token_type in ("prompt", "completion"):
+        tokens = getattr(usage, f"{token_type}_tokens", None)
+        if tokens:
+            AI_TOKENS.labels(kind, model, token_type).inc(tokens)
+
+
+def record_json_repair(reason: str):
+    AI_JSON_REPAIRS.labels(reason).inc()
+
+
+def _fallback_reason(e: BaseException) -> Optional[str]:
+    if isinstance(e, json.JSONDecodeError):
+        return "invalid_json"
+    if isinstance(e, StructuredOutputError):
+        return "invalid_schema"
+    if AIErrorHandler.is_rate_limit(e):
+        return "rate_limited"
+    return None
+
+
+def record_fallback(kind: str, e: Exception):
+    # Wrappers such as CampaignResponseError are classified by the error they chain
+    cause = e.__cause__ or e
+    reason = _fallback_reason(e) or _fallback_reason(cause) or cause.__class__.__name__
+    AI_FALLBACKS.labels(kind, reason).inc()
+
+
+class AIServiceCollector:
+    """Reads the AI cache, rate limiter and log writer counters on each scrape"""
+
+    def describe(self):
+        # Keeps registration from calling collect() while ai_service is still importing
+        return []
+
+    def collect(self):
+        from backend.services.ai_cache import ai_response_cache
+        from backend.services.ai_log_writer import ai_log_writer
+        from backend.services.ai_service import get_rate_limiter
+
+        cache = ai_response_cache.stats()
+        lookups = CounterMetricFamily("ai_cache_lookups", "AI response cache lookups", labels=["result"])
+        lookups.add_metric(["memory_hit"], cache["memory_hits"])
+        lookups.add_metric(["persistent_hit"], cache["persistent_hits"])
+        lookups.add_metric(["miss"], cache["misses"])
+        yield lookups
+        yield GaugeMetricFamily("ai_cache_entries", "Entries in the in-memory AI response cache", value=cache["entries"])
+
+        limiter = get_rate_limiter().stats()
+        for name in ("requests", "throttled", "rate_limited", "retries"):
+            yield CounterMetricFamily(f"ai_rate_limiter_{name}", f"Rate limiter {name.replace('_', ' ')} count", value=limiter[name])
+        yield GaugeMetricFamily("ai_rate_limiter_scale", "Fraction of the configured rate currently allowed", value=limiter["scale"])
+
+        writer = ai_log_writer.stats()
+        for name in ("written", "dropped", "failed"):
+            yield CounterMetricFamily(f"ai_log_rows_{name}", f"AI generation log rows {name}", value=writer[name])
+        yield GaugeMetricFamily("ai_log_queue_depth", "AI generation log rows waiting to be written", value=writer["queued"])
+
+
+REGISTRY.register(AIServiceCollector())
+
+
+def render_metrics() -> bytes:
+    """Every registered metric in the Prometheus text format"""
+    return generate_latest(REGISTRY)
@@ -0,0 +1,245 @@
+"""
+AI output parsing following Single Responsibility Principle
+Extracts the JSON object from model output, whole or chunk by chunk while it
+streams, tolerating code fences, surrounding prose, trailing commas and
+truncation, and validates it into the response schemas
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, model_validator
+
+# Outside strings only these characters change the structure; inside, only quotes and escapes matter
+_STRUCTURE = re.compile(r'[{}\[\]",]')
+_STRING = re.compile(r'["\\]')
+_CLOSERS = {"{": "}", "[": "]"}
+# A value cut short can still parse (12 of 125); only these endings are known to be whole
+_COMPLETE_VALUE = re.compile(r'(?:["}\]]|\btrue|\bfalse|\bnull)$')
+
+
+class StructuredOutputError(ValueError):
+    """The model returned JSON that does not match the expected schema"""
+
+
+class JSONExtractor:
+    """Feed model output; tracks the first JSON object and returns each top-level field once it is complete"""
+
+    def __init__(self):
+        self._buffer = ""
+        self._position = 0
+        self._start: Optional[int] = None
+        self._end: Optional[int] = None
+        # Closing characters of the open containers, innermost last
+        self._stack: List[str] = []
+        self._in_string = False
+        self._member_start = 0
+        self._last_comma: Optional[int] = None
+        self._trailing_commas: List[int] = []
+        # Places the text can be cut to drop an incomplete member, with the closers needed there
+        self._cuts: List[Tuple[int, str]] = []
+
+    @property
+    def done(self) -> bool:
+        return self._end is not None
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        self._buffer += text
+        fields: List[Tuple[str, Any]] = []
+        buffer = self._buffer
+        while self._end is None:
+            if self._start is None:
+                start = buffer.find("{", self._position)
+                if start == -1:
+                    self._position = len(buffer)
+                    break
+                self._start = start
+                self._stack = ["}"]
+                self._member_start = self._position = start + 1
+                continue
+
+            if self._in_string:
+                match = _STRING.search(buffer, self._position)
+                if match is None:
+                    self._position = len(buffer)
+                    break
+                if match.group() == "\\":
+                    if match.end() >= len(buffer):
+                        # The escaped character has not arrived yet
+                        self._position = match.start()
+                        break
+                    self._position = match.end() + 1
+                else:
+                    self._in_string = False
+                    self._position = match.end()
+                continue
+
+            match = _STRUCTURE.search(buffer, self._position)
+            if match is None:
+                self._position = len(buffer)
+                break
+            char, index = match.group(), match.start()
+            self._position = index + 1
+            if char == '"':
+                self._in_string = True
+            elif char in _CLOSERS:
+                # An empty container is a usable member value, but not an empty array element
+                in_object = self._stack[-1] == "}"
+                self._stack.append(_CLOSERS[char])
+                if in_object:
+                    self._cuts.append((index + 1, "".join(reversed(self._stack))))
+            elif char == ",":
+                self._cuts.append((index, "".join(reversed(self._stack))))
+                if len(self._stack) == 1:
+                    self._emit(fields, index)
+                    self._member_start = index + 1
+            else:
+                if self._last_comma is not None and not buffer[self._last_comma + 1:index].strip():
+                    self._trailing_commas.append(self._last_comma)
+                self._stack.pop()
+                if not self._stack:
+                    self._emit(fields, index)
+                    self._end = index + 1
+            self._last_comma = index if char == "," else None
+        return fields
+
+    def _emit(self, fields: List[Tuple[str, Any]], end: int):
+        member = self._buffer[self._member_start:end].strip()
+        if not member:
+            return
+        try:
+            fields.extend(json.loads("{" + member + "}").items())
+        except ValueError:
+            # Malformed member; result() reports or repairs it
+            pass
+
+    def _incomplete_tail(self) -> bool:
+        """Whether truncated output ends inside a member value that may have been cut short"""
+        if self._in_string:
+            return True
+        # A comma cut starts at the comma itself
+        tail = self._buffer[self._cuts[-1][0] if self._cuts else self._member_start:].lstrip(",").strip()
+        return bool(tail) and _COMPLETE_VALUE.search(tail) is None
+
+    def _text(self, end: int) -> str:
+        text, start = self._buffer, self._start
+        for comma in reversed(self._trailing_commas):
+            if comma < end:
+                text = text[:comma] + " " + text[comma + 1:]
+        return text[start:end]
+
+    @property
+    def repairs(self) -> List[str]:
+        """What had to be fixed to get at the JSON"""
+        if self._start is None:
+            return []
+        repairs = []
+        outside = self._buffer[:self._start] + (self._buffer[self._end:] if self._end is not None else "")
+        if "```" in outside:
+            repairs.append("code_fence")
+        elif outside.strip():
+            repairs.append("surrounding_text")
+        if self._trailing_commas:
+            repairs.append("trailing_comma")
+        if self._end is None:
+            repairs.append("truncated")
+            if self._incomplete_tail():
+                repairs.append("incomplete_member")
+        return repairs
+
+    def result(self) -> Dict[str, Any]:
+        """The parsed object; truncated output is closed after its last complete member"""
+        if self._start is None:
+            raise ValueError("Could not extract JSON from AI response")
+        if self._end is not None:
+            return json.loads(self._text(self._end))
+
+        # An unterminated string or number is dropped rather than kept cut short
+        candidates = []
+        if not self._incomplete_tail():
+            candidates.append(self._text(len(self._buffer)) + "".join(reversed(self._stack)))
+        candidates += [self._text(end) + closers for end, closers in reversed(self._cuts)]
+        error = None
+        for candidate in candidates:
+            try:
+                return json.loads(candidate)
+            except json.JSONDecodeError as e:
+                error = error or e
+        raise error or json.JSONDecodeError("No complete member in truncated JSON", self._buffer, len(self._buffer))
+
+
+def extract_json(text: str) -> JSONExtractor:
+    extractor = JSONExtractor()
+    extractor.feed(text)
+    return extractor
+
+
+def validate_output(data: Dict[str, Any], schema: Type[BaseModel]) -> Dict[str, Any]:
+    """Validate parsed output into schema; fields the schema does not declare are kept"""
+    try:
+        return schema.model_validate(data).model_dump()
+    except ValidationError as e:
+        error = e.errors()[0]
+        location = ".".join(str(part) for part in error["loc"])
+        raise StructuredOutputError(f"Invalid {schema.__name__} from AI: {location}: {error['msg']}") from e
+
+
+# Response schemas; defaults are what the service filled in for missing fields
+
+class AIOutput(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+
+class SegmentCriterionOutput(AIOutput):
+    field: str
+    operator: str
+    value: Any = None
+
+
+class SegmentCriteriaOutput(AIOutput):
+    logical_operator: str = "AND"
+    criteria: List[SegmentCriterionOutput] = []
+
+
+class FlowContentOutput(AIOutput):
+    subject: str = "Special Offer for You!"
+    body_text: str = "We have a special offer that we think you'll love!"
+
+
+class FlowStepOutput(AIOutput):
+    step_type: str
+    step_order: Optional[int] = None
+    config: Dict[str, Any] = {}
+
+
+class FlowOutput(AIOutput):
+    entry_condition_type: str = "order_completed"
+    name: Optional[str] = None
+    steps: List[FlowStepOutput] = []
+
+    @model_validator(mode="after")
+    def number_steps(self) -> "FlowOutput":
+        for position, step in enumerate(self.steps, start=1):
+            if step.step_order is None:
+                step.step_order = position
+        return self
+
+
+class CampaignOutput(AIOutput):
+    name: Optional[str] = None
+    description: Optional[str] = None
+    start_time_of_day: Optional[Any] = None
+    time_recommendation_reason: Optional[str] = None
+    marketing_strategy: Optional[str] = None
+    recommendations: Optional[List[str]] = None
+
+
+class SuggestiveOutput(AIOutput):
+    segment_description: str = "Segment description based on your request"
+    campaign: Dict[str, Any] = Field(default_factory=lambda: {
+        "subject": "Special Offer for You!",
+        "send_time": "Morning",
+        "send_date": "Within 3 days",
+        "content_ideas": ["We have a special offer for you!"]
+    })
+    explanation: str = "Generated based on your request"
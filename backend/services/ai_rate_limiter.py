@@ -0,0 +1,221 @@
+"""
+AI rate limiter following Single Responsibility Principle
+Token buckets for requests and tokens per minute in front of every chat
+completion call, with an adaptive slowdown and cooldown after 429s and
+jittered retries of transient provider errors
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+from backend.services.ai_error_handler import AIErrorHandler
+from backend.services.logging import logger
+
+# Provider quota; 0 disables a bucket
+AI_RATE_LIMIT_RPM = float(os.getenv("AI_RATE_LIMIT_RPM", "60"))
+AI_RATE_LIMIT_TPM = float(os.getenv("AI_RATE_LIMIT_TPM", "0"))
+# Completion size assumed when reserving tokens; corrected from usage afterwards
+AI_ESTIMATED_COMPLETION_TOKENS = int(os.getenv("AI_ESTIMATED_COMPLETION_TOKENS", "800"))
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "3"))
+AI_RETRY_BASE_SECONDS = float(os.getenv("AI_RETRY_BASE_SECONDS", "1"))
+AI_RETRY_MAX_SECONDS = float(os.getenv("AI_RETRY_MAX_SECONDS", "30"))
+# Longest a single request waits on throttling, cooldowns and backoff before giving up
+AI_MAX_WAIT_SECONDS = float(os.getenv("AI_MAX_WAIT_SECONDS", "60"))
+
+# Each 429 cuts the refill rate by this factor (down to MIN_SCALE); each success wins some back
+BACKOFF_FACTOR = 0.7
+RECOVERY_STEP = 0.05
+MIN_SCALE = 0.1
+
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+
+def estimate_tokens(request) -> int:
+    """Rough token count of a request: about four characters per token, plus the expected completion"""
+    return sum(len(message["content"]) for message in request.messages) // 4 + AI_ESTIMATED_COMPLETION_TOKENS
+
+
+class RateLimitWaitExceeded(RuntimeError):
+    """Raised instead of waiting past AI_MAX_WAIT_SECONDS for the rate limiter"""
+
+    def __init__(self, delay: float):
+        super().__init__(f"AI rate limit wait of {delay:.1f}s exceeds AI_MAX_WAIT_SECONDS ({AI_MAX_WAIT_SECONDS:g}s)")
+        self.delay = delay
+
+
+def usage_tokens(response) -> Optional[int]:
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None)
+
+
+class TokenBucket:
+    """Holds up to per_minute units and refills continuously; reservations may drive it negative"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float, now: float, scale: float) -> float:
+        """Debit amount and return the seconds until the debt is paid off at the current rate"""
+        if self.capacity <= 0:
+            return 0.0
+        rate = self.capacity * scale / 60
+        self.level = min(self.capacity, self.level + (now - self.updated) * rate)
+        self.updated = now
+        self.level -= min(amount, self.capacity)
+        return 0.0 if self.level >= 0 else -self.level / rate
+
+    def adjust(self, amount: float):
+        if self.capacity > 0:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class AIRateLimiter:
+    """Request and token budgets for one provider, slowed down adaptively on rate limits"""
+
+    def __init__(self, requests_per_minute: float = AI_RATE_LIMIT_RPM, tokens_per_minute: float = AI_RATE_LIMIT_TPM):
+        self._lock = threading.Lock()
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.scale = 1.0
+        self._cooldown_until = 0.0
+        self._stats = {"requests": 0, "throttled": 0, "rate_limited": 0, "retries": 0}
+
+    def reserve(self, tokens: int) -> float:
+        """Claim budget for one request; returns how long the caller must wait before sending it"""
+        with self._lock:
+            now = time.monotonic()
+            delay = max(
+                self.requests.reserve(1, now, self.scale),
+                self.tokens.reserve(tokens, now, self.scale),
+                self._cooldown_until - now,
+                0.0,
+            )
+            self._stats["requests"] += 1
+            if delay > 0:
+                self._stats["throttled"] += 1
+        return delay
+
+    def cancel(self, tokens: int):
+        """Give back a reservation that will not be used"""
+        with self._lock:
+            self.requests.adjust(1)
+            self.tokens.adjust(tokens)
+
+    def record_success(self, estimated_tokens: int, actual_tokens: Optional[int] = None):
+        with self._lock:
+            self.scale = min(1.0, self.scale + RECOVERY_STEP)
+            if actual_tokens is not None:
+                self.tokens.adjust(estimated_tokens - actual_tokens)
+
+    def record_failure(self, e: Exception, attempt: int) -> float:
+        """Account for a retryable error; returns a jittered delay before the next attempt"""
+        with self._lock:
+            self._stats["retries"] += 1
+            if isinstance(e, RateLimitError) or AIErrorHandler.is_rate_limit(e):
+                self._stats["rate_limited"] += 1
+                self.scale = max(MIN_SCALE, self.scale * BACKOFF_FACTOR)
+                # Nobody sends to this provider until retry_after has passed, within the backoff cap
+                cooldown = min(AIErrorHandler.retry_after(e), AI_RETRY_MAX_SECONDS)
+                self._cooldown_until = max(self._cooldown_until, time.monotonic() + cooldown)
+        # Full jitter spreads out the callers that failed together
+        return random.uniform(0, min(AI_RETRY_MAX_SECONDS, AI_RETRY_BASE_SECONDS * 2 ** attempt))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "requests_per_minute": self.requests.capacity,
+                "tokens_per_minute": self.tokens.capacity,
+                "scale": round(self.scale, 3),
+                "cooldown_remaining": max(0.0, self._cooldown_until - time.monotonic()),
+            }
+
+
+_limiters: Dict[str, AIRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(provider: str) -> AIRateLimiter:
+    """The shared limiter of a provider (its base URL)"""
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            limiter = _limiters[provider] = AIRateLimiter()
+        return limiter
+
+
+def _should_retry(e: Exception, attempt: int) -> bool:
+    if attempt >= AI_MAX_RETRIES or AIErrorHandler.is_quota_exhausted(e):
+        return False
+    return isinstance(e, RETRYABLE_ERRORS) or AIErrorHandler.is_rate_limit(e)
+
+
+def call_with_limits(limiter: AIRateLimiter, request, call: Callable[[], Any]) -> Any:
+    """Run a provider call within the limiter's budget, retrying transient failures"""
+    estimated = estimate_tokens(request)
+    attempt = 0
+    waited = 0.0
+    error: Optional[Exception] = None
+    while True:
+        delay = limiter.reserve(estimated)
+        if waited + delay > AI_MAX_WAIT_SECONDS:
+            limiter.cancel(estimated)
+            raise error or RateLimitWaitExceeded(delay)
+        if delay > 0:
+            time.sleep(delay)
+            waited += delay
+        try:
+            response = call()
+        except Exception as e:
+            if not _should_retry(e, attempt):
+                raise
+            backoff = limiter.record_failure(e, attempt)
+            if waited + backoff > AI_MAX_WAIT_SECONDS:
+                raise
+            attempt += 1
+            logger.warning(f"AI call failed ({e.__class__.__name__}), retry {attempt}/{AI_MAX_RETRIES}")
+            time.sleep(backoff)
+            waited += backoff
+            error = e
+            continue
+        limiter.record_success(estimated, usage_tokens(response))
+        return response
+
+
+async def async_call_with_limits(limiter: AIRateLimiter, request, call: Callable[[], Awaitable[Any]]) -> Any:
+    """call_with_limits for coroutines; waits without blocking the event loop"""
+    estimated = estimate_tokens(request)
+    attempt = 0
+    waited = 0.0
+    error: Optional[Exception] = None
+    while True:
+        delay = limiter.reserve(estimated)
+        if waited + delay > AI_MAX_WAIT_SECONDS:
+            limiter.cancel(estimated)
+            raise error or RateLimitWaitExceeded(delay)
+        if delay > 0:
+            await asyncio.sleep(delay)
+            waited += delay
+        try:
+            response = await call()
+        except Exception as e:
+            if not _should_retry(e, attempt):
+                raise
+            backoff = limiter.record_failure(e, attempt)
+            if waited + backoff > AI_MAX_WAIT_SECONDS:
+                raise
+            attempt += 1
+            logger.warning(f"AI call failed ({e.__class__.__name__}), retry {attempt}/{AI_MAX_RETRIES}")
+            await asyncio.sleep(backoff)
+            waited += backoff
+            error = e
+            continue
+        limiter.record_success(estimated, usage_tokens(response))
+        return response
@@ -5,57 +5,30 @@ AI Service Implementation following SOLID principles
 - Open/Closed: Extensible through interfaces
 """
 import json
-from typing import Dict, Any, Optional
-from backend.services.ai_client import AIClientFactory
-from backend.services.prompt_loader import PromptLoader
+import time
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional
+from backend.services.ai_cache import ai_response_cache, normalize_text
+from backend.services.ai_client import ai_client_registry
+from backend.services import ai_metrics
+from backend.services.ai_log_writer import ai_log_writer
+from backend.services.ai_output import (
+    CampaignOutput, FlowContentOutput, FlowOutput, SegmentCriteriaOutput, StructuredOutputError, SuggestiveOutput,
+    extract_json, validate_output,
+)
+from backend.services.ai_rate_limiter import AIRateLimiter, call_with_limits, limiter_for
+from backend.services.prompt_loader import prompt_registry
 from backend.services.ai_error_handler import AIErrorHandler
+from backend.services.logging import logger
 
 
-def get_ai_client():
-    """Get AI client using factory (Dependency Inversion)"""
-    return AIClientFactory.create_client()
-
-
-def get_model() -> str:
-    """Get model name"""
-    return AIClientFactory.get_model()
-
-
-def extract_json_from_text(text: str) -> str:
-    """Extract JSON from text that might contain markdown or extra text"""
-    text = text.strip()
-    
-    # Remove markdown code blocks if present
-    if "```" in text:
-        parts = text.split("```")
-        for part in parts:
-            if "{" in part and "}" in part:
-                text = part
-                if text.startswith("json"):
-                    text = text[4:]
-                break
-    
-    # Find JSON object boundaries
-    start_idx = text.find("{")
-    end_idx = text.rfind("}")
-    if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-        text = text[start_idx:end_idx+1]
-    
-    return text.strip()
+# Prompt files in backend/prompts, with the text used while a file is missing
+SEGMENT_CRITERIA_PROMPT = 'segment_criteria_prompt.txt'
+FLOW_GENERATION_PROMPT = 'flow_generation_prompt.txt'
+CAMPAIGN_GENERATION_PROMPT = 'campaign_generation_prompt.txt'
+SUGGESTIVE_RESPONSE_PROMPT = 'suggestive_response_prompt.txt'
 
-
-def handle_ai_error(e: Exception) -> Dict[str, Any]:
-    """Handle AI API errors using error handler (Single Responsibility)"""
-    return AIErrorHandler.handle_error(e)
-
-
-def generate_segment_criteria(prompt: str) -> Dict[str, Any]:
-    """Convert human language to segment criteria using prompt file (Single Responsibility)"""
-    try:
-        client = get_ai_client()
-        
-        # Load prompt using PromptLoader (Dependency Inversion)
-        fallback_prompt = """You are an AI assistant for an e-commerce Customer Data Platform. 
+SEGMENT_CRITERIA_FALLBACK_PROMPT = """You are an AI assistant for an e-commerce Customer Data Platform. 
 Convert the user's natural language request into segment criteria.
 
 Available fields:
@@ -88,44 +61,194 @@ Return ONLY valid JSON in this format:
   ],
   "explanation": "Brief explanation of the segment"
 }"""
-        
-        system_prompt = PromptLoader.load_prompt('segment_criteria_prompt.txt', fallback_prompt)
-
-        response = client.chat.completions.create(
-            model=get_model(),
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"User request: {prompt}\n\nReturn only the JSON, no other text."}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.7
-        )
-        
-        # Extract JSON from response
-        text = response.choices[0].message.content.strip()
-        json_text = extract_json_from_text(text)
-        
-        result = json.loads(json_text)
-        return result
+
+FLOW_GENERATION_FALLBACK_PROMPT = """Generate a marketing flow based on a customer segment.
+Return JSON with entry_condition_type, name, entry_condition, and steps array.
+Each step should have step_type, step_order, and config."""
+
+CAMPAIGN_GENERATION_FALLBACK_PROMPT = """You are an AI assistant for an e-commerce Customer Data Platform. 
+Generate a complete marketing campaign setup based on a customer segment and optional flow.
+
+Return ONLY valid JSON in this format:
+{
+  "name": "Campaign name that reflects the segment and purpose",
+  "description": "Detailed description of the campaign strategy and goals",
+  "start_time_of_day": "HH:MM (recommended send time, e.g., '10:00', '14:30')",
+  "time_recommendation_reason": "Brief explanation of why this time is optimal",
+  "marketing_strategy": "Brief explanation of the marketing approach",
+  "recommendations": [
+    "Recommendation 1 for campaign execution",
+    "Recommendation 2 for campaign execution"
+  ]
+}
+
+Campaign Generation Guidelines:
+1. Campaign name should be descriptive and reflect the target segment and goal
+2. Description should explain the campaign strategy, target audience, and expected outcomes
+3. Start time should be during optimal email open hours (typically 9 AM - 2 PM)
+4. Consider the segment characteristics when recommending timing
+5. If a flow is provided, align campaign timing with flow entry conditions"""
+
+SUGGESTIVE_RESPONSE_FALLBACK_PROMPT = """You are a helpful AI assistant for an e-commerce Customer Data Platform. 
+When users ask about creating segments and campaigns, provide a structured response.
+
+Return ONLY valid JSON in this format:
+{
+  "segment_description": "A natural language description that can be used in the segment creation form (e.g., 'High-value customers with total order value above $1000 who are subscribed to email marketing and haven't ordered in the last 60 days')",
+  "campaign": {
+    "subject": "Email subject line for the campaign",
+    "send_time": "Recommended send time (e.g., 'Tuesday 10 AM', 'Morning', 'Afternoon')",
+    "send_date": "Recommended send date strategy (e.g., 'Within 3 days of segment creation', 'Next week', 'Immediate')",
+    "content_ideas": [
+      "Plain-text idea 1 for email content",
+      "Plain-text idea 2 for email content",
+      "Plain-text idea 3 for email content"
+    ]
+  },
+  "explanation": "Brief explanation of the segment and campaign strategy"
+}
+
+The segment_description should be in natural language that can be directly pasted into the segment creation description field.
+The campaign details should be marketing-focused and relevant to the segment."""
+
+prompt_registry.register(SEGMENT_CRITERIA_PROMPT, SEGMENT_CRITERIA_FALLBACK_PROMPT)
+prompt_registry.register(FLOW_GENERATION_PROMPT, FLOW_GENERATION_FALLBACK_PROMPT)
+prompt_registry.register(CAMPAIGN_GENERATION_PROMPT, CAMPAIGN_GENERATION_FALLBACK_PROMPT)
+prompt_registry.register(SUGGESTIVE_RESPONSE_PROMPT, SUGGESTIVE_RESPONSE_FALLBACK_PROMPT)
+
+
+def get_ai_client():
+    """Get the shared AI client from the registry (Dependency Inversion)"""
+    return ai_client_registry.client()
+
+
+def get_model() -> str:
+    """Get model name"""
+    return ai_client_registry.config().model
+
+
+def get_rate_limiter() -> AIRateLimiter:
+    """Get the rate limiter of the configured provider"""
+    return limiter_for(ai_client_registry.config().base_url)
+
+
+@dataclass
+class AIRequest:
+    """A chat completion to send; shared by the sync and async services"""
+    messages: List[Dict[str, str]]
+    temperature: float = 0.7
+    # Content hash of the system prompt template, when it came from the prompt registry
+    prompt_hash: Optional[str] = None
+    # Generation type, e.g. "segment_criteria"; used for logs and cache keys
+    kind: Optional[str] = None
+
+
+def record_completion(request: AIRequest, started: float, text: Optional[str] = None, usage=None, error: Optional[Exception] = None):
+    """Record metrics and queue an audit row (written in the background) for one provider call"""
+    seconds = time.perf_counter() - started
+    ai_metrics.observe_call(request.kind, get_model(), "error" if error is not None else "ok", seconds, usage)
+    ai_log_writer.record(
+        prompt=request.messages[-1]["content"],
+        output={"error": str(error)[:1000]} if error is not None else {"response": text},
+        kind=request.kind,
+        model=get_model(),
+        prompt_hash=request.prompt_hash,
+        status="error" if error is not None else "ok",
+        latency_ms=seconds * 1000,
+        prompt_tokens=getattr(usage, "prompt_tokens", None),
+        completion_tokens=getattr(usage, "completion_tokens", None),
+        total_tokens=getattr(usage, "total_tokens", None),
+    )
+
+
+def complete(request: AIRequest) -> str:
+    """Send a request with the shared client and return the response text"""
+    def call():
+        # Leased per attempt, so a retry after reload() uses the new client
+        with ai_client_registry.lease() as client:
+            return client.chat.completions.create(
+                model=get_model(),
+                messages=request.messages,
+                response_format={"type": "json_object"},
+                temperature=request.temperature
+            )
+
+    started = time.perf_counter()
+    try:
+        response = call_with_limits(get_rate_limiter(), request, call)
     except Exception as e:
-        error_info = handle_ai_error(e)
-        print(f"Error generating segment criteria: {e}")
-        import traceback
-        traceback.print_exc()
-        return {
-            "logical_operator": "AND",
-            "criteria": [],
-            "explanation": f"⚠️ {error_info['message']}",
-            "error": error_info
-        }
+        record_completion(request, started, error=e)
+        raise
+    text = (response.choices[0].message.content or "").strip()
+    record_completion(request, started, text, response.usage)
+    return text
 
 
-def generate_flow_content(segment_description: str, step_type: str, step_number: int) -> Dict[str, Any]:
-    """Generate flow step content based on segment"""
+def _log_error(message: str, e: Exception):
+    logger.error(f"{message}: {e}", exc_info=e)
+
+
+def parse_output(text: str, schema) -> Dict[str, Any]:
+    """Extract the JSON object from a response and validate it into schema"""
+    extractor = extract_json(text)
+    for reason in extractor.repairs:
+        ai_metrics.record_json_repair(reason)
+    return validate_output(extractor.result(), schema)
+
+
+def handle_ai_error(e: Exception) -> Dict[str, Any]:
+    """Handle AI API errors using error handler (Single Responsibility)"""
+    return AIErrorHandler.handle_error(e)
+
+
+# Segment criteria
+
+def build_segment_criteria_request(prompt: str) -> AIRequest:
+    system_prompt = prompt_registry.get(SEGMENT_CRITERIA_PROMPT)
+    return AIRequest(messages=[
+        {"role": "system", "content": system_prompt.text},
+        {"role": "user", "content": f"User request: {prompt}\n\nReturn only the JSON, no other text."}
+    ], prompt_hash=system_prompt.content_hash, kind="segment_criteria")
+
+
+def segment_criteria_cache_key(request: AIRequest, prompt: str) -> str:
+    return ai_response_cache.key(request, {"prompt": normalize_text(prompt)})
+
+
+def finalize_segment_criteria(text: str) -> Dict[str, Any]:
+    return parse_output(text, SegmentCriteriaOutput)
+
+
+def segment_criteria_fallback(e: Exception) -> Dict[str, Any]:
+    ai_metrics.record_fallback("segment_criteria", e)
+    error_info = handle_ai_error(e)
+    _log_error("Error generating segment criteria", e)
+    return {
+        "logical_operator": "AND",
+        "criteria": [],
+        "explanation": f"⚠️ {error_info['message']}",
+        "error": error_info
+    }
+
+
+def generate_segment_criteria(prompt: str) -> Dict[str, Any]:
+    """Convert human language to segment criteria using prompt file (Single Responsibility)"""
     try:
-        client = get_ai_client()
-        
-        prompt = f"""Generate email content for a marketing flow step.
+        request = build_segment_criteria_request(prompt)
+        key = segment_criteria_cache_key(request, prompt)
+        result = ai_response_cache.get(key)
+        if result is None:
+            result = finalize_segment_criteria(complete(request))
+            ai_response_cache.put(key, request, result)
+        return result
+    except Exception as e:
+        return segment_criteria_fallback(e)
+
+
+# Flow step content
+
+def build_flow_content_request(segment_description: str, step_type: str, step_number: int) -> AIRequest:
+    prompt = f"""Generate email content for a marketing flow step.
 
 Segment Description: {segment_description}
 Step Type: {step_type}
@@ -145,256 +268,243 @@ Return JSON:
 
 Return only the JSON, no other text."""
 
-        response = client.chat.completions.create(
-            model=get_model(),
-            messages=[
-                {"role": "system", "content": "You are an expert email marketing copywriter."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.8
-        )
-        
-        text = response.choices[0].message.content.strip()
-        
-        # Extract JSON
-        json_text = extract_json_from_text(text)
-        result = json.loads(json_text)
-        
-        # Ensure required fields exist
-        if "subject" not in result:
-            result["subject"] = "Special Offer for You!"
-        if "body_text" not in result:
-            result["body_text"] = "We have a special offer that we think you'll love!"
-        
-        return result
-    except Exception as e:
-        error_info = handle_ai_error(e)
-        print(f"Error generating flow content: {e}")
-        import traceback
-        traceback.print_exc()
-        return {
-            "subject": "Special Offer for You!",
-            "body_text": f"⚠️ {error_info['message']}",
-            "tone": "friendly",
-            "error": error_info
-        }
+    return AIRequest(messages=[
+        {"role": "system", "content": "You are an expert email marketing copywriter."},
+        {"role": "user", "content": prompt}
+    ], temperature=0.8, kind="flow_content")
 
 
-def generate_flow_from_segment(segment_description: str, segment_criteria: Dict[str, Any]) -> Dict[str, Any]:
-    """Generate complete flow based on segment conditions using prompt file"""
+def finalize_flow_content(text: str) -> Dict[str, Any]:
+    # Missing subject and body are filled in by the schema
+    return parse_output(text, FlowContentOutput)
+
+
+def flow_content_fallback(e: Exception) -> Dict[str, Any]:
+    ai_metrics.record_fallback("flow_content", e)
+    error_info = handle_ai_error(e)
+    _log_error("Error generating flow content", e)
+    return {
+        "subject": "Special Offer for You!",
+        "body_text": f"⚠️ {error_info['message']}",
+        "tone": "friendly",
+        "error": error_info
+    }
+
+
+def generate_flow_content(segment_description: str, step_type: str, step_number: int) -> Dict[str, Any]:
+    """Generate flow step content based on segment"""
     try:
-        client = get_ai_client()
-        
-        # Load prompt using PromptLoader (Dependency Inversion)
-        fallback_prompt = """Generate a marketing flow based on a customer segment.
-Return JSON with entry_condition_type, name, entry_condition, and steps array.
-Each step should have step_type, step_order, and config."""
-        
-        system_prompt = PromptLoader.load_prompt('flow_generation_prompt.txt', fallback_prompt)
-        
-        user_prompt = f"""Segment Description: {segment_description}
+        return finalize_flow_content(complete(build_flow_content_request(segment_description, step_type, step_number)))
+    except Exception as e:
+        return flow_content_fallback(e)
+
+
+# Flow from segment
+
+def build_flow_from_segment_request(segment_description: str, segment_criteria: Dict[str, Any]) -> AIRequest:
+    system_prompt = prompt_registry.get(FLOW_GENERATION_PROMPT)
+    
+    user_prompt = f"""Segment Description: {segment_description}
 Segment Criteria: {json.dumps(segment_criteria, indent=2)}
 
 Generate a complete flow for this segment. Consider the segment characteristics when creating the flow steps and messaging."""
 
-        response = client.chat.completions.create(
-            model=get_model(),
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"{user_prompt}\n\nReturn only the JSON, no other text."}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.7
-        )
-        
-        text = response.choices[0].message.content.strip()
-        json_text = extract_json_from_text(text)
-        result = json.loads(json_text)
-        
-        # Ensure required fields exist
-        if "steps" not in result:
-            result["steps"] = []
-        if "entry_condition_type" not in result:
-            result["entry_condition_type"] = "order_completed"
-        if "name" not in result:
-            result["name"] = f"Flow for {segment_description}"
-        
+    return AIRequest(messages=[
+        {"role": "system", "content": system_prompt.text},
+        {"role": "user", "content": f"{user_prompt}\n\nReturn only the JSON, no other text."}
+    ], prompt_hash=system_prompt.content_hash, kind="flow_from_segment")
+
+
+def flow_from_segment_cache_key(request: AIRequest, segment_description: str, segment_criteria: Dict[str, Any]) -> str:
+    return ai_response_cache.key(request, {
+        "segment_description": normalize_text(segment_description),
+        "segment_criteria": segment_criteria,
+    })
+
+
+def finalize_flow_from_segment(text: str, segment_description: str) -> Dict[str, Any]:
+    result = parse_output(text, FlowOutput)
+    
+    # Ensure required fields exist
+    if not result.get("name"):
+        result["name"] = f"Flow for {segment_description}"
+    
+    return result
+
+
+def flow_from_segment_fallback(e: Exception, segment_description: str) -> Dict[str, Any]:
+    ai_metrics.record_fallback("flow_from_segment", e)
+    error_info = handle_ai_error(e)
+    _log_error("Error generating flow from segment", e)
+    return {
+        "entry_condition_type": "order_completed",
+        "name": f"Flow for {segment_description}",
+        "entry_condition": f"⚠️ {error_info['message']}",
+        "steps": [],
+        "error": error_info
+    }
+
+
+def generate_flow_from_segment(segment_description: str, segment_criteria: Dict[str, Any]) -> Dict[str, Any]:
+    """Generate complete flow based on segment conditions using prompt file"""
+    try:
+        request = build_flow_from_segment_request(segment_description, segment_criteria)
+        key = flow_from_segment_cache_key(request, segment_description, segment_criteria)
+        result = ai_response_cache.get(key)
+        if result is None:
+            result = finalize_flow_from_segment(complete(request), segment_description)
+            ai_response_cache.put(key, request, result)
         return result
     except Exception as e:
-        error_info = handle_ai_error(e)
-        print(f"Error generating flow from segment: {e}")
-        import traceback
-        traceback.print_exc()
-        return {
-            "entry_condition_type": "order_completed",
-            "name": f"Flow for {segment_description}",
-            "entry_condition": f"⚠️ {error_info['message']}",
-            "steps": [],
-            "error": error_info
-        }
+        return flow_from_segment_fallback(e, segment_description)
 
 
-def generate_campaign_details(segment_description: str, segment_criteria: Dict[str, Any], flow_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-    """Generate complete campaign setup based on segment and flow using prompt file"""
-    try:
-        client = get_ai_client()
-        
-        # Load prompt using PromptLoader (Dependency Inversion)
-        fallback_prompt = """You are an AI assistant for an e-commerce Customer Data Platform. 
-Generate a complete marketing campaign setup based on a customer segment and optional flow.
+# Campaign details
 
-Return ONLY valid JSON in this format:
-{
-  "name": "Campaign name that reflects the segment and purpose",
-  "description": "Detailed description of the campaign strategy and goals",
-  "start_time_of_day": "HH:MM (recommended send time, e.g., '10:00', '14:30')",
-  "time_recommendation_reason": "Brief explanation of why this time is optimal",
-  "marketing_strategy": "Brief explanation of the marketing approach",
-  "recommendations": [
-    "Recommendation 1 for campaign execution",
-    "Recommendation 2 for campaign execution"
-  ]
-}
+class CampaignResponseError(ValueError):
+    """The AI call for a campaign failed or returned invalid JSON"""
 
-Campaign Generation Guidelines:
-1. Campaign name should be descriptive and reflect the target segment and goal
-2. Description should explain the campaign strategy, target audience, and expected outcomes
-3. Start time should be during optimal email open hours (typically 9 AM - 2 PM)
-4. Consider the segment characteristics when recommending timing
-5. If a flow is provided, align campaign timing with flow entry conditions"""
-        
-        system_prompt = PromptLoader.load_prompt('campaign_generation_prompt.txt', fallback_prompt)
-        
-        # Safely serialize segment_criteria
-        try:
-            criteria_json = json.dumps(segment_criteria, indent=2, default=str)
-        except Exception as e:
-            print(f"Warning: Could not serialize segment_criteria: {e}")
-            criteria_json = str(segment_criteria)
-        
-        user_prompt = f"""Segment Description: {segment_description}
+
+def build_campaign_details_request(segment_description: str, segment_criteria: Dict[str, Any], flow_data: Optional[Dict[str, Any]] = None) -> AIRequest:
+    system_prompt = prompt_registry.get(CAMPAIGN_GENERATION_PROMPT)
+    
+    # Safely serialize segment_criteria
+    try:
+        criteria_json = json.dumps(segment_criteria, indent=2, default=str)
+    except Exception as e:
+        logger.warning(f"Could not serialize segment_criteria: {e}")
+        criteria_json = str(segment_criteria)
+    
+    user_prompt = f"""Segment Description: {segment_description}
 Segment Criteria: {criteria_json}"""
-        
-        if flow_data:
-            # Safely serialize flow steps (limit to first 3 to avoid token limits)
-            try:
-                steps_preview = flow_data.get('steps', [])[:3]
-                # Clean up config for serialization
-                clean_steps = []
-                for step in steps_preview:
-                    clean_step = {
-                        "step_type": step.get("step_type", "SEND_EMAIL"),
-                        "step_order": step.get("step_order", 1),
+    
+    if flow_data:
+        # Safely serialize flow steps (limit to first 3 to avoid token limits)
+        try:
+            steps_preview = flow_data.get('steps', [])[:3]
+            # Clean up config for serialization
+            clean_steps = []
+            for step in steps_preview:
+                clean_step = {
+                    "step_type": step.get("step_type", "SEND_EMAIL"),
+                    "step_order": step.get("step_order", 1),
+                }
+                # Only include key config fields
+                config = step.get("config", {})
+                if isinstance(config, dict):
+                    clean_step["config"] = {
+                        k: v for k, v in config.items() 
+                        if k in ["subject", "body_text", "duration_days", "title", "message"]
                     }
-                    # Only include key config fields
-                    config = step.get("config", {})
-                    if isinstance(config, dict):
-                        clean_step["config"] = {
-                            k: v for k, v in config.items() 
-                            if k in ["subject", "body_text", "duration_days", "title", "message"]
-                        }
-                    clean_steps.append(clean_step)
-                
-                steps_json = json.dumps(clean_steps, indent=2, default=str)
-            except Exception as e:
-                print(f"Warning: Could not serialize flow steps: {e}")
-                steps_json = "Unable to serialize flow steps"
+                clean_steps.append(clean_step)
             
-            user_prompt += f"""
+            steps_json = json.dumps(clean_steps, indent=2, default=str)
+        except Exception as e:
+            logger.warning(f"Could not serialize flow steps: {e}")
+            steps_json = "Unable to serialize flow steps"
+        
+        user_prompt += f"""
 Flow Information:
 - Flow Name: {flow_data.get('name', 'N/A')}
 - Entry Condition: {flow_data.get('entry_condition_type', 'N/A')}
 - Number of Steps: {len(flow_data.get('steps', []))}
 - Flow Steps (first 3): {steps_json}
 """
-        
-        user_prompt += "\nGenerate a complete campaign setup for this segment and flow combination."
+    
+    user_prompt += "\nGenerate a complete campaign setup for this segment and flow combination."
 
-        try:
-            print("Calling AI API for campaign generation...")
-            response = client.chat.completions.create(
-                model=get_model(),
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"{user_prompt}\n\nReturn only the JSON, no other text."}
-                ],
-                response_format={"type": "json_object"},
-                temperature=0.7
-            )
-            
-            text = response.choices[0].message.content.strip()
-            
-            print(f"AI Response length: {len(text)} characters")
-            print(f"AI Response preview: {text[:200]}...")
-            
-            if not text:
-                raise ValueError("Empty response from AI model")
-            
-            json_text = extract_json_from_text(text)
-            
-            if not json_text:
-                print(f"Could not extract JSON. Original text: {text[:500]}")
-                raise ValueError("Could not extract JSON from AI response")
-            
-            print(f"Extracted JSON: {json_text[:200]}...")
-            result = json.loads(json_text)
-            print(f"Parsed JSON successfully. Keys: {list(result.keys())}")
-        except json.JSONDecodeError as e:
-            print(f"JSON decode error: {e}")
-            print(f"Extracted text: {json_text[:1000] if 'json_text' in locals() else 'N/A'}")
-            raise ValueError(f"Invalid JSON response from AI: {e}")
-        except Exception as e:
-            error_info = handle_ai_error(e)
-            print(f"Error calling AI model: {e}")
-            import traceback
-            traceback.print_exc()
-            raise ValueError(f"⚠️ {error_info['message']}")
-        
-        # Ensure required fields exist with proper defaults
-        # Note: start_date is NOT generated - user selects it manually
-        
-        if "name" not in result or not result.get("name"):
-            result["name"] = f"Campaign for {segment_description}"
-        if "description" not in result or not result.get("description"):
-            result["description"] = f"Marketing campaign targeting {segment_description}"
-        
-        # Validate and format time (required - AI must provide this)
-        if "start_time_of_day" not in result or not result.get("start_time_of_day"):
-            result["start_time_of_day"] = "10:00"
-            result["time_recommendation_reason"] = "Default morning time for general campaigns"
-        else:
-            # Validate time format (HH:MM)
-            time_str = str(result["start_time_of_day"])
-            if ':' in time_str and len(time_str.split(':')) == 2:
-                try:
-                    hours, minutes = time_str.split(':')
-                    if 0 <= int(hours) <= 23 and 0 <= int(minutes) <= 59:
-                        result["start_time_of_day"] = f"{int(hours):02d}:{int(minutes):02d}"
-                    else:
-                        result["start_time_of_day"] = "10:00"
-                        result["time_recommendation_reason"] = "Default morning time (invalid time provided)"
-                except:
+    return AIRequest(messages=[
+        {"role": "system", "content": system_prompt.text},
+        {"role": "user", "content": f"{user_prompt}\n\nReturn only the JSON, no other text."}
+    ], prompt_hash=system_prompt.content_hash, kind="campaign_details")
+
+
+def campaign_details_cache_key(request: AIRequest, segment_description: str, segment_criteria: Dict[str, Any], flow_data: Optional[Dict[str, Any]] = None) -> str:
+    return ai_response_cache.key(request, {
+        "segment_description": normalize_text(segment_description),
+        "segment_criteria": segment_criteria,
+        "flow_data": flow_data,
+    })
+
+
+def parse_campaign_response(text: str) -> Dict[str, Any]:
+    """Parse the campaign JSON; invalid JSON raises CampaignResponseError"""
+    logger.debug(f"AI response: {len(text)} characters, preview: {text[:200]}...")
+    
+    if not text:
+        raise ValueError("Empty response from AI model")
+    
+    try:
+        return parse_output(text, CampaignOutput)
+    except json.JSONDecodeError as e:
+        logger.warning(f"JSON decode error: {e}. Response text: {text[:1000]}")
+        raise CampaignResponseError(f"Invalid JSON response from AI: {e}") from e
+    except StructuredOutputError as e:
+        logger.warning(f"{e}. Response text: {text[:1000]}")
+        raise CampaignResponseError(str(e)) from e
+    except ValueError as e:
+        logger.warning(f"Could not extract JSON. Original text: {text[:500]}")
+        raise CampaignResponseError(f"Invalid JSON response from AI: {e}") from e
+
+
+def campaign_call_error(e: Exception) -> CampaignResponseError:
+    """Wrap a failed AI call so the campaign fallback reports the provider error"""
+    if isinstance(e, CampaignResponseError):
+        return e
+    error_info = handle_ai_error(e)
+    _log_error("Error calling AI model", e)
+    return CampaignResponseError(f"⚠️ {error_info['message']}")
+
+
+def finalize_campaign_details(result: Dict[str, Any], segment_description: str) -> Dict[str, Any]:
+    # Ensure required fields exist with proper defaults
+    # Note: start_date is NOT generated - user selects it manually
+    
+    if "name" not in result or not result.get("name"):
+        result["name"] = f"Campaign for {segment_description}"
+    if "description" not in result or not result.get("description"):
+        result["description"] = f"Marketing campaign targeting {segment_description}"
+    
+    # Validate and format time (required - AI must provide this)
+    if "start_time_of_day" not in result or not result.get("start_time_of_day"):
+        result["start_time_of_day"] = "10:00"
+        result["time_recommendation_reason"] = "Default morning time for general campaigns"
+    else:
+        # Validate time format (HH:MM)
+        time_str = str(result["start_time_of_day"])
+        if ':' in time_str and len(time_str.split(':')) == 2:
+            try:
+                hours, minutes = time_str.split(':')
+                if 0 <= int(hours) <= 23 and 0 <= int(minutes) <= 59:
+                    result["start_time_of_day"] = f"{int(hours):02d}:{int(minutes):02d}"
+                else:
                     result["start_time_of_day"] = "10:00"
-                    result["time_recommendation_reason"] = "Default morning time (time parsing failed)"
-            else:
+                    result["time_recommendation_reason"] = "Default morning time (invalid time provided)"
+            except:
                 result["start_time_of_day"] = "10:00"
-                result["time_recommendation_reason"] = "Default morning time (invalid format)"
-        
-        # Ensure time_recommendation_reason exists
-        if "time_recommendation_reason" not in result:
-            result["time_recommendation_reason"] = "Optimal time based on segment characteristics and marketing best practices"
-        
-        if "marketing_strategy" not in result:
-            result["marketing_strategy"] = "Personalized messaging based on segment characteristics"
-        if "recommendations" not in result or not isinstance(result.get("recommendations"), list):
-            result["recommendations"] = ["Use personalized subject lines", "Include relevant product recommendations"]
-        
-        return result
-    except ValueError as e:
-        # This is raised from the inner try block for quota/API errors
+                result["time_recommendation_reason"] = "Default morning time (time parsing failed)"
+        else:
+            result["start_time_of_day"] = "10:00"
+            result["time_recommendation_reason"] = "Default morning time (invalid format)"
+    
+    # Ensure time_recommendation_reason exists
+    if not result.get("time_recommendation_reason"):
+        result["time_recommendation_reason"] = "Optimal time based on segment characteristics and marketing best practices"
+    
+    if not result.get("marketing_strategy"):
+        result["marketing_strategy"] = "Personalized messaging based on segment characteristics"
+    if "recommendations" not in result or not isinstance(result.get("recommendations"), list):
+        result["recommendations"] = ["Use personalized subject lines", "Include relevant product recommendations"]
+    
+    return result
+
+
+def campaign_details_fallback(e: Exception, segment_description: str) -> Dict[str, Any]:
+    ai_metrics.record_fallback("campaign_details", e)
+    if isinstance(e, ValueError):
+        # Raised for quota/API errors and unusable responses
         error_message = str(e)
-        print(f"Error generating campaign details: {error_message}")
+        logger.error(f"Error generating campaign details: {error_message}")
         return {
             "name": f"Campaign for {segment_description}",
             "description": error_message,
@@ -403,93 +513,78 @@ Flow Information:
             "marketing_strategy": "Unable to generate strategy due to API error",
             "recommendations": ["Please try again later or check your API quota"]
         }
-    except Exception as e:
-        error_info = handle_ai_error(e)
-        print(f"Error generating campaign details: {e}")
-        import traceback
-        traceback.print_exc()
-        return {
-            "name": f"Campaign for {segment_description}",
-            "description": f"⚠️ {error_info['message']}",
-            "start_time_of_day": "10:00",
-            "marketing_strategy": "Personalized messaging based on segment characteristics",
-            "recommendations": ["Use personalized subject lines", "Include relevant product recommendations"]
-        }
+    error_info = handle_ai_error(e)
+    _log_error("Error generating campaign details", e)
+    return {
+        "name": f"Campaign for {segment_description}",
+        "description": f"⚠️ {error_info['message']}",
+        "start_time_of_day": "10:00",
+        "marketing_strategy": "Personalized messaging based on segment characteristics",
+        "recommendations": ["Use personalized subject lines", "Include relevant product recommendations"]
+    }
 
 
-def generate_suggestive_response(prompt: str, context: Optional[str] = None) -> Dict[str, Any]:
-    """Generate a suggestive response with segment description and campaign details"""
+def generate_campaign_details(segment_description: str, segment_criteria: Dict[str, Any], flow_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Generate complete campaign setup based on segment and flow using prompt file"""
     try:
-        client = get_ai_client()
-        
-        system_prompt = """You are a helpful AI assistant for an e-commerce Customer Data Platform. 
-When users ask about creating segments and campaigns, provide a structured response.
+        request = build_campaign_details_request(segment_description, segment_criteria, flow_data)
+        key = campaign_details_cache_key(request, segment_description, segment_criteria, flow_data)
+        cached = ai_response_cache.get(key)
+        if cached is not None:
+            return cached
+        try:
+            result = parse_campaign_response(complete(request))
+        except CampaignResponseError:
+            raise
+        except Exception as e:
+            raise campaign_call_error(e) from e
+        result = finalize_campaign_details(result, segment_description)
+        ai_response_cache.put(key, request, result)
+        return result
+    except Exception as e:
+        return campaign_details_fallback(e, segment_description)
 
-Return ONLY valid JSON in this format:
-{
-  "segment_description": "A natural language description that can be used in the segment creation form (e.g., 'High-value customers with total order value above $1000 who are subscribed to email marketing and haven't ordered in the last 60 days')",
-  "campaign": {
-    "subject": "Email subject line for the campaign",
-    "send_time": "Recommended send time (e.g., 'Tuesday 10 AM', 'Morning', 'Afternoon')",
-    "send_date": "Recommended send date strategy (e.g., 'Within 3 days of segment creation', 'Next week', 'Immediate')",
-    "content_ideas": [
-      "Plain-text idea 1 for email content",
-      "Plain-text idea 2 for email content",
-      "Plain-text idea 3 for email content"
-    ]
-  },
-  "explanation": "Brief explanation of the segment and campaign strategy"
-}
 
-The segment_description should be in natural language that can be directly pasted into the segment creation description field.
-The campaign details should be marketing-focused and relevant to the segment."""
+# Suggestive chat response
 
-        user_prompt = prompt
-        if context:
-            user_prompt = f"Context: {context}\n\nUser question: {prompt}"
-
-        response = client.chat.completions.create(
-            model=get_model(),
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"User request: {user_prompt}\n\nReturn only the JSON, no other text."}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.7
-        )
-        
-        # Extract JSON from response
-        text = response.choices[0].message.content.strip()
-        json_text = extract_json_from_text(text)
-        result = json.loads(json_text)
-        
-        # Ensure all required fields exist
-        if "segment_description" not in result:
-            result["segment_description"] = "Segment description based on your request"
-        if "campaign" not in result:
-            result["campaign"] = {
-                "subject": "Special Offer for You!",
-                "send_time": "Morning",
-                "send_date": "Within 3 days",
-                "content_ideas": ["We have a special offer for you!"]
-            }
-        if "explanation" not in result:
-            result["explanation"] = "Generated based on your request"
-        
-        return result
+def build_suggestive_request(prompt: str, context: Optional[str] = None) -> AIRequest:
+    system_prompt = prompt_registry.get(SUGGESTIVE_RESPONSE_PROMPT)
+
+    user_prompt = prompt
+    if context:
+        user_prompt = f"Context: {context}\n\nUser question: {prompt}"
+
+    return AIRequest(messages=[
+        {"role": "system", "content": system_prompt.text},
+        {"role": "user", "content": f"User request: {user_prompt}\n\nReturn only the JSON, no other text."}
+    ], prompt_hash=system_prompt.content_hash, kind="suggestive_response")
+
+
+def finalize_suggestive_response(text: str) -> Dict[str, Any]:
+    # Missing fields are filled in by the schema
+    return parse_output(text, SuggestiveOutput)
+
+
+def suggestive_response_fallback(e: Exception) -> Dict[str, Any]:
+    ai_metrics.record_fallback("suggestive_response", e)
+    error_info = handle_ai_error(e)
+    _log_error("Error generating suggestive response", e)
+    # Return fallback response
+    return {
+        "segment_description": f"⚠️ {error_info['message']}",
+        "campaign": {
+            "subject": "Special Offer for You!",
+            "send_time": "Morning",
+            "send_date": "Within 3 days",
+            "content_ideas": ["We have a special offer that we think you'll love!"]
+        },
+        "explanation": f"⚠️ {error_info['message']}"
+    }
+
+
+def generate_suggestive_response(prompt: str, context: Optional[str] = None) -> Dict[str, Any]:
+    """Generate a suggestive response with segment description and campaign details"""
+    try:
+        return finalize_suggestive_response(complete(build_suggestive_request(prompt, context)))
     except Exception as e:
-        error_info = handle_ai_error(e)
-        print(f"Error generating suggestive response: {e}")
-        import traceback
-        traceback.print_exc()
-        # Return fallback response
-        return {
-            "segment_description": f"⚠️ {error_info['message']}",
-            "campaign": {
-                "subject": "Special Offer for You!",
-                "send_time": "Morning",
-                "send_date": "Within 3 days",
-                "content_ideas": ["We have a special offer that we think you'll love!"]
-            },
-            "explanation": f"⚠️ {error_info['message']}"
-        }
+        return suggestive_response_fallback(e)
@@ -0,0 +1,296 @@
+"""
+Async AI service following Single Responsibility Principle
+Implements IAIService on AsyncOpenAI so LLM round trips await on the event
+loop instead of holding a worker thread; prompts and response handling are
+shared with the sync service, and in-flight calls are capped by a semaphore
+"""
+import asyncio
+import os
+import time
+import weakref
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from backend.services import ai_service
+from backend.services.ai_cache import ai_response_cache
+from backend.services.ai_error_handler import AIErrorHandler
+from backend.services.ai_client import ai_client_registry
+from backend.services.ai_rate_limiter import RateLimitWaitExceeded, async_call_with_limits
+from backend.services.ai_service import AIRequest
+from backend.services.ai_output import JSONExtractor
+from backend.services.interfaces import IAIService
+
+# Provider calls allowed in flight at once; further requests wait their turn
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "8"))
+# Batch generation: workers per batch, attempts per item and items per request
+AI_BATCH_CONCURRENCY = int(os.getenv("AI_BATCH_CONCURRENCY", "4"))
+AI_BATCH_MAX_ATTEMPTS = max(1, int(os.getenv("AI_BATCH_MAX_ATTEMPTS", "3")))
+AI_BATCH_MAX_ITEMS = int(os.getenv("AI_BATCH_MAX_ITEMS", "200"))
+# Time one batch item may spend waiting out rate limits the limiter would not wait for itself
+AI_BATCH_MAX_WAIT_SECONDS = float(os.getenv("AI_BATCH_MAX_WAIT_SECONDS", "120"))
+BATCH_KINDS = ("flow", "campaign")
+
+
+
+class AsyncAIService(IAIService):
+    """IAIService whose methods are coroutines"""
+
+    def __init__(self, max_concurrency: int = AI_MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # One per event loop: a semaphore cannot be shared across loops
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores.setdefault(loop, asyncio.Semaphore(self.max_concurrency))
+        return semaphore
+
+    async def complete(self, request: AIRequest) -> str:
+        """Send a request with the shared async client and return the response text"""
+        async def call():
+            async with self._semaphore(), ai_client_registry.async_lease() as client:
+                return await client.chat.completions.create(
+                    model=ai_service.get_model(),
+                    messages=request.messages,
+                    response_format={"type": "json_object"},
+                    temperature=request.temperature
+                )
+
+        started = time.perf_counter()
+        try:
+            response = await async_call_with_limits(ai_service.get_rate_limiter(), request, call)
+        except Exception as e:
+            ai_service.record_completion(request, started, error=e)
+            raise
+        text = (response.choices[0].message.content or "").strip()
+        ai_service.record_completion(request, started, text, response.usage)
+        return text
+
+    async def stream(self, request: AIRequest) -> AsyncIterator[str]:
+        """Send a request with streaming on and yield text deltas as they arrive"""
+        started = time.perf_counter()
+        chunks = []
+        deltas = self._stream(request)
+        try:
+            async for text in deltas:
+                chunks.append(text)
+                yield text
+        except Exception as e:
+            ai_service.record_completion(request, started, error=e)
+            raise
+        finally:
+            # Closes the provider stream and frees its semaphore slot when the caller stops early
+            await deltas.aclose()
+        # Streamed responses carry no usage
+        ai_service.record_completion(request, started, "".join(chunks).strip())
+
+    async def _stream(self, request: AIRequest) -> AsyncIterator[str]:
+        semaphore = self._semaphore()
+        leased = []
+
+        async def call():
+            # Held from opening the stream until it is read out, but not across limiter waits and backoff;
+            # the client lease likewise keeps a reload() from closing it under the open stream
+            await semaphore.acquire()
+            client = ai_client_registry.acquire_async()
+            try:
+                response = await client.chat.completions.create(
+                    model=ai_service.get_model(),
+                    messages=request.messages,
+                    response_format={"type": "json_object"},
+                    temperature=request.temperature,
+                    stream=True
+                )
+            except BaseException:
+                semaphore.release()
+                await ai_client_registry.release_async(client)
+                raise
+            leased.append(client)
+            return response
+
+        # Only opening the stream is retried; a stream that breaks midway fails the request
+        response = await async_call_with_limits(ai_service.get_rate_limiter(), request, call)
+        try:
+            async with response:
+                async for chunk in response:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+        finally:
+            semaphore.release()
+            await ai_client_registry.release_async(leased[0])
+
+    async def stream_events(self, request: AIRequest) -> AsyncIterator[Tuple[str, Any]]:
+        """Stream a completion as "delta" events plus a "field" event per completed top-level field
+
+        The full response text is left in the final ("text", ...) pair for the caller to finalize.
+        """
+        extractor = JSONExtractor()
+        chunks = []
+        async for text in self.stream(request):
+            chunks.append(text)
+            yield "delta", {"text": text}
+            for name, value in extractor.feed(text):
+                yield "field", {"name": name, "value": value}
+        yield "text", "".join(chunks).strip()
+
+    async def cache_get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cache lookup; the persistent tier is queried off the event loop"""
+        result = ai_response_cache.get_memory(key)
+        if result is None and ai_response_cache.persist:
+            result = await asyncio.to_thread(ai_response_cache.get_persistent, key)
+        return result
+
+    async def cache_put(self, key: str, request: AIRequest, result: Dict[str, Any]):
+        ai_response_cache.put_memory(key, result)
+        if ai_response_cache.persist:
+            await asyncio.to_thread(ai_response_cache.put_persistent, key, request, result)
+
+    async def generate_segment_criteria(self, prompt: str) -> Dict[str, Any]:
+        try:
+            request = ai_service.build_segment_criteria_request(prompt)
+            key = ai_service.segment_criteria_cache_key(request, prompt)
+            result = await self.cache_get(key)
+            if result is None:
+                result = ai_service.finalize_segment_criteria(await self.complete(request))
+                await self.cache_put(key, request, result)
+            return result
+        except Exception as e:
+            return ai_service.segment_criteria_fallback(e)
+
+    async def generate_flow_content(self, segment_description: str, step_type: str, step_number: int) -> Dict[str, Any]:
+        try:
+            text = await self.complete(ai_service.build_flow_content_request(segment_description, step_type, step_number))
+            return ai_service.finalize_flow_content(text)
+        except Exception as e:
+            return ai_service.flow_content_fallback(e)
+
+    async def _flow_from_segment(self, segment_description: str, segment_criteria: Dict[str, Any]) -> Dict[str, Any]:
+        request = ai_service.build_flow_from_segment_request(segment_description, segment_criteria)
+        key = ai_service.flow_from_segment_cache_key(request, segment_description, segment_criteria)
+        result = await self.cache_get(key)
+        if result is None:
+            result = ai_service.finalize_flow_from_segment(await self.complete(request), segment_description)
+            await self.cache_put(key, request, result)
+        return result
+
+    async def generate_flow_from_segment(self, segment_description: str, segment_criteria: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return await self._flow_from_segment(segment_description, segment_criteria)
+        except Exception as e:
+            return ai_service.flow_from_segment_fallback(e, segment_description)
+
+    async def _campaign_details(self, segment_description: str, segment_criteria: Dict[str, Any], flow_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        request = ai_service.build_campaign_details_request(segment_description, segment_criteria, flow_data)
+        key = ai_service.campaign_details_cache_key(request, segment_description, segment_criteria, flow_data)
+        cached = await self.cache_get(key)
+        if cached is not None:
+            return cached
+        try:
+            result = ai_service.parse_campaign_response(await self.complete(request))
+        except ai_service.CampaignResponseError:
+            raise
+        except Exception as e:
+            # Keep the provider error as the cause so callers can still inspect it
+            raise ai_service.campaign_call_error(e) from e
+        result = ai_service.finalize_campaign_details(result, segment_description)
+        await self.cache_put(key, request, result)
+        return result
+
+    async def generate_campaign_details(self, segment_description: str, segment_criteria: Dict[str, Any], flow_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        try:
+            return await self._campaign_details(segment_description, segment_criteria, flow_data)
+        except Exception as e:
+            return ai_service.campaign_details_fallback(e, segment_description)
+
+    async def generate_suggestive_response(self, prompt: str, context: Optional[str] = None) -> Dict[str, Any]:
+        try:
+            text = await self.complete(ai_service.build_suggestive_request(prompt, context))
+            return ai_service.finalize_suggestive_response(text)
+        except Exception as e:
+            return ai_service.suggestive_response_fallback(e)
+
+    async def _batch_item(self, generate: Callable, item: Dict[str, Any]) -> Dict[str, Any]:
+        waited = 0.0
+        for attempt in range(1, AI_BATCH_MAX_ATTEMPTS + 1):
+            try:
+                result = await generate(item["segment_description"], item["segment_criteria"])
+                return {"segment_id": item["segment_id"], "status": "ok", "result": result, "attempts": attempt}
+            except Exception as e:
+                cause = e.__cause__ or e
+                error_info = ai_service.handle_ai_error(cause)
+                retryable = error_info["error"] == "quota_exceeded" and not AIErrorHandler.is_quota_exhausted(cause)
+                # The limiter refused to wait this long, so the wait happens here, within the item's budget
+                delay = cause.delay if isinstance(cause, RateLimitWaitExceeded) else 0.0
+                if retryable and waited + delay > AI_BATCH_MAX_WAIT_SECONDS:
+                    retryable = False
+                if not retryable or attempt == AI_BATCH_MAX_ATTEMPTS:
+                    return {"segment_id": item["segment_id"], "status": "error", "error": error_info, "attempts": attempt}
+                # Otherwise the rate limiter's cooldown holds the next attempt back until retry_after has passed
+                if delay:
+                    await asyncio.sleep(delay)
+                    waited += delay
+
+    async def generate_batch(self, kind: str, items: List[Dict[str, Any]], concurrency: int = AI_BATCH_CONCURRENCY) -> AsyncIterator[Dict[str, Any]]:
+        """Flows or campaigns for many segments on a bounded pool of workers, yielded as each one finishes
+
+        Items hold segment_id, segment_description and segment_criteria. Items still rate-limited
+        after the limiter's own retries are tried again once its cooldown has passed.
+        """
+        generate = {"flow": self._flow_from_segment, "campaign": self._campaign_details}[kind]
+        pending: asyncio.Queue = asyncio.Queue()
+        finished: asyncio.Queue = asyncio.Queue()
+        for item in items:
+            pending.put_nowait(item)
+
+        async def worker():
+            while not pending.empty():
+                item = pending.get_nowait()
+                await finished.put(await self._batch_item(generate, item))
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(items)))]
+        try:
+            for _ in items:
+                yield await finished.get()
+        finally:
+            # The client may disconnect before the batch is done
+            for task in workers:
+                task.cancel()
+
+    async def stream_campaign_details(self, segment_description: str, segment_criteria: Dict[str, Any], flow_data: Optional[Dict[str, Any]] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """generate_campaign_details as events, ending with a "result" event holding its return value"""
+        try:
+            request = ai_service.build_campaign_details_request(segment_description, segment_criteria, flow_data)
+            key = ai_service.campaign_details_cache_key(request, segment_description, segment_criteria, flow_data)
+            result = await self.cache_get(key)
+            if result is None:
+                try:
+                    async for event, data in self.stream_events(request):
+                        if event == "text":
+                            result = ai_service.parse_campaign_response(data)
+                        else:
+                            yield event, data
+                except ai_service.CampaignResponseError:
+                    raise
+                except Exception as e:
+                    raise ai_service.campaign_call_error(e) from e
+                result = ai_service.finalize_campaign_details(result, segment_description)
+                await self.cache_put(key, request, result)
+        except Exception as e:
+            result = ai_service.campaign_details_fallback(e, segment_description)
+        yield "result", result
+
+    async def stream_suggestive_response(self, prompt: str, context: Optional[str] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """generate_suggestive_response as events, ending with a "result" event holding its return value"""
+        try:
+            async for event, data in self.stream_events(ai_service.build_suggestive_request(prompt, context)):
+                if event == "text":
+                    result = ai_service.finalize_suggestive_response(data)
+                else:
+                    yield event, data
+        except Exception as e:
+            result = ai_service.suggestive_response_fallback(e)
+        yield "result", result
+
+
+async_ai_service = AsyncAIService()
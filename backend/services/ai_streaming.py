@@ -0,0 +1,17 @@
+"""
+AI streaming helpers following Single Responsibility Principle
+Formats server-sent events
+"""
+import json
+from typing import Any, AsyncIterator, Tuple
+
+
+def format_sse(event: str, data: Any) -> str:
+    """One server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def iter_sse(events: AsyncIterator[Tuple[str, Any]]) -> AsyncIterator[str]:
+    """Format (event, data) pairs from an async generator as server-sent events"""
+    async for event, data in events:
+        yield format_sse(event, data)
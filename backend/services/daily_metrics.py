@@ -0,0 +1,185 @@
+"""
+Daily order metrics following Single Responsibility Principle
+Rolls orders up into one DailyOrderMetrics row per day (orders, revenue,
+first and second orders per customer), maintained incrementally from a
+created_at high-water mark, so dashboard totals and date ranges sum a few
+hundred rows instead of scanning every order
+"""
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import Date, and_, case, delete, distinct, func, insert, literal, not_, or_
+from sqlmodel import Session, select
+
+from backend.models import DailyOrderMetrics, Order
+from backend.services.logging import logger
+from backend.services.metrics_refresh import get_refresh_state, save_refresh_state
+
+REFRESH_INTERVAL_SECONDS = float(os.getenv("DAILY_METRICS_REFRESH_INTERVAL_SECONDS", "300"))
+STATE_NAME = "daily_order_metrics"
+# Incremental refreshes touching more days than this rebuild the whole table
+MAX_INCREMENTAL_DAYS = 60
+
+ROLLUP_COLUMNS = ["day", "orders", "revenue", "first_orders", "second_orders", "updated_at"]
+
+
+def _day(column):
+    return func.date(column, type_=Date)
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+
+def _in_days(column, days: Iterable[date]):
+    """Range conditions on a datetime column, one per day, so an index on it is usable"""
+    return or_(*[
+        and_(column >= _day_start(day), column < _day_start(day) + timedelta(days=1))
+        for day in days
+    ])
+
+
+def _ranked_orders(*conditions):
+    """Orders with each one's position (1 = first) in its customer's history"""
+    rank = func.row_number().over(partition_by=Order.user_id, order_by=(Order.order_date, Order.id))
+    statement = select(Order.user_id, Order.order_date, Order.total_amount, rank.label("rank"))
+    if conditions:
+        statement = statement.where(*conditions)
+    return statement.subquery()
+
+
+def _rollup(ranked, now: datetime):
+    day = _day(ranked.c.order_date)
+    return (
+        select(
+            day.label("day"),
+            func.count().label("orders"),
+            func.sum(ranked.c.total_amount).label("revenue"),
+            func.sum(case((ranked.c.rank == 1, 1), else_=0)).label("first_orders"),
+            func.sum(case((ranked.c.rank == 2, 1), else_=0)).label("second_orders"),
+            literal(now).label("updated_at"),
+        )
+        .group_by(day)
+    )
+
+
+def rebuild_daily_metrics(session: Session, now: Optional[datetime] = None):
+    """Recompute every daily row from raw orders"""
+    now = now or datetime.utcnow()
+    high_water_mark = session.exec(select(func.max(Order.created_at))).one()
+
+    session.exec(delete(DailyOrderMetrics))
+    session.exec(insert(DailyOrderMetrics).from_select(ROLLUP_COLUMNS, _rollup(_ranked_orders(), now)))
+    save_refresh_state(session, high_water_mark, now, STATE_NAME)
+    session.commit()
+    logger.info(f"Daily metrics rebuilt up to {high_water_mark}")
+
+
+def _refresh_days(session: Session, days: List[date], now: datetime):
+    """Recompute the rows of specific days"""
+    # Ranks need each customer's full history, not just the orders on these days
+    customers = select(distinct(Order.user_id)).where(_in_days(Order.order_date, days))
+    ranked = _ranked_orders(Order.user_id.in_(customers))
+
+    session.exec(delete(DailyOrderMetrics).where(DailyOrderMetrics.day.in_(days)))
+    session.exec(
+        insert(DailyOrderMetrics).from_select(
+            ROLLUP_COLUMNS,
+            _rollup(ranked, now).where(_in_days(ranked.c.order_date, days)),
+        )
+    )
+
+
+def refresh_daily_metrics(session: Session, now: Optional[datetime] = None):
+    """Fold orders created since the high-water mark into the daily rows"""
+    state = get_refresh_state(session, STATE_NAME)
+    if state is None or state.high_water_mark is None:
+        rebuild_daily_metrics(session, now)
+        return
+
+    now = now or datetime.utcnow()
+    since = state.high_water_mark
+    high_water_mark = session.exec(select(func.max(Order.created_at)).where(Order.created_at > since)).one()
+    if high_water_mark is None:
+        save_refresh_state(session, since, now, STATE_NAME)
+        session.commit()
+        return
+
+    new_orders = and_(Order.created_at > since, Order.created_at <= high_water_mark)
+    days = set(session.exec(select(distinct(_day(Order.order_date))).where(new_orders)).all())
+
+    # A new order can move its customer's first or second order to another day
+    customers = select(distinct(Order.user_id)).where(new_orders)
+    for ranked in (_ranked_orders(Order.user_id.in_(customers), not_(new_orders)), _ranked_orders(Order.user_id.in_(customers))):
+        days |= set(session.exec(select(distinct(_day(ranked.c.order_date))).where(ranked.c.rank <= 2)).all())
+
+    if len(days) > MAX_INCREMENTAL_DAYS:
+        rebuild_daily_metrics(session, now)
+        return
+
+    _refresh_days(session, sorted(days), now)
+    save_refresh_state(session, high_water_mark, now, STATE_NAME)
+    session.commit()
+    logger.info(f"Daily metrics refreshed for {len(days)} days up to {high_water_mark}")
+
+
+def run_refresh():
+    """Scheduled entry point: refresh with a dedicated session"""
+    from backend.database import engine
+    with Session(engine) as session:
+        refresh_daily_metrics(session)
+
+
+def is_built(session: Session) -> bool:
+    """Whether the daily rows have been built at least once"""
+    return get_refresh_state(session, STATE_NAME) is not None
+
+
+def daily_rows(session: Session, start: Optional[date] = None, end: Optional[date] = None) -> List[Dict]:
+    """Per-day metrics in [start, end], from the rollup (or computed live before the first build)"""
+    source = DailyOrderMetrics.__table__ if is_built(session) else _rollup(_ranked_orders(), datetime.utcnow()).subquery()
+    day = source.c.day
+    statement = select(day, source.c.orders, source.c.revenue, source.c.first_orders, source.c.second_orders)
+
+    if start is not None:
+        statement = statement.where(day >= start)
+    if end is not None:
+        statement = statement.where(day <= end)
+
+    return [
+        {"day": row_day, "orders": orders, "revenue": revenue, "first_orders": first_orders, "second_orders": second_orders}
+        for row_day, orders, revenue, first_orders, second_orders in session.exec(statement.order_by(day)).all()
+    ]
+
+
+def summarize(session: Session, start: Optional[date] = None, end: Optional[date] = None) -> Dict[str, float]:
+    """Totals over the daily rows in [start, end]"""
+    statement = select(
+        func.coalesce(func.sum(DailyOrderMetrics.orders), 0),
+        func.coalesce(func.sum(DailyOrderMetrics.revenue), 0),
+        func.coalesce(func.sum(DailyOrderMetrics.first_orders), 0),
+        func.coalesce(func.sum(DailyOrderMetrics.second_orders), 0),
+    )
+    if start is not None:
+        statement = statement.where(DailyOrderMetrics.day >= start)
+    if end is not None:
+        statement = statement.where(DailyOrderMetrics.day <= end)
+    orders, revenue, first_orders, second_orders = session.exec(statement).one()
+    return {
+        "orders": orders,
+        "revenue": float(revenue),
+        "first_orders": first_orders,
+        "second_orders": second_orders,
+    }
+
+
+def revenue_since(session: Session, since: datetime) -> float:
+    """Revenue of orders at or after since: whole days from the rollup, the partial first day from orders"""
+    first_full_day = since.date() + timedelta(days=1)
+    full_days = summarize(session, start=first_full_day)["revenue"]
+    partial_day = session.exec(
+        select(func.coalesce(func.sum(Order.total_amount), 0))
+        .where(Order.order_date >= since, Order.order_date < _day_start(first_full_day))
+    ).one()
+    return full_days + float(partial_day)
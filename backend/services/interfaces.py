@@ -2,9 +2,12 @@
 Service interfaces following Interface Segregation and Dependency Inversion principles
 """
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, TYPE_CHECKING
 from backend.models import User, Segment, Campaign, Flow
 
+if TYPE_CHECKING:
+    from backend.services.segment_engine import CompiledSegment
+
 
 class IAIService(ABC):
     """Interface for AI service operations"""
@@ -38,6 +41,11 @@ class IAIService(ABC):
 class ISegmentService(ABC):
     """Interface for segment operations"""
     
+    @abstractmethod
+    def compile_segment(self, definition: Dict[str, Any]) -> "CompiledSegment":
+        """Compile a segment definition once for repeated evaluation"""
+        pass
+    
     @abstractmethod
     def evaluate_segment(self, segment: Segment, users: List[User]) -> List[User]:
         """Evaluate segment criteria against users"""
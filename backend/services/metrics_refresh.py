@@ -0,0 +1,259 @@
+"""
+Metrics refresh following Single Responsibility Principle
+Materializes CustomerMetrics, ProductSalesMetrics and CustomerProductAffinity
+with set-based SQL, then keeps them current by re-aggregating only the
+customers and products touched by orders past a created_at high-water mark,
+and by orders and items changed through the ORM as they are flushed
+"""
+import os
+from datetime import datetime
+from typing import Iterable, Optional, Set
+
+from sqlalchemy import Integer, cast, delete, distinct, event, func, insert, inspect, literal
+from sqlmodel import Session, select
+
+from backend.models import (
+    CustomerMetrics,
+    CustomerProductAffinity,
+    MetricsRefreshState,
+    Order,
+    OrderItem,
+    ProductSalesMetrics,
+)
+from backend.services.logging import logger
+
+REFRESH_INTERVAL_SECONDS = float(os.getenv("METRICS_REFRESH_INTERVAL_SECONDS", "300"))
+STATE_NAME = "order_metrics"
+# Customers or products re-aggregated per statement when orders change through the ORM
+KEY_BATCH_SIZE = 500
+# session.info flag set when a flush re-aggregated metrics, so cached rankings are dropped on commit
+_CHANGED_KEY = "order_metrics_changed"
+
+
+def _days_since(session: Session, column, now: datetime):
+    """Whole days between a datetime column and now, in the session's SQL dialect"""
+    if session.get_bind().dialect.name == "sqlite":
+        return cast(func.julianday(literal(now)) - func.julianday(column), Integer)
+    return cast(func.floor(func.extract("epoch", literal(now) - column) / 86400), Integer)
+
+
+def _refresh_customers(session: Session, now: datetime, user_ids=None):
+    delete_statement = delete(CustomerMetrics)
+    aggregate = (
+        select(
+            Order.user_id,
+            func.sum(Order.total_amount),
+            func.avg(Order.total_amount),
+            func.count(Order.id),
+            _days_since(session, func.max(Order.order_date), now),
+            literal(now),
+        )
+        .group_by(Order.user_id)
+    )
+    if user_ids is not None:
+        delete_statement = delete_statement.where(CustomerMetrics.user_id.in_(user_ids))
+        aggregate = aggregate.where(Order.user_id.in_(user_ids))
+
+    session.exec(delete_statement)
+    session.exec(
+        insert(CustomerMetrics).from_select(
+            ["user_id", "lifetime_value", "average_order_value", "total_orders", "days_since_last_order", "updated_at"],
+            aggregate,
+        )
+    )
+
+
+def _refresh_products(session: Session, now: datetime, product_ids=None):
+    delete_statement = delete(ProductSalesMetrics)
+    aggregate = (
+        select(
+            OrderItem.product_id,
+            func.sum(OrderItem.quantity),
+            func.count(distinct(OrderItem.order_id)),
+            func.sum(OrderItem.quantity * OrderItem.unit_price),
+            func.max(Order.order_date),
+            literal(now),
+        )
+        .join(Order, Order.id == OrderItem.order_id)
+        .group_by(OrderItem.product_id)
+    )
+    if product_ids is not None:
+        delete_statement = delete_statement.where(ProductSalesMetrics.product_id.in_(product_ids))
+        aggregate = aggregate.where(OrderItem.product_id.in_(product_ids))
+
+    session.exec(delete_statement)
+    session.exec(
+        insert(ProductSalesMetrics).from_select(
+            ["product_id", "total_units_sold", "total_orders", "total_revenue", "last_purchased_at", "updated_at"],
+            aggregate,
+        )
+    )
+
+
+def _refresh_affinity(session: Session, user_ids=None):
+    delete_statement = delete(CustomerProductAffinity)
+    aggregate = (
+        select(
+            Order.user_id,
+            OrderItem.product_id,
+            func.count(distinct(Order.id)),
+            func.sum(OrderItem.quantity),
+            func.max(Order.order_date),
+        )
+        .join(Order, Order.id == OrderItem.order_id)
+        .group_by(Order.user_id, OrderItem.product_id)
+    )
+    if user_ids is not None:
+        delete_statement = delete_statement.where(CustomerProductAffinity.user_id.in_(user_ids))
+        aggregate = aggregate.where(Order.user_id.in_(user_ids))
+
+    session.exec(delete_statement)
+    session.exec(
+        insert(CustomerProductAffinity).from_select(
+            ["user_id", "product_id", "purchase_count", "total_quantity", "last_purchased_at"],
+            aggregate,
+        )
+    )
+
+
+def _invalidate_top_products():
+    # Imported here: top_products reads the refresh state from this module
+    from backend.services.top_products import top_products_cache
+    top_products_cache.invalidate()
+
+
+def get_refresh_state(session: Session, name: str = STATE_NAME) -> Optional[MetricsRefreshState]:
+    """Refresh bookkeeping, or None if the tables were never built"""
+    return session.get(MetricsRefreshState, name)
+
+
+def save_refresh_state(session: Session, high_water_mark: Optional[datetime], now: datetime, name: str = STATE_NAME):
+    state = get_refresh_state(session, name) or MetricsRefreshState(name=name)
+    state.high_water_mark = high_water_mark
+    state.refreshed_at = now
+    session.add(state)
+
+
+def rebuild_metrics(session: Session, now: Optional[datetime] = None):
+    """Recompute every metrics table from raw orders"""
+    now = now or datetime.utcnow()
+    high_water_mark = session.exec(select(func.max(Order.created_at))).one()
+
+    _refresh_customers(session, now)
+    _refresh_products(session, now)
+    _refresh_affinity(session)
+    save_refresh_state(session, high_water_mark, now)
+    session.commit()
+    _invalidate_top_products()
+    logger.info(f"Metrics rebuilt up to {high_water_mark}")
+
+
+def refresh_keys(session: Session, user_ids: Iterable[str], product_ids: Iterable[str], now: Optional[datetime] = None):
+    """Re-aggregate specific customers and products, KEY_BATCH_SIZE at a time; the caller commits"""
+    now = now or datetime.utcnow()
+    user_ids = sorted(set(user_ids))
+    product_ids = sorted(set(product_ids))
+    for offset in range(0, len(user_ids), KEY_BATCH_SIZE):
+        batch = user_ids[offset:offset + KEY_BATCH_SIZE]
+        _refresh_customers(session, now, batch)
+        _refresh_affinity(session, batch)
+    for offset in range(0, len(product_ids), KEY_BATCH_SIZE):
+        _refresh_products(session, now, product_ids[offset:offset + KEY_BATCH_SIZE])
+
+
+def _old_and_new(obj, key: str) -> Set[str]:
+    """Current value of an attribute plus the one this flush replaced"""
+    history = inspect(obj).attrs[key].history
+    return {value for value in (*history.added, *history.unchanged, *history.deleted) if value is not None}
+
+
+@event.listens_for(Session, "after_flush")
+def _refresh_changed_orders(session, flush_context):
+    # Orders edited, cancelled or given new items after the created_at mark passed them
+    # are re-aggregated here; the scheduled refresh still picks up rows written outside the ORM
+    user_ids: Set[str] = set()
+    product_ids: Set[str] = set()
+    changed_orders: Set[str] = set()
+    item_orders: Set[str] = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Order):
+            user_ids |= _old_and_new(obj, "user_id")
+            if obj not in session.deleted:
+                changed_orders.add(obj.id)
+        elif isinstance(obj, OrderItem):
+            product_ids |= _old_and_new(obj, "product_id")
+            item_orders |= _old_and_new(obj, "order_id")
+    if not (user_ids or product_ids or changed_orders or item_orders):
+        return
+
+    connection = session.connection()
+    built = connection.execute(
+        select(MetricsRefreshState.name).where(MetricsRefreshState.name == STATE_NAME)
+    ).first()
+    if built is None:
+        # The first scheduled refresh builds the tables from every order
+        return
+    item_orders = list(item_orders)
+    for offset in range(0, len(item_orders), KEY_BATCH_SIZE):
+        user_ids.update(connection.execute(
+            select(Order.user_id).where(Order.id.in_(item_orders[offset:offset + KEY_BATCH_SIZE]))
+        ).scalars())
+    changed_orders = list(changed_orders)
+    for offset in range(0, len(changed_orders), KEY_BATCH_SIZE):
+        # An order's date feeds its products' last_purchased_at
+        product_ids.update(connection.execute(
+            select(OrderItem.product_id).where(OrderItem.order_id.in_(changed_orders[offset:offset + KEY_BATCH_SIZE]))
+        ).scalars())
+    refresh_keys(session, user_ids, product_ids)
+    session.info[_CHANGED_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _drop_stale_rankings(session):
+    if session.info.pop(_CHANGED_KEY, False):
+        _invalidate_top_products()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed(session):
+    session.info.pop(_CHANGED_KEY, None)
+
+
+def refresh_metrics(session: Session, now: Optional[datetime] = None):
+    """Fold orders created since the high-water mark into the metrics tables"""
+    state = get_refresh_state(session)
+    if state is None or state.high_water_mark is None:
+        rebuild_metrics(session, now)
+        return
+
+    now = now or datetime.utcnow()
+    since = state.high_water_mark
+    high_water_mark = session.exec(select(func.max(Order.created_at)).where(Order.created_at > since)).one()
+    if high_water_mark is None:
+        save_refresh_state(session, since, now)
+        session.commit()
+        return
+
+    new_orders = (Order.created_at > since, Order.created_at <= high_water_mark)
+    # Touched keys are re-aggregated over all their orders, so the update is exact
+    user_ids = select(distinct(Order.user_id)).where(*new_orders)
+    product_ids = (
+        select(distinct(OrderItem.product_id))
+        .join(Order, Order.id == OrderItem.order_id)
+        .where(*new_orders)
+    )
+
+    _refresh_customers(session, now, user_ids)
+    _refresh_affinity(session, user_ids)
+    _refresh_products(session, now, product_ids)
+    save_refresh_state(session, high_water_mark, now)
+    session.commit()
+    _invalidate_top_products()
+    logger.info(f"Metrics refreshed from {since} to {high_water_mark}")
+
+
+def run_refresh():
+    """Scheduled entry point: refresh with a dedicated session"""
+    from backend.database import engine
+    with Session(engine) as session:
+        refresh_metrics(session)
@@ -1,9 +1,19 @@
 """
 Prompt loader following Single Responsibility Principle
-Handles only prompt file loading
+Handles only prompt file loading; PromptRegistry keeps every prompt in memory
+with its content hash and re-reads a file only when its mtime changes
 """
+import glob
+import hashlib
 import os
-from typing import Optional
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from backend.services.logging import logger
+
+PROMPT_WATCH_INTERVAL_SECONDS = float(os.getenv("PROMPT_WATCH_INTERVAL_SECONDS", "5"))
 
 
 class PromptLoader:
@@ -26,3 +36,111 @@ class PromptLoader:
             if fallback:
                 return fallback
             raise FileNotFoundError(f"Prompt file not found: {prompt_path}")
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """A loaded prompt and where it came from"""
+    name: str
+    text: str
+    content_hash: str
+    source: str  # "file" or "fallback"
+    mtime: Optional[float]
+    loaded_at: datetime
+
+
+class PromptRegistry:
+    """All prompts, read once and swapped in place when their files change"""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or PromptLoader.get_prompts_directory()
+        self._lock = threading.Lock()
+        self._fallbacks: Dict[str, Optional[str]] = {}
+        self._templates: Dict[str, PromptTemplate] = {}
+
+    def register(self, name: str, fallback: Optional[str] = None):
+        """Declare a prompt file and the text used while it does not exist"""
+        with self._lock:
+            self._fallbacks[name] = fallback
+            self._templates.pop(name, None)
+
+    def _mtime(self, name: str) -> Optional[float]:
+        try:
+            return os.stat(os.path.join(self.directory, name)).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _load(self, name: str) -> PromptTemplate:
+        path = os.path.join(self.directory, name)
+        mtime = self._mtime(name)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                text, source = f.read(), "file"
+        except FileNotFoundError:
+            text, source, mtime = self._fallbacks.get(name), "fallback", None
+            if not text:
+                raise FileNotFoundError(f"Prompt file not found: {path}")
+        return PromptTemplate(
+            name=name,
+            text=text,
+            content_hash=hashlib.sha256(text.encode("utf-8")).hexdigest(),
+            source=source,
+            mtime=mtime,
+            loaded_at=datetime.utcnow(),
+        )
+
+    def _names(self) -> List[str]:
+        files = [os.path.basename(path) for path in glob.glob(os.path.join(self.directory, "*.txt"))]
+        return sorted(set(self._fallbacks) | set(files))
+
+    def reload(self) -> List[PromptTemplate]:
+        """Re-read every prompt from disk"""
+        with self._lock:
+            templates = {name: self._load(name) for name in self._names()}
+            self._templates = templates
+            return list(templates.values())
+
+    def get(self, name: str) -> PromptTemplate:
+        """The current template; only the first use of a prompt touches the filesystem"""
+        template = self._templates.get(name)
+        if template is None:
+            with self._lock:
+                template = self._templates.get(name)
+                if template is None:
+                    template = self._templates[name] = self._load(name)
+        return template
+
+    def text(self, name: str) -> str:
+        return self.get(name).text
+
+    def check_for_changes(self) -> List[str]:
+        """Reload prompts whose file was added, changed or removed; returns their names"""
+        changed = []
+        with self._lock:
+            for name in self._names():
+                template = self._templates.get(name)
+                if template is None or template.mtime != self._mtime(name):
+                    self._templates[name] = self._load(name)
+                    changed.append(name)
+        return changed
+
+    def describe(self) -> List[Dict]:
+        return [
+            {
+                "name": template.name,
+                "content_hash": template.content_hash,
+                "source": template.source,
+                "loaded_at": template.loaded_at,
+            }
+            for template in sorted(self._templates.values(), key=lambda template: template.name)
+        ]
+
+
+prompt_registry = PromptRegistry()
+
+
+def run_watch():
+    """Scheduled entry point: pick up edited prompt files"""
+    changed = prompt_registry.check_for_changes()
+    if changed:
+        logger.info(f"Reloaded prompts: {', '.join(changed)}")
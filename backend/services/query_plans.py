@@ -0,0 +1,111 @@
+"""
+Query plan diagnostics following Single Responsibility Principle
+Runs EXPLAIN over the hot segment, dashboard and product queries and flags
+the ones the database answers by scanning a whole table
+"""
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Tuple
+
+from sqlalchemy import distinct
+from sqlalchemy.sql import Select
+from sqlmodel import Session, func, select
+
+from backend.models import Order, OrderItem, User
+from backend.services.segment_compiler import compile_segment
+
+# Placeholder key for the per-customer and per-product lookups; plans do not depend on it
+SAMPLE_ID = "00000000-0000-0000-0000-000000000000"
+
+
+def _segment(field: str, operator: str, value: Any) -> Callable[[datetime], Select]:
+    definition = {"criteria": [{"field": field, "operator": operator, "value": value}]}
+    return lambda now: select(func.count()).select_from(User).where(compile_segment(definition, now))
+
+
+def _dashboard_range(now: datetime) -> Select:
+    since = now - timedelta(days=30)
+    return select(func.coalesce(func.sum(Order.total_amount), 0)).where(Order.order_date >= since, Order.order_date < now)
+
+
+def _new_orders(now: datetime) -> Select:
+    return select(func.max(Order.created_at)).where(Order.created_at > now - timedelta(minutes=5))
+
+
+def _customer_orders(now: datetime) -> Select:
+    return (
+        select(func.sum(Order.total_amount), func.avg(Order.total_amount), func.count(Order.id), func.max(Order.order_date))
+        .where(Order.user_id == SAMPLE_ID)
+    )
+
+
+def _product_sales(now: datetime) -> Select:
+    return (
+        select(
+            func.sum(OrderItem.quantity),
+            func.count(distinct(OrderItem.order_id)),
+            func.sum(OrderItem.quantity * OrderItem.unit_price),
+            func.max(Order.order_date),
+        )
+        .join(Order, Order.id == OrderItem.order_id)
+        .where(OrderItem.product_id == SAMPLE_ID)
+    )
+
+
+def _top_products_window(now: datetime) -> Select:
+    return (
+        select(OrderItem.product_id, func.sum(OrderItem.quantity))
+        .join(Order, Order.id == OrderItem.order_id)
+        .where(Order.order_date >= now - timedelta(days=7))
+        .group_by(OrderItem.product_id)
+    )
+
+
+# The queries behind segment filters, dashboard date ranges and per-product aggregates
+HOT_QUERIES: List[Tuple[str, Callable[[datetime], Select]]] = [
+    ("segment_total_order_value", _segment("total_order_value", "gt", 1000)),
+    ("segment_order_count", _segment("order_count", "gte", 10)),
+    ("segment_days_since_last_order", _segment("days_since_last_order", "lt", 30)),
+    ("segment_last_order_date", _segment("last_order_date", "gt", "relative_180")),
+    ("segment_shipping_state", _segment("shipping_state", "eq", "CA")),
+    ("dashboard_date_range", _dashboard_range),
+    ("metrics_new_orders", _new_orders),
+    ("customer_orders", _customer_orders),
+    ("product_sales", _product_sales),
+    ("top_products_window", _top_products_window),
+]
+
+
+def _scans(dialect: str, plan: List[str]) -> List[str]:
+    """Plan lines that read a whole table rather than an index"""
+    if dialect == "sqlite":
+        # "SCAN t USING [COVERING] INDEX" walks an index; a bare "SCAN t" reads every row
+        return [line for line in plan if line.startswith("SCAN ") and " INDEX " not in line]
+    return [line.strip() for line in plan if "Seq Scan" in line]
+
+
+def explain(session: Session, statement: Select) -> Tuple[str, List[str]]:
+    """The SQL of a statement and the database's plan for it, one line per step"""
+    connection = session.connection()
+    dialect = connection.dialect
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+    if dialect.name == "sqlite":
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").all()
+        plan = [row[-1] for row in rows]
+    else:
+        plan = [row[0] for row in connection.exec_driver_sql(f"EXPLAIN {sql}").all()]
+    return sql, plan
+
+
+def check_query_plans(session: Session) -> Dict[str, Any]:
+    now = datetime.utcnow()
+    dialect = session.connection().dialect.name
+    queries = []
+    for name, build in HOT_QUERIES:
+        sql, plan = explain(session, build(now))
+        scans = _scans(dialect, plan)
+        queries.append({"name": name, "sql": sql, "plan": plan, "scans": scans})
+    return {
+        "dialect": dialect,
+        "scanning": [query["name"] for query in queries if query["scans"]],
+        "queries": queries,
+    }
@@ -0,0 +1,54 @@
+"""
+Replica sync following Single Responsibility Principle
+Copies the primary SQLite database into the read replica file with SQLite's
+online backup API, so replica routing can be run locally without a real
+replicated database
+"""
+import os
+import sqlite3
+from typing import Optional
+
+from sqlalchemy.engine import make_url
+
+from backend.services.logging import logger
+
+REPLICA_SYNC_INTERVAL_SECONDS = float(os.getenv("REPLICA_SYNC_INTERVAL_SECONDS", "5"))
+
+
+def _sqlite_file(url: Optional[str]) -> Optional[str]:
+    if not url:
+        return None
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite" or parsed.database in (None, "", ":memory:"):
+        return None
+    return os.path.abspath(parsed.database)
+
+
+def replica_files():
+    """(primary, replica) paths when both databases are SQLite files, else None"""
+    from backend.database import DATABASE_REPLICA_URL, database_url
+    primary, replica = _sqlite_file(database_url), _sqlite_file(DATABASE_REPLICA_URL)
+    if primary is None or replica is None or primary == replica:
+        return None
+    return primary, replica
+
+
+def sync_replica(primary: str, replica: str):
+    """Copy primary into replica page by page; replica readers wait out the copy via their busy timeout"""
+    from backend.database import SQLITE_BUSY_TIMEOUT_SECONDS
+    source = sqlite3.connect(primary, timeout=SQLITE_BUSY_TIMEOUT_SECONDS)
+    target = sqlite3.connect(replica, timeout=SQLITE_BUSY_TIMEOUT_SECONDS)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def run_sync():
+    """Scheduled entry point: refresh the local replica file"""
+    files = replica_files()
+    if files is None:
+        return
+    sync_replica(*files)
+    logger.debug(f"Copied {files[0]} to replica {files[1]}")
@@ -0,0 +1,55 @@
+"""
+Background scheduler following Single Responsibility Principle
+Runs maintenance jobs on daemon threads at a fixed interval
+"""
+import threading
+from typing import Callable, Dict
+
+from backend.services.logging import logger
+
+
+class PeriodicTask:
+    """Calls a function every interval_seconds on a daemon thread"""
+
+    def __init__(self, name: str, interval_seconds: float, func: Callable[[], None]):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.func = func
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.func()
+            except Exception as e:
+                logger.error(f"Scheduled task {self.name} failed: {e}")
+            self._stop.wait(self.interval_seconds)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+_tasks: Dict[str, PeriodicTask] = {}
+
+
+def schedule(name: str, interval_seconds: float, func: Callable[[], None]) -> PeriodicTask:
+    """Start a named periodic task (no-op if it is already running)"""
+    task = _tasks.get(name)
+    if task is None:
+        task = _tasks[name] = PeriodicTask(name, interval_seconds, func)
+    task.start()
+    return task
+
+
+def stop_all():
+    """Signal every scheduled task to stop"""
+    for task in _tasks.values():
+        task.stop()
@@ -0,0 +1,321 @@
+"""
+Segment compiler following Single Responsibility Principle
+Translates segment definitions into SQLAlchemy WHERE clauses so the
+database does the filtering and counting instead of Python
+"""
+import math
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import and_, or_, false, func
+from sqlalchemy.sql.elements import ColumnElement
+from sqlmodel import Session, select
+
+from backend.models import Segment, User
+from backend.services.logging import logger
+
+# Users without any order are treated as having ordered this many days ago
+NO_ORDER_DAYS = 999999
+
+# Fields computed from other columns rather than stored on User
+DERIVED_FIELDS = {"days_since_last_order"}
+
+NUMERIC_TYPES = (int, float)
+STRING_COLUMNS = {"id", "email", "phone", "first_name", "last_name", "shipping_state", "shipping_country"}
+DATETIME_COLUMNS = {"last_order_date", "created_at"}
+# Users loaded per query when a segment is evaluated in Python
+PYTHON_CHUNK_SIZE = int(os.getenv("SEGMENT_PYTHON_CHUNK_SIZE", "1000"))
+
+
+class SegmentCompileError(ValueError):
+    """Raised when a criterion cannot be expressed as SQL"""
+
+
+def normalize_criteria(definition: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Return the criteria list, converting the old flat-dict format if needed"""
+    if not isinstance(definition, dict):
+        return []
+
+    criteria_list = definition.get("criteria", [])
+    if criteria_list:
+        return criteria_list
+
+    # Old format: {"field": {"operator": value}}
+    criteria_list = []
+    for field, condition in definition.items():
+        if field in ["logical_operator", "criteria"] or not isinstance(condition, dict):
+            continue
+        for op, op_value in condition.items():
+            criteria_list.append({
+                "field": field,
+                "operator": op,
+                "value": op_value
+            })
+    return criteria_list
+
+
+def get_logical_operator(definition: Optional[Dict[str, Any]]) -> str:
+    """Return the logical operator of a definition (defaults to AND)"""
+    if not isinstance(definition, dict):
+        return "AND"
+    return definition.get("logical_operator", "AND")
+
+
+def days_before(now: datetime, days: float) -> datetime:
+    """now - days, clamped to the datetime range"""
+    try:
+        return now - timedelta(days=days)
+    except OverflowError:
+        return datetime.min if days > 0 else datetime.max
+
+
+def parse_date_value(value: Any) -> Optional[datetime]:
+    """Interpret a criterion value as a naive UTC datetime (ISO strings are parsed)"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _compare(column, operator: str, value: Any) -> ColumnElement:
+    if isinstance(value, bool) and operator != "eq":
+        # SQL only allows equality against boolean literals
+        value = int(value)
+    if operator == "gt":
+        return column > value
+    if operator == "lt":
+        return column < value
+    if operator == "gte":
+        return column >= value
+    if operator == "lte":
+        return column <= value
+    return column == value
+
+
+def _python_compare(left: Any, operator: str, right: Any) -> bool:
+    if operator == "gt":
+        return left > right
+    if operator == "lt":
+        return left < right
+    if operator == "gte":
+        return left >= right
+    if operator == "lte":
+        return left <= right
+    return left == right
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, NUMERIC_TYPES)
+
+
+def days_since_bounds(operator: str, value: Any, now: datetime) -> Optional[Tuple[Optional[datetime], Optional[datetime]]]:
+    """
+    days_since_last_order is floor((now - last_order_date) / 1 day), so a
+    comparison on it becomes bounds with lower < last_order_date <= upper.
+    Returns None when no whole number of days can satisfy the comparison;
+    raises OverflowError/ValueError for non-finite values.
+    """
+    if operator == "gt":
+        return None, days_before(now, math.floor(value) + 1)
+    if operator == "gte":
+        return None, days_before(now, math.ceil(value))
+    if operator == "lt":
+        return days_before(now, math.ceil(value)), None
+    if operator == "lte":
+        return days_before(now, math.floor(value) + 1), None
+    if float(value).is_integer():
+        return days_before(now, value + 1), days_before(now, value)
+    return None
+
+
+def _compile_days_since_last_order(operator: str, value: Any, now: datetime) -> ColumnElement:
+    """Rewritten as a range on last_order_date so it stays index friendly"""
+    if operator == "contains":
+        raise SegmentCompileError("contains is not supported on days_since_last_order")
+    if not _is_number(value):
+        if operator == "eq":
+            return false()
+        raise SegmentCompileError(f"Non-numeric value for days_since_last_order: {value!r}")
+
+    column = User.last_order_date
+    try:
+        bounds = days_since_bounds(operator, value, now)
+    except (OverflowError, ValueError):
+        raise SegmentCompileError(f"Unsupported value for days_since_last_order: {value!r}")
+
+    if bounds is None:
+        condition = false()
+    else:
+        lower, upper = bounds
+        conditions = []
+        if lower is not None:
+            conditions.append(column > lower)
+        if upper is not None:
+            conditions.append(column <= upper)
+        condition = and_(*conditions)
+
+    # Users without orders count as NO_ORDER_DAYS
+    if _python_compare(NO_ORDER_DAYS, operator, value):
+        return or_(condition, column.is_(None))
+    return condition
+
+
+def _compile_last_order_date(operator: str, value: Any, now: datetime) -> Optional[ColumnElement]:
+    column = User.last_order_date
+
+    if isinstance(value, str) and value.startswith("relative_"):
+        # value format: "relative_30" means 30 days ago
+        try:
+            days_ago = int(value.split("_")[1])
+        except (IndexError, ValueError):
+            raise SegmentCompileError(f"Invalid relative date: {value!r}")
+        cutoff_date = days_before(now, days_ago)
+        if operator == "lt":  # Less than X days ago = more recent
+            return column > cutoff_date
+        if operator == "gt":  # More than X days ago = older (no order counts as oldest)
+            return or_(column < cutoff_date, column.is_(None))
+        # Other operators are ignored for relative dates
+        return None
+
+    if operator == "contains":
+        raise SegmentCompileError("contains is not supported on last_order_date")
+    date_value = parse_date_value(value)
+    if date_value is None:
+        if operator == "eq":
+            return false()
+        raise SegmentCompileError(f"Invalid date value: {value!r}")
+    value = date_value
+
+    condition = _compare(column, operator, value)
+    # Missing dates compare as datetime.min
+    if operator in ("lt", "lte"):
+        return or_(condition, column.is_(None))
+    return condition
+
+
+def _compile_column(field: str, operator: str, value: Any) -> ColumnElement:
+    column = getattr(User, field)
+
+    if operator == "contains":
+        if field not in STRING_COLUMNS:
+            raise SegmentCompileError(f"contains is not supported on {field}")
+        # Mirrors str(value).lower() in str(user_value).lower()
+        needle = str(value).lower()
+        return func.lower(func.coalesce(column, "None")).contains(needle, autoescape=True)
+
+    if value is None:
+        if operator == "eq":
+            return column.is_(None)
+        raise SegmentCompileError(f"Cannot compare {field} with null")
+
+    if field in DATETIME_COLUMNS:
+        raise SegmentCompileError(f"Unsupported date comparison on {field}")
+
+    is_string_column = field in STRING_COLUMNS
+    if is_string_column != isinstance(value, str):
+        # Mismatched types never compare equal and cannot be ordered
+        if operator == "eq":
+            return false()
+        raise SegmentCompileError(f"Type mismatch for {field}: {value!r}")
+
+    return _compare(column, operator, value)
+
+
+def compile_criterion(criterion: Dict[str, Any], now: datetime) -> Optional[ColumnElement]:
+    """Compile a single criterion; returns None when the criterion is ignored"""
+    field = criterion.get("field")
+    operator = criterion.get("operator")
+    value = criterion.get("value")
+
+    if field != "days_since_last_order" and (not isinstance(field, str) or field not in User.__table__.columns):
+        return false()
+    if field == "last_order_date" and isinstance(value, str) and value.startswith("relative_"):
+        return _compile_last_order_date(operator, value, now)
+    if operator not in ("gt", "lt", "gte", "lte", "eq", "contains"):
+        return false()
+    if field == "days_since_last_order":
+        return _compile_days_since_last_order(operator, value, now)
+    if field == "last_order_date":
+        return _compile_last_order_date(operator, value, now)
+    return _compile_column(field, operator, value)
+
+
+def compile_segment(definition: Optional[Dict[str, Any]], now: Optional[datetime] = None) -> ColumnElement:
+    """Compile a segment definition into a WHERE clause over User"""
+    now = now or datetime.utcnow()
+
+    conditions = []
+    for criterion in normalize_criteria(definition):
+        condition = compile_criterion(criterion, now)
+        if condition is not None:
+            conditions.append(condition)
+
+    if not conditions:
+        return false()
+    if get_logical_operator(definition) == "OR":
+        return or_(*conditions)
+    return and_(*conditions)
+
+
+def segment_filter(segment: Segment, now: Optional[datetime] = None) -> Optional[ColumnElement]:
+    """Compile a segment, or return None when it has to be evaluated in Python"""
+    try:
+        return compile_segment(segment.definition, now)
+    except SegmentCompileError as e:
+        logger.warning(f"Segment {segment.id} evaluated in Python: {e}")
+        return None
+
+
+def _user_chunks(session: Session, after: Optional[str] = None) -> Iterator[List[User]]:
+    """Users in id order, PYTHON_CHUNK_SIZE at a time, for criteria evaluated in Python"""
+    statement = select(User).order_by(User.id).limit(PYTHON_CHUNK_SIZE)
+    while True:
+        users = session.exec(statement if after is None else statement.where(User.id > after)).all()
+        if not users:
+            return
+        yield users
+        if len(users) < PYTHON_CHUNK_SIZE:
+            return
+        after = users[-1].id
+
+
+def count_segment_users(session: Session, segment: Segment) -> int:
+    """Count users matching a segment"""
+    condition = segment_filter(segment)
+    if condition is None:
+        from backend.services.segment_engine import compile_definition
+        compiled = compile_definition(segment.definition)
+        now = datetime.utcnow()
+        return sum(compiled.count(users, now) for users in _user_chunks(session))
+
+    return session.exec(select(func.count()).select_from(User).where(condition)).one()
+
+
+def query_segment_users(session: Session, segment: Segment, limit: Optional[int] = None, after: Optional[str] = None) -> List[User]:
+    """Get users matching a segment in id order, optionally limited and after a user id cursor"""
+    condition = segment_filter(segment)
+    if condition is None:
+        from backend.services.segment_engine import compile_definition
+        compiled = compile_definition(segment.definition)
+        now = datetime.utcnow()
+        matching: List[User] = []
+        for users in _user_chunks(session, after):
+            matching.extend(compiled.filter(users, now))
+            if limit is not None and len(matching) >= limit:
+                # Stop reading once the page is full
+                return matching[:limit]
+        return matching
+
+    statement = select(User).where(condition).order_by(User.id)
+    if after is not None:
+        statement = statement.where(User.id > after)
+    if limit is not None:
+        statement = statement.limit(limit)
+    return list(session.exec(statement).all())
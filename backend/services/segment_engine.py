@@ -0,0 +1,268 @@
+"""
+Segment predicate engine following Single Responsibility Principle
+Compiles a segment definition once into bound predicate closures for
+in-memory evaluation (previews, fallbacks for criteria SQL cannot express)
+"""
+import operator
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from backend.models import Segment, User
+from backend.services.interfaces import ISegmentService
+from backend.services.segment_compiler import (
+    DERIVED_FIELDS,
+    NO_ORDER_DAYS,
+    NUMERIC_TYPES,
+    days_before,
+    days_since_bounds,
+    get_logical_operator,
+    normalize_criteria,
+    parse_date_value,
+)
+
+Predicate = Callable[[User], bool]
+# A criterion compiled once; binding it to "now" yields a Predicate
+PredicateFactory = Callable[[datetime], Predicate]
+
+OPERATORS = {
+    "gt": operator.gt,
+    "lt": operator.lt,
+    "gte": operator.ge,
+    "lte": operator.le,
+    "eq": operator.eq,
+}
+
+USER_FIELDS = set(User.__table__.columns.keys())
+
+
+def _never(user: User) -> bool:
+    return False
+
+
+def _safe_compare(compare: Callable[[Any, Any], bool], left: Any, right: Any) -> bool:
+    # Incomparable values (e.g. None > 5) never match, same as NULL in SQL
+    try:
+        return compare(left, right)
+    except TypeError:
+        return False
+
+
+def _last_order_date(user: User) -> Optional[datetime]:
+    state = user.__dict__
+    return state["last_order_date"] if "last_order_date" in state else user.last_order_date
+
+
+def _days_since_last_order_factory(op: str, value: Any) -> PredicateFactory:
+    if op == "contains":
+        needle = str(value).lower()
+        no_order_result = needle in str(NO_ORDER_DAYS)
+
+        def bind(now: datetime) -> Predicate:
+            def predicate(user: User) -> bool:
+                last_order_date = _last_order_date(user)
+                if last_order_date is None:
+                    return no_order_result
+                return needle in str((now - last_order_date).days)
+            return predicate
+        return bind
+
+    compare = OPERATORS[op]
+    no_order_result = _safe_compare(compare, NO_ORDER_DAYS, value)
+
+    def bind(now: datetime) -> Predicate:
+        try:
+            bounds = days_since_bounds(op, value, now) if isinstance(value, NUMERIC_TYPES) else False
+        except (OverflowError, ValueError):
+            bounds = False
+
+        if bounds is None:
+            # Day counts are whole numbers, so only users without orders can match
+            if no_order_result:
+                return lambda user: _last_order_date(user) is None
+            return _never
+
+        if bounds is False:
+            def predicate(user: User) -> bool:
+                last_order_date = _last_order_date(user)
+                if last_order_date is None:
+                    return no_order_result
+                return _safe_compare(compare, (now - last_order_date).days, value)
+            return predicate
+
+        lower, upper = bounds
+        lower = lower or datetime.min
+        upper = upper or datetime.max
+
+        def predicate(user: User) -> bool:
+            state = user.__dict__
+            last_order_date = state["last_order_date"] if "last_order_date" in state else user.last_order_date
+            if last_order_date is None:
+                return no_order_result
+            return lower < last_order_date <= upper
+        return predicate
+
+    return bind
+
+
+def _relative_date_factory(op: str, days_ago: int) -> Optional[PredicateFactory]:
+    if op == "lt":  # Less than X days ago = more recent
+        def bind(now: datetime) -> Predicate:
+            cutoff_date = days_before(now, days_ago)
+
+            def predicate(user: User) -> bool:
+                last_order_date = _last_order_date(user)
+                return last_order_date is not None and last_order_date > cutoff_date
+            return predicate
+        return bind
+    if op == "gt":  # More than X days ago = older
+        def bind(now: datetime) -> Predicate:
+            cutoff_date = days_before(now, days_ago)
+
+            def predicate(user: User) -> bool:
+                last_order_date = _last_order_date(user)
+                return last_order_date is None or last_order_date < cutoff_date
+            return predicate
+        return bind
+    # Other operators are ignored for relative dates
+    return None
+
+
+def _field_factory(field: str, op: str, value: Any) -> PredicateFactory:
+    # Loaded column values live in the instance __dict__; reading them there
+    # skips the ORM attribute machinery, which dominates per-user cost
+    if op == "contains":
+        needle = str(value).lower()
+
+        def predicate(user: User) -> bool:
+            state = user.__dict__
+            user_value = state[field] if field in state else getattr(user, field)
+            return needle in str(user_value).lower()
+        return lambda now: predicate
+
+    compare = OPERATORS[op]
+    if field == "last_order_date":
+        date_value = parse_date_value(value)
+        if date_value is None:
+            return lambda now: _never
+
+        # Missing dates compare as datetime.min
+        def predicate(user: User) -> bool:
+            return compare(_last_order_date(user) or datetime.min, date_value)
+    else:
+        def predicate(user: User) -> bool:
+            state = user.__dict__
+            try:
+                return compare(state[field] if field in state else getattr(user, field), value)
+            except TypeError:
+                return False
+    return lambda now: predicate
+
+
+def compile_criterion(criterion: Dict[str, Any]) -> Optional[PredicateFactory]:
+    """Compile a single criterion; returns None when the criterion is ignored"""
+    field = criterion.get("field")
+    op = criterion.get("operator")
+    value = criterion.get("value")
+
+    if field not in DERIVED_FIELDS and field not in USER_FIELDS:
+        return lambda now: _never
+
+    if field == "last_order_date" and isinstance(value, str) and value.startswith("relative_"):
+        # value format: "relative_30" means 30 days ago
+        try:
+            days_ago = int(value.split("_")[1])
+        except (IndexError, ValueError):
+            return lambda now: _never
+        return _relative_date_factory(op, days_ago)
+
+    if op not in OPERATORS and op != "contains":
+        return lambda now: _never
+
+    if field == "days_since_last_order":
+        return _days_since_last_order_factory(op, value)
+
+    return _field_factory(field, op, value)
+
+
+class CompiledSegment:
+    """A segment definition compiled into predicate factories"""
+
+    __slots__ = ("factories", "match_any")
+
+    def __init__(self, factories: Tuple[PredicateFactory, ...], match_any: bool):
+        self.factories = factories
+        self.match_any = match_any
+
+    def bind(self, now: Optional[datetime] = None) -> Tuple[Predicate, ...]:
+        """Bind every criterion to a single "now" for one evaluation"""
+        now = now or datetime.utcnow()
+        return tuple(factory(now) for factory in self.factories)
+
+    def matches(self, user: User, now: Optional[datetime] = None) -> bool:
+        """Check a single user"""
+        predicates = self.bind(now)
+        if not predicates:
+            return False
+        if self.match_any:
+            return any(predicate(user) for predicate in predicates)
+        return all(predicate(user) for predicate in predicates)
+
+    def filter(self, users: Sequence[User], now: Optional[datetime] = None) -> List[User]:
+        """Return the users matching the segment, preserving input order"""
+        predicates = self.bind(now)
+        if not predicates:
+            return []
+
+        if not self.match_any:
+            # AND: each predicate only sees users that passed the previous ones
+            matching = list(users)
+            for predicate in predicates:
+                matching = [user for user in matching if predicate(user)]
+                if not matching:
+                    break
+            return matching
+
+        # OR: each predicate only sees users no earlier predicate matched
+        matched = [False] * len(users)
+        remaining = list(range(len(users)))
+        for predicate in predicates:
+            still_remaining = []
+            for index in remaining:
+                if predicate(users[index]):
+                    matched[index] = True
+                else:
+                    still_remaining.append(index)
+            remaining = still_remaining
+            if not remaining:
+                break
+        return [user for user, is_match in zip(users, matched) if is_match]
+
+    def count(self, users: Sequence[User], now: Optional[datetime] = None) -> int:
+        """Count the users matching the segment"""
+        return len(self.filter(users, now))
+
+
+def compile_definition(definition: Optional[Dict[str, Any]]) -> CompiledSegment:
+    """Compile a segment definition once for repeated in-memory evaluation"""
+    factories = []
+    for criterion in normalize_criteria(definition):
+        factory = compile_criterion(criterion)
+        if factory is not None:
+            factories.append(factory)
+    return CompiledSegment(tuple(factories), get_logical_operator(definition) == "OR")
+
+
+class SegmentService(ISegmentService):
+    """In-memory segment evaluation backed by compiled predicates"""
+
+    def compile_segment(self, definition: Optional[Dict[str, Any]]) -> CompiledSegment:
+        return compile_definition(definition)
+
+    def evaluate_segment(self, segment: Segment, users: List[User]) -> List[User]:
+        return compile_definition(segment.definition).filter(users)
+
+    def get_segment_count(self, segment: Segment, users: List[User]) -> int:
+        return compile_definition(segment.definition).count(users)
+
+
+segment_service = SegmentService()
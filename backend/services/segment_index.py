@@ -0,0 +1,208 @@
+"""
+Segment membership index following Single Responsibility Principle
+Caches each segment's members as a bitmap over a dense user ordinal so
+set operations between segments are answered without joining their
+memberships row by row
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+from sqlmodel import Session, select
+
+from backend.models import Segment, SegmentMembership
+from backend.services.logging import logger
+from backend.services.segment_columnar import UserColumns, evaluate_mask, referenced_fields
+from backend.services.segment_compiler import normalize_criteria
+
+# Bitmaps are also dropped after this long, to pick up writes made by other processes
+INDEX_TTL_SECONDS = float(os.getenv("SEGMENT_INDEX_TTL_SECONDS", "300"))
+# Time-relative segments drift as "now" moves, so they expire sooner
+TIME_RELATIVE_TTL_SECONDS = float(os.getenv("SEGMENT_INDEX_TIME_RELATIVE_TTL_SECONDS", "60"))
+
+
+def is_time_relative(definition: Optional[Dict]) -> bool:
+    """Whether a definition's membership changes with the passage of time"""
+    for criterion in normalize_criteria(definition):
+        field = criterion.get("field")
+        value = criterion.get("value")
+        if field == "days_since_last_order":
+            return True
+        if field == "last_order_date" and isinstance(value, str) and value.startswith("relative_"):
+            return True
+    return False
+
+
+class SegmentBitmap:
+    """Members of one segment as a bitmap over the ordinals of a user id snapshot"""
+
+    __slots__ = ("bits", "packed", "count", "fields", "user_ids", "expires_at")
+
+    def __init__(self, mask: np.ndarray, fields: Optional[Set[str]], user_ids: np.ndarray, expires_at: float):
+        self.packed = np.packbits(mask, bitorder="little").tobytes()
+        # Python ints give C-speed &, |, ~ and bit_count over the whole bitmap
+        self.bits = int.from_bytes(self.packed, "little")
+        self.count = int(mask.sum())
+        # User fields an evaluated bitmap depends on; None when read from SegmentMembership
+        self.fields = fields
+        self.user_ids = user_ids
+        self.expires_at = expires_at
+
+
+class SegmentMembershipIndex:
+    """Process-wide cache of segment bitmaps, read from SegmentMembership or built with columnar evaluation"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bitmaps: Dict[str, SegmentBitmap] = {}
+        # User ids in ordinal order, shared by every cached bitmap
+        self._user_ids: Optional[np.ndarray] = None
+        # Segments being built, so concurrent requests wait for one build instead of repeating it
+        self._building: Dict[str, threading.Event] = {}
+        # Bumped by every invalidation; a build that started before one is returned but not cached
+        self._generation = 0
+
+    def _build(self, session: Session, segments: List[Segment], previous: Optional[np.ndarray]) -> Dict[str, SegmentBitmap]:
+        """Build bitmaps in one pass over user ids, without holding the lock"""
+        from backend.services.segment_membership import get_state
+        now = datetime.utcnow()
+        # Segments with current memberships are read from that table, so counts agree with their audiences;
+        # the rest (unsaved, or not yet materialized) are evaluated over user columns
+        materialized = {segment.id for segment in segments if get_state(session, segment) is not None}
+        evaluated = [segment for segment in segments if segment.id not in materialized]
+        fields_by_segment = {segment.id: referenced_fields(segment.definition) for segment in evaluated}
+        all_fields = set().union(*fields_by_segment.values())
+
+        id_chunks = []
+        masks: Dict[str, List[np.ndarray]] = {segment.id: [] for segment in evaluated}
+        for chunk in UserColumns.iter_chunks(session, all_fields):
+            id_chunks.append(chunk.ids)
+            for segment in evaluated:
+                masks[segment.id].append(evaluate_mask(segment.definition, chunk, now))
+
+        user_ids = np.concatenate(id_chunks) if id_chunks else np.array([], dtype=object)
+        if previous is not None and np.array_equal(user_ids, previous):
+            # Same users: keep the snapshot, so these bitmaps combine with the cached ones
+            user_ids = previous
+
+        built_at = time.monotonic()
+        bitmaps = {}
+        for segment in segments:
+            if segment.id in materialized:
+                mask = self._member_mask(session, segment.id, user_ids)
+            else:
+                segment_masks = masks[segment.id]
+                mask = np.concatenate(segment_masks) if segment_masks else np.zeros(0, dtype=bool)
+            ttl = TIME_RELATIVE_TTL_SECONDS if is_time_relative(segment.definition) else INDEX_TTL_SECONDS
+            bitmaps[segment.id] = SegmentBitmap(mask, fields_by_segment.get(segment.id), user_ids, built_at + ttl)
+
+        logger.info(f"Segment index built {len(segments)} bitmaps over {len(user_ids)} users")
+        return bitmaps
+
+    @staticmethod
+    def _member_mask(session: Session, segment_id: str, user_ids: np.ndarray) -> np.ndarray:
+        """Mask over user_ids (sorted, as UserColumns pages by id) of a segment's SegmentMembership rows"""
+        members = np.array(session.exec(
+            select(SegmentMembership.user_id)
+            .where(SegmentMembership.segment_id == segment_id)
+            .order_by(SegmentMembership.user_id)
+        ).all(), dtype=object)
+        mask = np.zeros(len(user_ids), dtype=bool)
+        if len(members) and len(user_ids):
+            positions = np.searchsorted(user_ids, members)
+            found = positions < len(user_ids)
+            # Members of users created after the id pass are left out, as in evaluated bitmaps
+            found[found] = user_ids[positions[found]] == members[found]
+            mask[positions[found]] = True
+        return mask
+
+    def _store(self, built: Dict[str, SegmentBitmap], generation: int):
+        """Cache freshly built bitmaps unless an invalidation happened during the build; call under the lock"""
+        if not built or generation != self._generation:
+            return
+        user_ids = next(iter(built.values())).user_ids
+        if user_ids is not self._user_ids:
+            # Users were added or removed: bitmaps over the old snapshot cannot be combined with these
+            self._user_ids = user_ids
+            self._bitmaps.clear()
+        self._bitmaps.update(built)
+
+    def ensure(self, session: Session, segments: List[Segment]) -> Dict[str, SegmentBitmap]:
+        """
+        Return fresh bitmaps over one user snapshot for the segments. Missing
+        ones are built in one pass outside the lock; segments another request
+        is already building are waited for instead of built twice.
+        """
+        built: Dict[str, SegmentBitmap] = {}
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                result = {}
+                missing = []
+                pending = []
+                for segment in segments:
+                    bitmap = built.get(segment.id) or self._bitmaps.get(segment.id)
+                    if bitmap is not None and bitmap.expires_at > now:
+                        result[segment.id] = bitmap
+                    elif segment.id in self._building:
+                        pending.append(self._building[segment.id])
+                    else:
+                        missing.append(segment)
+
+                if not missing and not pending:
+                    if len({id(bitmap.user_ids) for bitmap in result.values()}) <= 1:
+                        return result
+                    # Built over different user snapshots; rebuild them together
+                    missing = list(segments)
+
+                owned = [segment.id for segment in missing if segment.id not in self._building]
+                for segment_id in owned:
+                    self._building[segment_id] = threading.Event()
+                generation = self._generation
+                previous = self._user_ids
+
+            if missing:
+                fresh = {}
+                try:
+                    fresh = self._build(session, missing, previous)
+                finally:
+                    with self._lock:
+                        self._store(fresh, generation)
+                        for segment_id in owned:
+                            self._building.pop(segment_id).set()
+                built.update(fresh)
+            for done in pending:
+                done.wait()
+
+    def compare(self, session: Session, first: Segment, second: Segment) -> Dict[str, int]:
+        """Overlap, union and exclusion counts between two segments"""
+        bitmaps = self.ensure(session, [first, second])
+        a = bitmaps[first.id].bits
+        b = bitmaps[second.id].bits
+        return {
+            "overlap": (a & b).bit_count(),
+            "union": (a | b).bit_count(),
+            "first_only": (a & ~b).bit_count(),
+            "second_only": (b & ~a).bit_count(),
+        }
+
+    def invalidate(self, segment_ids: Iterable[str] = (), fields: Iterable[str] = (), users_changed: bool = False):
+        """
+        Drop bitmaps made stale by a commit: segments whose memberships or
+        definitions changed, evaluated segments depending on changed user
+        fields, and every evaluated segment when users were added or removed
+        """
+        segment_ids = set(segment_ids)
+        fields = set(fields)
+        with self._lock:
+            self._generation += 1
+            for segment_id, bitmap in list(self._bitmaps.items()):
+                evaluated = bitmap.fields is not None
+                if segment_id in segment_ids or (evaluated and (users_changed or bitmap.fields & fields)):
+                    del self._bitmaps[segment_id]
+
+
+segment_index = SegmentMembershipIndex()
@@ -0,0 +1,460 @@
+"""
+Segment membership maintenance following Single Responsibility Principle
+Keeps a materialized SegmentMembership table current as writes happen:
+user writes recompute only that user's memberships, definition changes
+rebuild one segment in SQL, and a scheduled sweep re-checks time-relative
+segments only for users whose last order sits near a threshold boundary
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, event, func, insert, inspect, literal, or_, and_
+from sqlalchemy.sql.elements import ColumnElement
+from sqlmodel import Session, select
+
+from backend.models import (
+    Segment,
+    SegmentMembership,
+    SegmentMembershipEvent,
+    SegmentMembershipState,
+    User,
+)
+from backend.services.logging import logger
+from backend.services.segment_columnar import referenced_fields
+from backend.services.segment_compiler import (
+    NUMERIC_TYPES,
+    days_before,
+    days_since_bounds,
+    normalize_criteria,
+    query_segment_users,
+    count_segment_users,
+    segment_filter,
+)
+from backend.services.segment_engine import compile_definition
+from backend.services.segment_index import is_time_relative, segment_index
+
+SWEEP_INTERVAL_SECONDS = float(os.getenv("SEGMENT_SWEEP_INTERVAL_SECONDS", "900"))
+# Users refreshed per membership lookup when many users change in one flush
+USER_BATCH_SIZE = 500
+# session.info key of segment index invalidations waiting for the transaction to commit
+_STALE_KEY = "segment_index_stale"
+
+
+def definition_hash(definition: Optional[Dict[str, Any]]) -> str:
+    """Stable fingerprint of a definition, to detect memberships computed for an old one"""
+    payload = json.dumps(definition, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def get_state(session: Session, segment: Segment) -> Optional[SegmentMembershipState]:
+    """Membership state of a segment, or None when its memberships are missing or stale"""
+    state = session.get(SegmentMembershipState, segment.id)
+    if state is None or state.definition_hash != definition_hash(segment.definition):
+        return None
+    return state
+
+
+def _mark_stale(session: Session, segment_ids: Iterable[str] = (), fields: Iterable[str] = (), users_changed: bool = False):
+    """Queue segment index invalidations, applied once the session commits so no build reads the old rows after"""
+    stale = session.info.setdefault(_STALE_KEY, {"segment_ids": set(), "fields": set(), "users_changed": False})
+    stale["segment_ids"].update(segment_ids)
+    stale["fields"].update(fields)
+    stale["users_changed"] = stale["users_changed"] or users_changed
+
+
+def _record_events(session: Session, segment_id: str, event_type: str, user_ids, now: datetime) -> int:
+    """Insert one event per user id selected by user_ids (a subquery)"""
+    result = session.exec(
+        insert(SegmentMembershipEvent).from_select(
+            ["segment_id", "user_id", "event_type", "occurred_at"],
+            select(literal(segment_id), user_ids.c.user_id, literal(event_type), literal(now)),
+        )
+    )
+    return result.rowcount
+
+
+def _sync_segment(session: Session, segment: Segment, now: datetime, scope: Optional[ColumnElement] = None) -> Tuple[int, int]:
+    """
+    Bring a segment's memberships in line with its definition, considering
+    only users matched by scope (all users when None). Returns (entered, exited).
+    """
+    condition = segment_filter(segment, now)
+    if condition is None:
+        # Criteria SQL cannot express
+        return _sync_segment_in_python(session, segment, now, scope)
+    if scope is not None:
+        condition = and_(scope, condition)
+
+    members = select(SegmentMembership.user_id).where(SegmentMembership.segment_id == segment.id)
+    entering = select(User.id.label("user_id")).where(condition, User.id.not_in(members)).subquery()
+    exiting = (
+        select(SegmentMembership.user_id)
+        .where(
+            SegmentMembership.segment_id == segment.id,
+            SegmentMembership.user_id.not_in(select(User.id).where(condition)),
+        )
+    )
+    if scope is not None:
+        exiting = exiting.where(SegmentMembership.user_id.in_(select(User.id).where(scope)))
+    exiting = exiting.subquery()
+
+    entered = _record_events(session, segment.id, "enter", entering, now)
+    exited = _record_events(session, segment.id, "exit", exiting, now)
+    session.exec(
+        insert(SegmentMembership).from_select(
+            ["segment_id", "user_id", "entered_at"],
+            select(literal(segment.id), entering.c.user_id, literal(now)),
+        )
+    )
+    session.exec(
+        delete(SegmentMembership).where(
+            SegmentMembership.segment_id == segment.id,
+            SegmentMembership.user_id.in_(select(exiting.c.user_id)),
+        )
+    )
+    return entered, exited
+
+
+def _sync_segment_in_python(session: Session, segment: Segment, now: datetime, scope: Optional[ColumnElement] = None) -> Tuple[int, int]:
+    """_sync_segment for criteria evaluated in Python, USER_BATCH_SIZE users at a time in id order"""
+    compiled = compile_definition(segment.definition)
+    statement = select(User).order_by(User.id).limit(USER_BATCH_SIZE)
+    if scope is not None:
+        statement = statement.where(scope)
+
+    entered = exited = 0
+    after = None
+    while True:
+        users = session.exec(statement if after is None else statement.where(User.id > after)).all()
+        if not users:
+            break
+        after = users[-1].id
+        connection = session.connection()
+        current = set(connection.execute(
+            select(SegmentMembership.user_id).where(
+                SegmentMembership.segment_id == segment.id,
+                SegmentMembership.user_id.in_([user.id for user in users]),
+            )
+        ).scalars())
+        matching = {user.id for user in compiled.filter(users, now)}
+        entering = [{"segment_id": segment.id, "user_id": user_id} for user_id in matching - current]
+        exiting = list(current - matching)
+        if entering:
+            connection.execute(insert(SegmentMembership), [dict(row, entered_at=now) for row in entering])
+            connection.execute(insert(SegmentMembershipEvent), [dict(row, event_type="enter", occurred_at=now) for row in entering])
+        if exiting:
+            connection.execute(
+                delete(SegmentMembership).where(
+                    SegmentMembership.segment_id == segment.id,
+                    SegmentMembership.user_id.in_(exiting),
+                )
+            )
+            connection.execute(insert(SegmentMembershipEvent), [
+                {"segment_id": segment.id, "user_id": user_id, "event_type": "exit", "occurred_at": now}
+                for user_id in exiting
+            ])
+        entered += len(entering)
+        exited += len(exiting)
+    return entered, exited
+
+
+def rebuild_segment(session: Session, segment: Segment, now: Optional[datetime] = None) -> Tuple[int, int]:
+    """Recompute every membership of a segment (created or definition changed)"""
+    now = now or datetime.utcnow()
+    entered, exited = _sync_segment(session, segment, now)
+    # Also when nothing moved: the segment's bitmap switches to reading its memberships
+    _mark_stale(session, [segment.id])
+
+    state = session.get(SegmentMembershipState, segment.id)
+    if state is None:
+        state = SegmentMembershipState(segment_id=segment.id, definition_hash="", refreshed_at=now, swept_at=now)
+    state.definition_hash = definition_hash(segment.definition)
+    state.refreshed_at = now
+    state.swept_at = now
+    session.add(state)
+
+    logger.info(f"Segment {segment.id} memberships rebuilt: {entered} entered, {exited} exited")
+    return entered, exited
+
+
+def remove_segment(session: Session, segment_id: str):
+    """Drop a segment's memberships and state (segment is being deleted)"""
+    session.exec(delete(SegmentMembership).where(SegmentMembership.segment_id == segment_id))
+    session.exec(delete(SegmentMembershipState).where(SegmentMembershipState.segment_id == segment_id))
+    _mark_stale(session, [segment_id])
+
+
+def boundary_windows(definition: Optional[Dict[str, Any]], since: datetime, now: datetime) -> Optional[List[Tuple[datetime, datetime]]]:
+    """
+    last_order_date ranges in which a user may have crossed a time-relative
+    threshold between since and now. Returns None when the criteria cannot
+    be bounded this way and the segment needs a full rebuild.
+    """
+    windows = []
+    for criterion in normalize_criteria(definition):
+        field = criterion.get("field")
+        op = criterion.get("operator")
+        value = criterion.get("value")
+
+        if field == "days_since_last_order":
+            if op not in ("gt", "lt", "gte", "lte", "eq"):
+                if op == "contains":
+                    return None
+                continue
+            if not isinstance(value, NUMERIC_TYPES):
+                continue
+            try:
+                before = days_since_bounds(op, value, since)
+                after = days_since_bounds(op, value, now)
+            except (OverflowError, ValueError):
+                continue
+            if before is None or after is None:
+                continue
+            # Each bound slides forward with time; users between its old and new position may have crossed it
+            for old, new in zip(before, after):
+                if old is not None:
+                    windows.append((old, new))
+
+        elif field == "last_order_date" and isinstance(value, str) and value.startswith("relative_"):
+            try:
+                days_ago = int(value.split("_")[1])
+            except (IndexError, ValueError):
+                continue
+            windows.append((days_before(since, days_ago), days_before(now, days_ago)))
+
+    return windows
+
+
+def sweep_segment(session: Session, segment: Segment, state: SegmentMembershipState, now: Optional[datetime] = None) -> Tuple[int, int]:
+    """Re-check a time-relative segment for users whose last order crossed a threshold since the last sweep"""
+    now = now or datetime.utcnow()
+    windows = boundary_windows(segment.definition, state.swept_at, now)
+    if windows is None:
+        return rebuild_segment(session, segment, now)
+
+    entered = exited = 0
+    if windows:
+        scope = or_(*[User.last_order_date.between(start, end) for start, end in windows])
+        entered, exited = _sync_segment(session, segment, now, scope)
+        if entered or exited:
+            _mark_stale(session, [segment.id])
+    state.swept_at = now
+    session.add(state)
+    return entered, exited
+
+
+def sweep_memberships(session: Session, now: Optional[datetime] = None):
+    """Rebuild missing or stale segments and sweep time-relative ones"""
+    now = now or datetime.utcnow()
+    for segment in session.exec(select(Segment)).all():
+        state = get_state(session, segment)
+        if state is None:
+            rebuild_segment(session, segment, now)
+        elif is_time_relative(segment.definition):
+            entered, exited = sweep_segment(session, segment, state, now)
+            if entered or exited:
+                logger.info(f"Segment {segment.id} sweep: {entered} entered, {exited} exited")
+        session.commit()
+
+
+def run_sweep():
+    """Scheduled entry point: sweep with a dedicated session"""
+    from backend.database import engine
+    with Session(engine) as session:
+        sweep_memberships(session)
+
+
+def _materialized_segments(session: Session) -> List[Tuple[Segment, Any, Set[str]]]:
+    """Segments with current memberships, compiled for per-user evaluation"""
+    connection = session.connection()
+    states = dict(connection.execute(
+        select(SegmentMembershipState.segment_id, SegmentMembershipState.definition_hash)
+    ).all())
+    if not states:
+        return []
+
+    compiled = []
+    for segment in session.exec(select(Segment).where(Segment.id.in_(list(states)))).all():
+        if states[segment.id] == definition_hash(segment.definition):
+            compiled.append((segment, compile_definition(segment.definition), referenced_fields(segment.definition)))
+    return compiled
+
+
+def _changed_fields(obj: Any) -> Set[str]:
+    state = inspect(obj)
+    return {attr.key for attr in state.attrs if attr.history.has_changes()}
+
+
+def refresh_users(session: Session, changes: Dict[str, Tuple[User, Optional[Set[str]]]], now: Optional[datetime] = None):
+    """
+    Recompute memberships for changed users only. changes maps user id to
+    (user, changed fields); None fields means every segment is re-checked.
+    """
+    segments = _materialized_segments(session)
+    if not segments:
+        return
+
+    now = now or datetime.utcnow()
+    connection = session.connection()
+    user_ids = list(changes)
+    for offset in range(0, len(user_ids), USER_BATCH_SIZE):
+        batch = user_ids[offset:offset + USER_BATCH_SIZE]
+        current: Dict[str, Set[str]] = {user_id: set() for user_id in batch}
+        for segment_id, user_id in connection.execute(
+            select(SegmentMembership.segment_id, SegmentMembership.user_id)
+            .where(SegmentMembership.user_id.in_(batch))
+        ).all():
+            current[user_id].add(segment_id)
+
+        entering = []
+        exiting = []
+        for user_id in batch:
+            user, fields = changes[user_id]
+            for segment, compiled, segment_fields in segments:
+                if fields is not None and not (fields & segment_fields):
+                    continue
+                is_member = compiled.matches(user, now)
+                was_member = segment.id in current[user_id]
+                if is_member and not was_member:
+                    entering.append({"segment_id": segment.id, "user_id": user_id})
+                elif was_member and not is_member:
+                    exiting.append({"segment_id": segment.id, "user_id": user_id})
+
+        if entering:
+            connection.execute(insert(SegmentMembership), [dict(row, entered_at=now) for row in entering])
+            connection.execute(insert(SegmentMembershipEvent), [dict(row, event_type="enter", occurred_at=now) for row in entering])
+        if exiting:
+            _remove_memberships(connection, exiting, now)
+        _mark_stale(session, [row["segment_id"] for row in entering + exiting])
+
+
+def _remove_memberships(connection, rows: List[Dict[str, str]], now: datetime):
+    for row in rows:
+        connection.execute(
+            delete(SegmentMembership).where(
+                SegmentMembership.segment_id == row["segment_id"],
+                SegmentMembership.user_id == row["user_id"],
+            )
+        )
+    connection.execute(insert(SegmentMembershipEvent), [dict(row, event_type="exit", occurred_at=now) for row in rows])
+
+
+def remove_users(session: Session, user_ids: Iterable[str], now: Optional[datetime] = None):
+    """Drop memberships of users being deleted, recording exit events"""
+    now = now or datetime.utcnow()
+    connection = session.connection()
+    user_ids = list(user_ids)
+    rows = [
+        {"segment_id": segment_id, "user_id": user_id}
+        for segment_id, user_id in connection.execute(
+            select(SegmentMembership.segment_id, SegmentMembership.user_id)
+            .where(SegmentMembership.user_id.in_(user_ids))
+        ).all()
+    ]
+    if rows:
+        _remove_memberships(connection, rows, now)
+        _mark_stale(session, [row["segment_id"] for row in rows])
+
+
+@event.listens_for(Session, "before_flush")
+def _remove_deleted_users(session, flush_context, instances):
+    # Runs before the DELETE so membership rows never reference a missing user
+    deleted = [obj.id for obj in session.deleted if isinstance(obj, User)]
+    if deleted:
+        remove_users(session, deleted)
+        _mark_stale(session, users_changed=True)
+
+
+@event.listens_for(Session, "after_flush")
+def _refresh_changed_users(session, flush_context):
+    # new/dirty and attribute history still describe this flush here
+    changes: Dict[str, Tuple[User, Optional[Set[str]]]] = {}
+    for obj in session.new:
+        if isinstance(obj, User):
+            changes[obj.id] = (obj, None)
+            _mark_stale(session, users_changed=True)
+    for obj in session.dirty:
+        if isinstance(obj, User) and obj not in session.deleted:
+            fields = _changed_fields(obj)
+            if fields:
+                changes[obj.id] = (obj, fields)
+                _mark_stale(session, fields=fields)
+        elif isinstance(obj, Segment) and "definition" in _changed_fields(obj):
+            _mark_stale(session, [obj.id])
+    if changes:
+        refresh_users(session, changes)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_segment_index(session):
+    stale = session.info.pop(_STALE_KEY, None)
+    if stale:
+        segment_index.invalidate(**stale)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_stale(session):
+    session.info.pop(_STALE_KEY, None)
+
+
+def count_audience(session: Session, segment: Segment) -> int:
+    """Number of users in a saved segment, read from memberships when they are current"""
+    if get_state(session, segment) is None:
+        return count_segment_users(session, segment)
+    return session.exec(
+        select(func.count()).select_from(SegmentMembership).where(SegmentMembership.segment_id == segment.id)
+    ).one()
+
+
+def count_audiences(session: Session, segments: List[Segment]) -> Dict[str, int]:
+    """count_audience for many segments, with one GROUP BY over the memberships that are current"""
+    current = [segment.id for segment in segments if get_state(session, segment) is not None]
+    counts: Dict[str, int] = {}
+    if current:
+        counts = dict(session.exec(
+            select(SegmentMembership.segment_id, func.count())
+            .where(SegmentMembership.segment_id.in_(current))
+            .group_by(SegmentMembership.segment_id)
+        ).all())
+    return {
+        segment.id: counts.get(segment.id, 0) if segment.id in current else count_segment_users(session, segment)
+        for segment in segments
+    }
+
+
+def is_audience_member(session: Session, segment: Segment, user: User) -> bool:
+    """Whether a user is in a saved segment, read from memberships when they are current"""
+    if get_state(session, segment) is None:
+        return compile_definition(segment.definition).matches(user, datetime.utcnow())
+    return session.get(SegmentMembership, (segment.id, user.id)) is not None
+
+
+def query_audience(session: Session, segment: Segment, limit: Optional[int] = None, after: Optional[str] = None) -> List[User]:
+    """Users in a saved segment in id order, read from memberships when they are current"""
+    if get_state(session, segment) is None:
+        return query_segment_users(session, segment, limit=limit, after=after)
+    statement = (
+        select(User)
+        .join(SegmentMembership, SegmentMembership.user_id == User.id)
+        .where(SegmentMembership.segment_id == segment.id)
+        .order_by(SegmentMembership.user_id)
+    )
+    if after is not None:
+        statement = statement.where(SegmentMembership.user_id > after)
+    if limit is not None:
+        statement = statement.limit(limit)
+    return list(session.exec(statement).all())
+
+
+def list_events(session: Session, segment_id: str, after_id: int = 0, limit: int = 100) -> List[SegmentMembershipEvent]:
+    """Entry/exit events of a segment in order, after a cursor"""
+    statement = (
+        select(SegmentMembershipEvent)
+        .where(SegmentMembershipEvent.segment_id == segment_id, SegmentMembershipEvent.id > after_id)
+        .order_by(SegmentMembershipEvent.id)
+        .limit(limit)
+    )
+    return list(session.exec(statement).all())
@@ -0,0 +1,101 @@
+"""
+Top products following Single Responsibility Principle
+Ranks products by units sold with a single aggregate query and keeps a
+small top-K list per time window, refreshed on a schedule
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from backend.models import Order, OrderItem, Product, ProductSalesMetrics
+from backend.services.metrics_refresh import get_refresh_state
+
+# Entries kept per window; larger limits bypass the cache
+TOP_K = int(os.getenv("TOP_PRODUCTS_CACHE_SIZE", "100"))
+REFRESH_INTERVAL_SECONDS = float(os.getenv("TOP_PRODUCTS_REFRESH_SECONDS", "300"))
+# Windows (in days) refreshed by the scheduler; the all-time list is always included
+SCHEDULED_WINDOWS = [int(days) for days in os.getenv("TOP_PRODUCTS_WINDOWS", "7,30,90").split(",") if days.strip()]
+
+
+def query_top_products(session: Session, limit: int, days: Optional[int] = None) -> List[Dict]:
+    """Top products by units sold, optionally over the last N days of orders"""
+    if days is None and get_refresh_state(session) is not None:
+        # All-time totals are already rolled up per product
+        units_sold = func.coalesce(ProductSalesMetrics.total_units_sold, 0)
+        revenue = func.coalesce(ProductSalesMetrics.total_revenue, 0)
+        statement = (
+            select(Product.id, Product.name, units_sold, revenue)
+            .outerjoin(ProductSalesMetrics, ProductSalesMetrics.product_id == Product.id)
+        )
+    else:
+        sales = (
+            select(
+                OrderItem.product_id,
+                func.sum(OrderItem.quantity).label("units_sold"),
+                func.sum(OrderItem.quantity * OrderItem.unit_price).label("revenue"),
+            )
+            .group_by(OrderItem.product_id)
+        )
+        if days is not None:
+            since = datetime.utcnow() - timedelta(days=days)
+            sales = sales.join(Order, Order.id == OrderItem.order_id).where(Order.order_date >= since)
+        sales = sales.subquery()
+        units_sold = func.coalesce(sales.c.units_sold, 0)
+        revenue = func.coalesce(sales.c.revenue, 0)
+        statement = (
+            select(Product.id, Product.name, units_sold, revenue)
+            .outerjoin(sales, sales.c.product_id == Product.id)
+        )
+
+    rows = session.exec(statement.order_by(units_sold.desc(), Product.id).limit(limit)).all()
+    return [
+        {"product_id": product_id, "product_name": name, "units_sold": units, "revenue": total}
+        for product_id, name, units, total in rows
+    ]
+
+
+class TopProductsCache:
+    """Top-K product lists for the all-time and scheduled windows, expiring after the refresh interval"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # days -> (expires_at, rows)
+        self._entries: Dict[Optional[int], tuple] = {}
+
+    def get(self, session: Session, limit: int, days: Optional[int] = None) -> List[Dict]:
+        # Only the scheduled windows are kept, so arbitrary days cannot grow the cache
+        if limit > TOP_K or (days is not None and days not in SCHEDULED_WINDOWS):
+            return query_top_products(session, limit, days)
+        with self._lock:
+            entry = self._entries.get(days)
+        if entry is None or entry[0] <= time.monotonic():
+            entry = self.refresh(session, days)
+        return entry[1][:limit]
+
+    def refresh(self, session: Session, days: Optional[int] = None) -> tuple:
+        # Outlive one scheduler interval so scheduled windows never expire between refreshes
+        entry = (time.monotonic() + REFRESH_INTERVAL_SECONDS * 2, query_top_products(session, TOP_K, days))
+        with self._lock:
+            self._entries[days] = entry
+        return entry
+
+    def invalidate(self):
+        """Drop every list; the metrics refresh calls this once new or changed orders are folded in"""
+        with self._lock:
+            self._entries.clear()
+
+
+top_products_cache = TopProductsCache()
+
+
+def run_refresh():
+    """Scheduled entry point: recompute the all-time and configured window lists"""
+    from backend.database import engine
+    with Session(engine) as session:
+        for days in [None] + SCHEDULED_WINDOWS:
+            top_products_cache.refresh(session, days)
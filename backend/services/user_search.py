@@ -0,0 +1,219 @@
+"""
+User search following Single Responsibility Principle
+Full-text indexes over customer name, email and phone, kept in sync with the
+user table by triggers: prefix indexes for type-ahead and a trigram index
+for matches inside a word. Each ranking tier reads only as many index rows
+as the requested page needs, instead of leading-wildcard LIKEs
+"""
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, column, literal, literal_column, null, or_, table, union_all
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql import Select
+from sqlmodel import Session, func, select
+
+from backend.models import User
+from backend.services.logging import logger
+
+SEARCH_TABLE = "user_search"
+PREFIX_TABLE = "user_search_prefix"
+NAME_TABLE = "user_search_name"
+SEARCH_COLUMNS = ("first_name", "last_name", "email", "phone")
+# The trigram tokenizer cannot match anything shorter
+MIN_TERM_LENGTH = 3
+# Type-ahead budget for one page of results, checked by check_latency()
+SEARCH_LATENCY_BUDGET_MS = float(os.getenv("USER_SEARCH_LATENCY_BUDGET_MS", "20"))
+# The first keystrokes of type-ahead, which match the most users
+LATENCY_TERMS = ("a", "j", "m", "s", "5", "ja", "ma", "jo", "55", "jam", "mar", "smi", "555")
+
+# External content tables: the text lives only in user, the indexes are keyed by user.rowid.
+# VACUUM can renumber user rowids; run rebuild() after one.
+# name -> (indexed columns, tokenizer options)
+_TABLES = {
+    # Any substring of 3 or more characters
+    SEARCH_TABLE: (SEARCH_COLUMNS, "tokenize='trigram'"),
+    # Words split on punctuation; prefixes of up to MIN_TERM_LENGTH characters have their own index
+    PREFIX_TABLE: (SEARCH_COLUMNS, "tokenize='unicode61', prefix='1 2 3'"),
+    # The same for names alone, which have few distinct words, so any prefix of them is cheap
+    NAME_TABLE: (("first_name", "last_name"), "tokenize='unicode61', prefix='1 2 3'"),
+}
+# Errors meaning this SQLite cannot build the indexes at all (no FTS5, or older than 3.34)
+_UNSUPPORTED = ("no such tokenizer", "no such module")
+
+
+def _ddl(name: str) -> List[str]:
+    indexed, options = _TABLES[name]
+    columns = ", ".join(indexed)
+    new = ", ".join("new." + column_name for column_name in indexed)
+    old = ", ".join("old." + column_name for column_name in indexed)
+    return [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5(
+            {columns}, content='user', content_rowid='rowid', {options}
+        )""",
+        f"""CREATE TRIGGER IF NOT EXISTS {name}_insert AFTER INSERT ON "user" BEGIN
+            INSERT INTO {name}(rowid, {columns}) VALUES (new.rowid, {new});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {name}_delete AFTER DELETE ON "user" BEGIN
+            INSERT INTO {name}({name}, rowid, {columns}) VALUES ('delete', old.rowid, {old});
+        END""",
+        # Only the searched columns: the metrics jobs update order totals on every user
+        f"""CREATE TRIGGER IF NOT EXISTS {name}_update AFTER UPDATE OF {columns} ON "user" BEGIN
+            INSERT INTO {name}({name}, rowid, {columns}) VALUES ('delete', old.rowid, {old});
+            INSERT INTO {name}(rowid, {columns}) VALUES (new.rowid, {new});
+        END""",
+    ]
+
+
+def _fts(name: str):
+    return table(name, column("rowid"), column(name), *(column(column_name) for column_name in _TABLES[name][0]))
+
+
+_search = _fts(SEARCH_TABLE)
+_prefix = _fts(PREFIX_TABLE)
+_names = _fts(NAME_TABLE)
+# Past the highest code point, so email >= word AND email < word + _MAX_CHAR is "starts with word"
+_MAX_CHAR = "\U0010ffff"
+
+
+def _contains(term: str):
+    return or_(
+        User.first_name.contains(term), User.last_name.contains(term),
+        User.email.contains(term), User.phone.contains(term),
+    )
+
+
+def _indexed_contains(word: str):
+    return or_(*(_search.c[name].contains(word) for name in SEARCH_COLUMNS))
+
+
+def _phrase(term: str) -> str:
+    # Quoted, every character is literal to the FTS query parser
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _prefix_query(words: List[str]) -> str:
+    """Every word is the start of a word in the indexed columns"""
+    return " AND ".join(f"({_phrase(word)}*)" for word in words)
+
+
+def _fts_tier(fts, condition, window: Optional[int]) -> Select:
+    return select(fts.c.rowid, null().label("email")).where(condition).order_by(fts.c.rowid).limit(window)
+
+
+class UserSearchIndex:
+    """The FTS5 indexes on SQLite; other databases keep the LIKE search"""
+
+    def __init__(self):
+        self.available = False
+
+    def create(self, engine: Engine):
+        """Create the indexes and their triggers if they are missing, filling only the ones created here"""
+        if engine.dialect.name != "sqlite":
+            return
+        try:
+            with engine.connect() as connection:
+                # Takes the write lock first, so of several workers starting together exactly one creates each index
+                connection.exec_driver_sql("BEGIN IMMEDIATE")
+                for name in _TABLES:
+                    exists = connection.exec_driver_sql(
+                        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+                    ).first()
+                    for ddl in _ddl(name):
+                        connection.exec_driver_sql(ddl)
+                    if exists is None:
+                        connection.exec_driver_sql(f"INSERT INTO {name}({name}) VALUES ('rebuild')")
+                        logger.info(f"Built user search index {name}")
+                connection.commit()
+        except OperationalError as e:
+            if not any(reason in str(e.orig) for reason in _UNSUPPORTED):
+                raise
+            logger.warning(f"User search index unavailable, searching with LIKE: {e}")
+            return
+        self.available = True
+
+    def rebuild(self, engine: Engine):
+        """Re-read every user into the indexes"""
+        with engine.begin() as connection:
+            for name in _TABLES:
+                connection.exec_driver_sql(f"INSERT INTO {name}({name}) VALUES ('rebuild')")
+
+    def check_latency(self, session: Session, terms=LATENCY_TERMS, limit: int = 20) -> Dict[str, Any]:
+        """Time the first page of a search for each term, best of three runs; slow lists those over budget"""
+        searches = []
+        for term in terms:
+            statement = self.search(select(User), term, 0, limit)
+            best = None
+            for _ in range(3):
+                started = time.perf_counter()
+                results = len(session.exec(statement).all())
+                elapsed = (time.perf_counter() - started) * 1000
+                best = elapsed if best is None else min(best, elapsed)
+            searches.append({"term": term, "ms": round(best, 2), "results": results})
+        return {
+            "indexed": self.available,
+            "budget_ms": SEARCH_LATENCY_BUDGET_MS,
+            "slow": [search["term"] for search in searches if search["ms"] > SEARCH_LATENCY_BUDGET_MS],
+            "searches": searches,
+        }
+
+    def search(self, statement: Select, term: str, skip: int = 0, limit: Optional[int] = None) -> Select:
+        """A page of a select(User) restricted to users matching every word of term, best matches first"""
+        # Short runs of punctuation are in none of the indexes
+        words = [word for word in term.split() if re.search(r"\w", word) or len(word) >= MIN_TERM_LENGTH]
+        if not self.available or not words:
+            return statement.where(_contains(term)).offset(skip).limit(limit)
+        prefixes = [word for word in words if re.search(r"\w", word)]
+        long_words = [word for word in words if len(word) >= MIN_TERM_LENGTH]
+
+        # Tiers best first: every word starts a name; the email starts with the word; every word starts
+        # any word; every word is contained. Each tier reads at most skip + limit rows in a fixed order
+        # (rowid, or email on its index), so broad and short terms stay cheap. A user's place is its best
+        # tier, then that order, so consecutive pages stay consistent.
+        # A prefix longer than the prefix index materializes every match, so on the index of every
+        # word only words of up to MIN_TERM_LENGTH characters are prefix-matched; longer ones use trigrams.
+        window = None if limit is None else skip + limit
+        tiers = []
+        if all(re.fullmatch(r"\w+", word) for word in words):
+            # Punctuated words such as email fragments split into phrases that no single name holds
+            tiers.append(_fts_tier(_names, _names.c[NAME_TABLE].op("MATCH")(_prefix_query(words)), window))
+        if len(words) == 1:
+            email = words[0].lower()
+            tiers.append(
+                select(literal_column('"user".rowid').label("rowid"), User.email)
+                .where(User.email >= email, User.email < email + _MAX_CHAR)
+                .order_by(User.email)
+                .limit(window)
+            )
+        if len(prefixes) == len(words) and all(len(word) <= MIN_TERM_LENGTH for word in words):
+            tiers.append(_fts_tier(_prefix, _prefix.c[PREFIX_TABLE].op("MATCH")(_prefix_query(words)), window))
+        if long_words:
+            condition = _search.c[SEARCH_TABLE].op("MATCH")(" ".join(_phrase(word) for word in long_words))
+            short = [word for word in words if len(word) < MIN_TERM_LENGTH]
+            if short:
+                # Checked only on the rows the trigram index already matched
+                condition = and_(condition, *[_indexed_contains(word) for word in short])
+            tiers.append(_fts_tier(_search, condition, window))
+
+        candidates = union_all(*[
+            select(matches.c.rowid, literal(tier).label("tier"), matches.c.email).select_from(matches)
+            for tier, matches in enumerate(statement.subquery() for statement in tiers)
+        ]).subquery()
+        tier = func.min(candidates.c.tier).label("tier")
+        # SQLite takes the bare email column from the row holding the minimum tier
+        page = (
+            select(candidates.c.rowid, tier, candidates.c.email)
+            .group_by(candidates.c.rowid)
+            .order_by(tier, candidates.c.email, candidates.c.rowid)
+            .offset(skip)
+            .limit(limit)
+            .subquery()
+        )
+        statement = statement.join(page, page.c.rowid == literal_column('"user".rowid'))
+        return statement.order_by(page.c.tier, page.c.email, page.c.rowid)
+
+
+user_search_index = UserSearchIndex()
@@ -113,17 +113,19 @@ export default function Segments() {
       const response = await api.get('/segments/');
       const segmentsData = response.data;
       
-      // Fetch count for each segment
-      const segmentsWithCount = await Promise.all(
-        segmentsData.map(async (segment: Segment) => {
-          try {
-            const countResponse = await api.get(`/segments/${segment.id}/count`);
-            return { ...segment, user_count: countResponse.data.count };
-          } catch (error) {
-            return { ...segment, user_count: 0 };
-          }
-        })
-      );
+      // Fetch counts for all segments in one request
+      let counts: Record<string, number> = {};
+      try {
+        const countsResponse = await api.get('/segments/counts');
+        counts = countsResponse.data.counts;
+      } catch (error) {
+        console.error('Error fetching segment counts:', error);
+      }
+      
+      const segmentsWithCount = segmentsData.map((segment: Segment) => ({
+        ...segment,
+        user_count: counts[segment.id] ?? 0,
+      }));
       
       setSegments(segmentsWithCount);
     } catch (error) {